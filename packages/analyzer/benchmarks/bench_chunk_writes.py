@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Benchmark rag.chunks write throughput: per-row INSERT vs binary COPY.
+
+All writes run inside a transaction that is rolled back, so the benchmark
+can be pointed at a real database without leaving rows behind.
+
+Usage:
+    DIRECT_DATABASE_URL=... python benchmarks/bench_chunk_writes.py [--rows 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+import numpy as np
+import psycopg2
+
+from embedding.db import chunk_rows, insert_chunk_rows
+from embedding.types import ChunkWithEmbedding
+
+LEGACY_INSERT_SQL = """
+    INSERT INTO rag.chunks
+        (document_id, chunk_index, parent_heading, heading, content, embedding)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def make_chunks(n: int, dim: int = 512) -> list[ChunkWithEmbedding]:
+    """ダミーチャンクを生成"""
+    rng = np.random.default_rng(42)
+    return [
+        ChunkWithEmbedding(
+            chunk_index=i,
+            parent_heading="Benchmark",
+            heading=f"Section {i}",
+            content="ベンチマーク用のダミー本文です。" * 20,
+            embedding=rng.uniform(-1, 1, dim).astype(np.float32),
+        )
+        for i in range(n)
+    ]
+
+
+def legacy_insert(
+    cur: psycopg2.extensions.cursor,
+    document_id: str,
+    chunks: list[ChunkWithEmbedding],
+) -> None:
+    """旧実装: 1チャンク1INSERT（embeddingはfloatのリストをテキストで送る）"""
+    for row in chunk_rows(document_id, chunks):
+        cur.execute(LEGACY_INSERT_SQL, (*row[:5], row[5].tolist()))
+
+
+def bulk_insert(
+    cur: psycopg2.extensions.cursor,
+    document_id: str,
+    chunks: list[ChunkWithEmbedding],
+) -> None:
+    """新実装: float32のままバイナリCOPYで1回"""
+    insert_chunk_rows(cur, chunk_rows(document_id, chunks))
+
+
+def time_connect(database_url: str, n: int = 5) -> float:
+    """接続確立にかかる平均秒数"""
+    start = time.perf_counter()
+    for _ in range(n):
+        psycopg2.connect(database_url).close()
+    return (time.perf_counter() - start) / n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="rag.chunks write benchmark")
+    parser.add_argument("--rows", type=int, default=2000, help="Number of chunks to write")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per strategy")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DIRECT_DATABASE_URL")
+    if not database_url:
+        raise ValueError("DIRECT_DATABASE_URL is required")
+
+    chunks = make_chunks(args.rows)
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM raw.github_contents__documents LIMIT 1")
+            row = cur.fetchone()
+            if not row:
+                raise ValueError("raw.github_contents__documents is empty")
+            document_id = str(row[0])
+        conn.rollback()
+
+        print(f"Rows: {args.rows}, repeat: {args.repeat}")
+        for name, write in [("per-row INSERT", legacy_insert), ("binary COPY", bulk_insert)]:
+            best = float("inf")
+            for _ in range(args.repeat):
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM rag.chunks WHERE document_id = %s", (document_id,))
+                    start = time.perf_counter()
+                    write(cur, document_id, chunks)
+                    best = min(best, time.perf_counter() - start)
+                conn.rollback()
+            print(f"  {name:<16} {best:8.3f}s  {args.rows / best:10.0f} rows/s")
+    finally:
+        conn.close()
+
+    # 旧実装はドキュメントごとに delete / insert / state の3接続を張っていた
+    connect_s = time_connect(database_url)
+    print(f"  connect            {connect_s * 1000:8.1f}ms per connection "
+          f"(legacy: 3 per document, bulk: 1 per save)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Benchmark chunk_document throughput on large synthetic notes.
+
+Usage:
+    python benchmarks/bench_chunker.py [--docs 200] [--sections 40] [--max-tokens 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from embedding.chunker import chunk_document, get_encoder
+from embedding.types import RawDocument
+
+PARAGRAPH_JA = "時間管理のデータを日次で集計し、目標と実績の差分を可視化する。"
+PARAGRAPH_EN = "The dbt model fct_time_records_actual_split splits records at midnight."
+
+
+def make_document(idx: int, sections: int, rng: random.Random) -> RawDocument:
+    """h2/h3/段落が混在する長いノートを生成"""
+    lines = [f"# Note {idx}"]
+    for s in range(sections):
+        lines.append(f"## Section {s}")
+        for h in range(rng.randint(0, 3)):
+            lines.append(f"### Sub {h}")
+            for _ in range(rng.randint(2, 8)):
+                lines.append((PARAGRAPH_JA + PARAGRAPH_EN) * rng.randint(1, 20))
+                lines.append("")
+    return RawDocument(
+        id=str(idx),
+        file_path=f"20260101_note-{idx}.md",
+        frontmatter={"title": f"Note {idx}", "tags": ["bench"]},
+        content="\n".join(lines),
+        content_hash=str(idx),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="chunk_document benchmark")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=40)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    docs = [make_document(i, args.sections, rng) for i in range(args.docs)]
+    total_chars = sum(len(d.content) for d in docs)
+
+    start = time.perf_counter()
+    get_encoder()
+    print(f"Tokenizer load: {time.perf_counter() - start:.3f}s (lazy, first use only)")
+
+    start = time.perf_counter()
+    chunks = 0
+    oversized = 0
+    for doc in docs:
+        for chunk in chunk_document(doc, args.max_tokens):
+            chunks += 1
+            oversized += chunk.token_count > args.max_tokens
+    elapsed = time.perf_counter() - start
+
+    print(f"Documents: {len(docs)} ({total_chars / 1e6:.1f}M chars)")
+    print(f"Chunks:    {chunks} ({oversized} over {args.max_tokens} tokens)")
+    print(f"Elapsed:   {elapsed:.3f}s")
+    print(f"Throughput: {chunks / elapsed:,.0f} chunks/s, {len(docs) / elapsed:,.1f} docs/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Benchmark embedding representation: list[list[float]] vs float32 matrix.
+
+Measures resident size of the embeddings for one run and the cost of
+encoding them for the database (text literals vs binary COPY).
+Runs offline; no database or API key needed.
+
+Usage:
+    python benchmarks/bench_embedding_memory.py [--rows 10000] [--dim 512]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+import uuid
+from typing import Callable, TypeVar
+
+import numpy as np
+
+from embedding.db import _CHUNK_COLUMN_KINDS
+from embedding.pgcopy import encode_copy_binary
+
+T = TypeVar("T")
+
+
+def measure(build: Callable[[], T]) -> tuple[T, int]:
+    """build()で確保されるメモリのピークをバイトで返す"""
+    tracemalloc.start()
+    value = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, peak
+
+
+def text_literal(embedding: list[float]) -> str:
+    """旧実装相当: pgvectorのテキスト表現 '[x,y,...]'"""
+    return "[" + ",".join(repr(x) for x in embedding) + "]"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="embedding memory / encoding benchmark")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    source = rng.uniform(-1, 1, (args.rows, args.dim)).astype(np.float32)
+    raw = source.tobytes()
+
+    as_lists, list_peak = measure(
+        lambda: np.frombuffer(raw, dtype=np.float32).reshape(args.rows, args.dim).tolist()
+    )
+    as_matrix, matrix_peak = measure(
+        lambda: np.frombuffer(raw, dtype=np.float32).reshape(args.rows, args.dim).copy()
+    )
+
+    print(f"Embeddings: {args.rows} x {args.dim}")
+    print(f"  list[list[float]]  {list_peak / 2**20:8.1f} MiB")
+    print(f"  float32 matrix     {matrix_peak / 2**20:8.1f} MiB "
+          f"({list_peak / matrix_peak:.1f}x smaller)")
+
+    document_id = str(uuid.uuid4())
+    rows = [
+        (document_id, i, "Benchmark", f"Section {i}", "本文", as_matrix[i], None, None)
+        for i in range(args.rows)
+    ]
+
+    start = time.perf_counter()
+    text_bytes = sum(len(text_literal(e).encode()) for e in as_lists)
+    text_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    copy_bytes = len(encode_copy_binary(rows, _CHUNK_COLUMN_KINDS))
+    copy_s = time.perf_counter() - start
+
+    print("Encoding for rag.chunks")
+    print(f"  text literals      {text_s:8.3f}s  {text_bytes / 2**20:8.1f} MiB (embeddings only)")
+    print(f"  binary COPY        {copy_s:8.3f}s  {copy_bytes / 2**20:8.1f} MiB (whole rows)")
+
+
+if __name__ == "__main__":
+    main()
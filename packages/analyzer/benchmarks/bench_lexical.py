@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark the BM25 lexical index at 100k chunks.
+
+Reports build throughput, postings size (varint vs fixed int32 pairs),
+query latency percentiles, incremental replacement and save/load cost.
+Runs offline on synthetic Japanese/identifier-heavy chunks.
+
+Usage:
+    python benchmarks/bench_lexical.py [--chunks 100000] [--queries 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embedding.hybrid import reciprocal_rank_fusion
+from embedding.lexical import LexicalIndex
+from embedding.types import Chunk
+
+WORDS_JA = [
+    "時間管理", "睡眠", "振り返り", "目標", "実績", "集計", "可視化", "習慣", "読書", "運動",
+    "仕事", "勉強", "家事", "移動", "休憩", "計画", "予定", "記録", "分析", "改善",
+    "カテゴリ", "プロジェクト", "タスク", "ノート", "データ", "モデル", "テーブル", "ダッシュボード",
+]
+PARTICLES = ["の", "を", "に", "は", "で", "と", "から", "まで", "する", "した"]
+IDENTIFIERS = [
+    "fct_time_records_actual_split", "dim_category_time_personal", "stg_toggl_track__time_entries",
+    "rag.chunks", "voyage-3-lite", "search_chunks", "embedding_state", "gcalendar_events",
+    "mst_coarse_personal", "ticktick_tasks", "coda_mst_map", "tanita_health_planet",
+]
+
+
+def make_chunk(rng: random.Random, idx: int) -> Chunk:
+    """日本語文に識別子が混ざったチャンク"""
+    sentences = []
+    for _ in range(rng.randint(3, 12)):
+        words = [rng.choice(WORDS_JA) + rng.choice(PARTICLES) for _ in range(rng.randint(3, 8))]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), f" {rng.choice(IDENTIFIERS)} ")
+        sentences.append("".join(words) + "。")
+    return Chunk(idx % 8, "", f"{rng.choice(WORDS_JA)} {idx}", "".join(sentences))
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lexical index benchmark")
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    chunks = [(str(i // 8), make_chunk(rng, i)) for i in range(args.chunks)]
+
+    start = time.perf_counter()
+    index = LexicalIndex.build(chunks)
+    build_s = time.perf_counter() - start
+    chars = sum(len(c.content) for _, c in chunks)
+    raw_bytes = index.posting_count() * 8
+    print(f"Chunks: {index.size} ({chars / 1e6:.1f}M chars), terms: {index.terms}")
+    print(f"  build            {build_s:8.2f}s  {index.size / build_s:10,.0f} chunks/s")
+    print(f"  postings         {index.postings_bytes / 2**20:8.1f} MiB varint "
+          f"vs {raw_bytes / 2**20:.1f} MiB int32 pairs "
+          f"({raw_bytes / index.postings_bytes:.1f}x)")
+
+    queries = {
+        "identifier": IDENTIFIERS,
+        "japanese": [a + b for a in WORDS_JA[:10] for b in WORDS_JA[10:20]],
+        "mixed": [f"{w} {i}" for w in WORDS_JA for i in IDENTIFIERS],
+    }
+    for name, pool in queries.items():
+        latencies = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            index.search(pool[i % len(pool)], 50)
+            latencies.append(time.perf_counter() - start)
+        print(f"  query {name:<10} p50 {percentile_ms(latencies, 50):6.2f} ms  "
+              f"p99 {percentile_ms(latencies, 99):6.2f} ms")
+
+    ranking = [str(i) for i in range(50)]
+    start = time.perf_counter()
+    for _ in range(args.queries):
+        reciprocal_rank_fusion([ranking, ranking[::-1]])
+    print(f"  RRF (2 x 50)     {(time.perf_counter() - start) / args.queries * 1000:6.3f} ms")
+
+    replaced = 1000
+    start = time.perf_counter()
+    for _ in range(replaced):
+        document_id = str(rng.randrange(args.chunks // 8))
+        index.replace_document(document_id, [make_chunk(rng, j) for j in range(8)])
+    replace_s = time.perf_counter() - start
+    print(f"  replace          {replace_s / replaced * 1000:6.2f} ms/document "
+          f"({index.tombstones} tombstones)")
+
+    start = time.perf_counter()
+    index.compact()
+    print(f"  compact          {time.perf_counter() - start:8.2f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "lexical.npz"
+        start = time.perf_counter()
+        index.save(path)
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        LexicalIndex.load(path)
+        load_s = time.perf_counter() - start
+        print(f"  save / load      {save_s:8.2f}s / {load_s:.2f}s  "
+              f"({path.stat().st_size / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Benchmark LocalIndex search: exact (single vs batched) and IVF recall/latency.
+
+Builds a throwaway index from synthetic clustered vectors; no database needed.
+
+Usage:
+    python benchmarks/bench_local_index.py [--rows 50000] [--dim 512] [--queries 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from embedding.local_index import ChunkMeta, IndexWriter, LocalIndex, normalize
+
+
+def make_vectors(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """クラスタ構造を持つダミーembedding"""
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(0, clusters, rows)
+    return normalize(centers[labels] + 0.6 * rng.standard_normal((rows, dim)) / np.sqrt(dim))
+
+
+def build(root: str, vectors: np.ndarray, nlist: int) -> LocalIndex:
+    with IndexWriter(root, vectors.shape[1]) as writer:
+        for start in range(0, len(vectors), 4096):
+            block = vectors[start : start + 4096]
+            writer.append(
+                [
+                    ChunkMeta(
+                        id=str(start + i), document_id=str((start + i) // 8),
+                        chunk_index=(start + i) % 8, title=None,
+                        heading="", content="", file_path="",
+                        tags=["even"] if (start + i) % 2 == 0 else [],
+                    )
+                    for i in range(len(block))
+                ],
+                block,
+            )
+        return writer.finish(watermark=None, nlist=nlist)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LocalIndex benchmark")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(args.rows, args.dim, clusters=256, rng=rng)
+    queries = make_vectors(args.queries, args.dim, clusters=256, rng=rng)
+    nlist = int(np.sqrt(args.rows))
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        index = build(root, vectors, nlist)
+        print(f"Index: {index.size} x {index.dim}, IVF {nlist} lists, "
+              f"built in {time.perf_counter() - start:.2f}s")
+
+        search = {"match_count": args.k, "similarity_threshold": -1.0}
+
+        start = time.perf_counter()
+        exact = [index.search(q, **search) for q in queries]
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = index.search_batch(queries, **search)
+        batch_s = time.perf_counter() - start
+        assert [[h.id for h in r] for r in batched] == [[h.id for h in r] for r in exact]
+
+        print(f"  exact, one query at a time  {single_s / args.queries * 1000:7.2f} ms/query")
+        print(f"  exact, batched              {batch_s / args.queries * 1000:7.2f} ms/query")
+
+        truth = [{h.id for h in r} for r in exact]
+        for nprobe in (1, 4, 8, 16, 32):
+            start = time.perf_counter()
+            approx = [index.search(q, nprobe=nprobe, **search) for q in queries]
+            elapsed = time.perf_counter() - start
+            recall = np.mean([len(t & {h.id for h in r}) / args.k for t, r in zip(truth, approx)])
+            print(f"  IVF nprobe={nprobe:<3}             {elapsed / args.queries * 1000:7.2f} "
+                  f"ms/query  recall@{args.k} {recall:.3f}")
+
+        start = time.perf_counter()
+        filtered = index.search_batch(queries, filter_tags=["even"], **search)
+        elapsed = time.perf_counter() - start
+        assert all(int(h.id) % 2 == 0 for r in filtered for h in r)
+        print(f"  exact, tag filter (50%)     {elapsed / args.queries * 1000:7.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
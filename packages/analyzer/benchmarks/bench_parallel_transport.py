@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmark objective evaluation across backends and worker counts.
+
+One evaluation is a full transport sweep: the total cost and summed plan
+of every (target, actual) pair under one cost matrix. The serial backend is
+the baseline, and every other backend and worker count must reproduce its
+result bit for bit.
+
+Usage:
+    python benchmarks/bench_parallel_transport.py [--samples 700] [--method exact] [--max-workers 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from analyzer.parallel import TransportSweep
+
+
+def make_samples(count: int, k: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Daily target/actual hour distributions; actual days leave some categories empty."""
+    target = rng.dirichlet(np.full(k, 2.0), count)
+    actual = rng.dirichlet(np.full(k, 0.7), count)
+    actual[rng.random((count, k)) < 0.2] = 0.0
+    actual[actual.sum(axis=1) == 0, 0] = 1.0
+    return target, actual / actual.sum(axis=1, keepdims=True)
+
+
+def worker_counts(max_workers: int) -> list[int]:
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parallel transport sweep benchmark")
+    parser.add_argument("--samples", type=int, default=700)
+    parser.add_argument("--method", choices=["exact", "sinkhorn"], default="exact")
+    parser.add_argument("--evals", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    k = 10
+    P, Q = make_samples(args.samples, k, rng)
+    costs = [rng.uniform(0.2, 1.0, (k, k)) for _ in range(args.evals)]
+    for C in costs:
+        np.fill_diagonal(C, 0)
+
+    def run(sweep: TransportSweep) -> tuple[float, list[tuple[float, np.ndarray]]]:
+        sweep(costs[0])  # warm up pools and solver caches
+        start = time.perf_counter()
+        results = [sweep(C) for C in costs]
+        return (time.perf_counter() - start) / args.evals, results
+
+    print(f"{args.samples} pairs, {args.method}, {args.evals} evaluations, "
+          f"{os.cpu_count()} CPUs")
+    with TransportSweep(P, Q, args.method) as sweep:
+        serial_s, expected = run(sweep)
+    print(f"  serial            {serial_s * 1000:8.1f} ms/eval")
+
+    for backend in ("thread", "process"):
+        for workers in worker_counts(args.max_workers):
+            with TransportSweep(P, Q, args.method, backend=backend, workers=workers) as sweep:
+                elapsed, results = run(sweep)
+            same = all(
+                cost == e_cost and np.array_equal(plan, e_plan)
+                for (cost, plan), (e_cost, e_plan) in zip(results, expected)
+            )
+            print(f"  {backend:<7} x{workers:<3}      {elapsed * 1000:8.1f} ms/eval  "
+                  f"{serial_s / elapsed:5.2f}x  {'identical' if same else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Benchmark binary-quantized vector search with exact rerank against the exact scan.
+
+By default this models both search paths in numpy on synthetic clustered
+vectors. The exact path is what search_chunks does: a cosine scan over float32
+vectors. The quantized path models search_chunks_quantized with a full
+Hamming scan over 1-bit codes, then an exact rerank of the top candidates.
+In Postgres the Hamming pass goes through an HNSW index instead, so only
+--database measures the RPC's latency.
+
+With --database, the same comparison runs through the two RPCs against
+DIRECT_DATABASE_URL. Synthetic chunks are written inside a transaction that
+is rolled back. --dim must match the active embedding model.
+
+Usage:
+    python benchmarks/bench_quantized_search.py [--rows 50000] [--dim 512] [--queries 200]
+    DIRECT_DATABASE_URL=... python benchmarks/bench_quantized_search.py --database --rows 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+import numpy as np
+import psycopg2
+
+from embedding.db import binary_codes, chunk_rows, insert_chunk_rows
+from embedding.types import ChunkWithEmbedding
+
+CANDIDATES = (20, 50, 100, 200, 500)
+
+# バイトごとの立っているビット数（bitwise_countがないnumpy 1.x用）
+_POPCOUNT = np.array([i.bit_count() for i in range(256)], dtype=np.uint16)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_vectors(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """クラスタ構造を持つ正規化済みダミーembedding"""
+    centers = rng.standard_normal((clusters, dim))
+    labels = rng.integers(0, clusters, rows)
+    return normalize(centers[labels] + rng.standard_normal((rows, dim)))
+
+
+def make_queries(vectors: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """コーパスのチャンクにノイズを加えたクエリ（関連チャンクが近くにある実際の検索に近づける）"""
+    rows = vectors[rng.integers(0, len(vectors), count)]
+    return normalize(rows + 0.8 * rng.standard_normal(rows.shape) / np.sqrt(vectors.shape[1]))
+
+
+def pack_codes(vectors: np.ndarray) -> np.ndarray:
+    """ビット列を8バイト単位に詰める（次元数が64の倍数でなければ0で埋める）"""
+    packed = np.packbits(binary_codes(vectors), axis=-1)
+    pad = -packed.shape[-1] % 8
+    if pad:
+        packed = np.pad(packed, [(0, 0)] * (packed.ndim - 1) + [(0, pad)])
+    return packed.view(np.uint64)
+
+
+def hamming(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    diff = codes ^ query_code
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.uint32)
+    return _POPCOUNT[diff.view(np.uint8)].sum(axis=1)
+
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = vectors @ query
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def quantized_search(
+    vectors: np.ndarray,
+    codes: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    candidates: int,
+) -> np.ndarray:
+    """符号のハミング距離で候補を絞り、元のベクトルで並べ直す"""
+    distances = hamming(codes, pack_codes(query))
+    candidate_rows = np.argpartition(distances, candidates)[:candidates]
+    scores = vectors[candidate_rows] @ query
+    top = np.argsort(-scores)[:k]
+    return candidate_rows[top]
+
+
+def bench_numpy(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(args.rows, args.dim, clusters=256, rng=rng)
+    queries = make_queries(vectors, args.queries, rng)
+    codes = pack_codes(vectors)
+
+    print(f"Corpus: {args.rows} x {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"  float32 vectors  {vectors.nbytes / 2**20:8.1f} MiB")
+    print(f"  binary codes     {codes.nbytes / 2**20:8.1f} MiB "
+          f"({vectors.nbytes / codes.nbytes:.0f}x smaller)")
+
+    start = time.perf_counter()
+    truth = [exact_search(vectors, q, args.k) for q in queries]
+    exact_s = time.perf_counter() - start
+    print(f"  exact scan                 {exact_s / args.queries * 1000:7.2f} ms/query")
+
+    for candidates in CANDIDATES:
+        if candidates >= args.rows:
+            continue
+        start = time.perf_counter()
+        approx = [quantized_search(vectors, codes, q, args.k, candidates) for q in queries]
+        elapsed = time.perf_counter() - start
+        recall = np.mean([len(set(t) & set(a)) / args.k for t, a in zip(truth, approx)])
+        print(f"  quantized, {candidates:>4} candidates "
+              f"{elapsed / args.queries * 1000:7.2f} ms/query  recall@{args.k} {recall:.3f}")
+
+
+def bench_database(args: argparse.Namespace) -> None:
+    database_url = os.environ.get("DIRECT_DATABASE_URL")
+    if not database_url:
+        raise ValueError("DIRECT_DATABASE_URL is required")
+
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(args.rows, args.dim, clusters=256, rng=rng)
+    queries = make_queries(vectors, args.queries, rng)
+    chunks = [
+        ChunkWithEmbedding(
+            chunk_index=i, parent_heading="Benchmark", heading=f"Section {i}",
+            content="", embedding=vectors[i],
+        )
+        for i in range(args.rows)
+    ]
+
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM raw.github_contents__documents LIMIT 1")
+            row = cur.fetchone()
+            if not row:
+                raise ValueError("raw.github_contents__documents is empty")
+            document_id = str(row[0])
+            cur.execute("DELETE FROM rag.chunks WHERE document_id = %s", (document_id,))
+            insert_chunk_rows(cur, chunk_rows(document_id, chunks))
+            cur.execute("ANALYZE rag.chunks")
+            cur.execute("SELECT COUNT(*) FROM rag.chunks")
+            total = cur.fetchone()[0]
+            print(f"rag.chunks: {total} rows ({args.rows} synthetic), "
+                  f"{args.queries} queries, k={args.k}")
+
+            def run(sql: str, params: tuple) -> tuple[float, list[set[str]]]:
+                results = []
+                start = time.perf_counter()
+                for q in queries:
+                    cur.execute(sql, (q.tolist(), *params))
+                    results.append({str(r[0]) for r in cur.fetchall()})
+                return (time.perf_counter() - start) / args.queries, results
+
+            exact_s, truth = run("SELECT id FROM search_chunks(%s::vector, NULL, %s, -1)", (args.k,))
+            print(f"  search_chunks              {exact_s * 1000:7.2f} ms/query")
+            for candidates in CANDIDATES:
+                elapsed, approx = run(
+                    "SELECT id FROM search_chunks_quantized(%s::vector, NULL, %s, -1, %s)",
+                    (args.k, candidates),
+                )
+                recall = np.mean([len(t & a) / args.k for t, a in zip(truth, approx)])
+                print(f"  quantized, {candidates:>4} candidates "
+                      f"{elapsed * 1000:7.2f} ms/query  recall@{args.k} {recall:.3f}")
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Quantized vector search benchmark")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--database", action="store_true",
+                        help="Compare search_chunks and search_chunks_quantized in Postgres")
+    args = parser.parse_args()
+
+    if args.database:
+        bench_database(args)
+    else:
+        bench_numpy(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark query embedding: cache + micro-batching vs one API call per query.
+
+Simulates the Voyage round trip with a sleep, so it runs offline. Concurrent
+threads issue queries drawn from a skewed (Zipf) distribution, as repeated
+searches from the MCP tool would.
+
+Usage:
+    python benchmarks/bench_query_embedding.py [--threads 16] [--queries 2000] [--rtt-ms 80]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+
+import numpy as np
+
+from embedding.query import QueryEmbedder
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="query embedding benchmark")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--distinct", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=80.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    ranks = np.minimum(rng.zipf(1.3, args.queries), args.distinct)
+    queries = [f"睡眠 と 時間管理 {r}" for r in ranks]
+
+    def fake_api(texts: Sequence[str]) -> np.ndarray:
+        time.sleep(args.rtt_ms / 1000)
+        return rng.standard_normal((len(texts), 512)).astype(np.float32)
+
+    def direct(query: str) -> float:
+        start = time.perf_counter()
+        fake_api([query])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        latencies = np.asarray(list(pool.map(direct, queries))) * 1000
+    elapsed = time.perf_counter() - start
+    print("direct (one API call per query)")
+    print(f"  {args.queries / elapsed:8.1f} queries/s, {args.queries} API calls")
+    print(f"  latency p50 {np.percentile(latencies, 50):6.1f} ms, "
+          f"p99 {np.percentile(latencies, 99):6.1f} ms")
+
+    embedder = QueryEmbedder(fake_api)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(embedder.embed, queries))
+    elapsed = time.perf_counter() - start
+    stats = embedder.stats()
+    embedder.close()
+    print("QueryEmbedder (LRU cache + 5ms micro-batching)")
+    print(f"  {args.queries / elapsed:8.1f} queries/s, {stats.api_calls} API calls "
+          f"(avg batch {stats.avg_batch_size:.1f}), hit rate {stats.hit_rate:.0%}")
+    print(f"  latency p50 {stats.p50_ms:6.1f} ms, p99 {stats.p99_ms:6.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Benchmark the transport solvers against the original per-call emd().
+
+One "evaluation" is what the cost-matrix objective does per optimizer step:
+the transport cost of every (target, actual) pair under one cost matrix.
+The baseline is the original emd(), which rebuilt the dense constraint
+matrix with Python loops before every linprog call. The default sample
+count is about the size of analysis.daily_category_hours_paired.
+
+Usage:
+    python benchmarks/bench_transport.py [--samples 700] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+from scipy.optimize import linprog
+
+from analyzer.data import Category
+from analyzer.estimate_cost_matrix import build_initial_cost_matrix
+from analyzer.transport import ExactTransport, sinkhorn
+
+# Same shape as ref.dim_category_time_personal: 10 categories in 3 coarse groups
+CATEGORIES = [
+    Category(f"Category{i}", group)
+    for i, group in enumerate(["Essentials"] * 3 + ["Obligation"] * 3 + ["Leisure"] * 4)
+]
+
+EPSILONS = (0.1, 0.03, 0.01, 0.003)
+
+
+def legacy_emd(p: np.ndarray, q: np.ndarray, C: np.ndarray) -> float:
+    """The original emd() implementation"""
+    n, m = len(p), len(q)
+    c = C.flatten()
+    A_eq = np.zeros((n + m, n * m))
+    for i in range(n):
+        A_eq[i, i * m : (i + 1) * m] = 1
+    for j in range(m):
+        for i in range(n):
+            A_eq[n + j, i * m + j] = 1
+    b_eq = np.concatenate([p, q])
+    result = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=(0, None), method="highs")
+    return float(result.fun) if result.success else float("inf")
+
+
+def make_samples(count: int, k: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Daily target/actual hour distributions; actual days leave some categories empty."""
+    target = rng.dirichlet(np.full(k, 2.0), count)
+    actual = rng.dirichlet(np.full(k, 0.7), count)
+    actual[rng.random((count, k)) < 0.2] = 0.0
+    actual[actual.sum(axis=1) == 0, 0] = 1.0
+    return target, actual / actual.sum(axis=1, keepdims=True)
+
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Transport solver benchmark")
+    parser.add_argument("--samples", type=int, default=700)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    k = len(CATEGORIES)
+    P, Q = make_samples(args.samples, k, rng)
+    C = build_initial_cost_matrix(CATEGORIES) * rng.uniform(0.5, 1.0, (k, k))
+    np.fill_diagonal(C, 0)
+    C /= C.max()
+
+    print(f"{args.samples} pairs, {k}x{k} cost matrix, best of {args.repeat}")
+
+    legacy_s, legacy = timed(
+        lambda: np.array([legacy_emd(p, q, C) for p, q in zip(P, Q)]), args.repeat
+    )
+    print(f"  legacy emd          {legacy_s * 1000:8.1f} ms/eval")
+
+    start = time.perf_counter()
+    solver = ExactTransport(k, k)
+    setup_s = time.perf_counter() - start
+    print(f"  exact setup         {setup_s * 1000:8.1f} ms (once per shape)")
+    exact_s, exact = timed(lambda: solver.solve_batch(P, Q, C), args.repeat)
+    err = np.abs(exact.cost - legacy).max()
+    print(f"  exact (sub-batch)  {exact_s * 1000:8.1f} ms/eval  "
+          f"{legacy_s / exact_s:5.1f}x  max |err| {err:.1e}")
+
+    for epsilon in EPSILONS:
+        s, result = timed(lambda e=epsilon: sinkhorn(P, Q, C, epsilon=e), args.repeat)
+        err = np.abs(result.cost - legacy)
+        print(f"  sinkhorn eps={epsilon:<6} {s * 1000:8.1f} ms/eval  "
+              f"{legacy_s / s:5.1f}x  mean |err| {err.mean():.1e}  max |err| {err.max():.1e}")
+
+
+if __name__ == "__main__":
+    main()
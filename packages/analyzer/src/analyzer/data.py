@@ -0,0 +1,178 @@
+"""Data access for analysis views, with a local Parquet cache.
+
+Views are pulled with COPY ... TO STDOUT and parsed column by column into
+a DataFrame, instead of going through pd.read_sql row by row. Each view is
+cached as <schema>.<view>.parquet. The next load fetches only rows on or
+after the cached max date. The last cached day is fetched again, because
+today's actuals may still have been incomplete when it was cached.
+
+Usage:
+    with connect() as conn:
+        categories = load_categories(conn)
+        paired = load_paired_samples(conn, categories)
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent.parent
+CACHE_DIR = PROJECT_ROOT / "packages" / "analyzer" / ".cache" / "analysis"
+
+PAIRED_VIEW = "analysis.daily_category_hours_paired"
+
+_VIEW_NAME = re.compile(r"^[a-z_][a-z0-9_]*\.[a-z_][a-z0-9_]*$")
+
+
+@dataclass(slots=True)
+class Category:
+    """A row of ref.dim_category_time_personal."""
+
+    name: str
+    coarse_category: str
+
+
+@dataclass(slots=True)
+class PairedSamples:
+    """(target, actual) hours per day, one column per category."""
+
+    dates: np.ndarray  # (N,) datetime64[D]
+    targets: np.ndarray  # (N, k)
+    actuals: np.ndarray  # (N, k)
+
+
+@contextmanager
+def connect(database_url: str | None = None) -> Iterator[psycopg2.extensions.connection]:
+    """Connect to DIRECT_DATABASE_URL (read from the project .env if not set)."""
+    if database_url is None:
+        load_dotenv(PROJECT_ROOT / ".env")
+        database_url = os.getenv("DIRECT_DATABASE_URL")
+    if not database_url:
+        raise ValueError("DIRECT_DATABASE_URL must be set in .env")
+    conn = psycopg2.connect(database_url)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def copy_query(
+    conn: psycopg2.extensions.connection,
+    query: sql.Composable,
+    parse_dates: list[str] | None = None,
+) -> pd.DataFrame:
+    """Run COPY (query) TO STDOUT and parse the CSV stream into columns."""
+    buf = io.BytesIO()
+    copy = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)").format(query)
+    with conn.cursor() as cur:
+        cur.copy_expert(copy.as_string(conn), buf)
+    buf.seek(0)
+    return pd.read_csv(buf, parse_dates=parse_dates)
+
+
+def load_view(
+    conn: psycopg2.extensions.connection,
+    view: str,
+    date_column: str = "date",
+    cache_dir: Path | None = CACHE_DIR,
+    refresh: bool = False,
+) -> pd.DataFrame:
+    """Load a view, fetching only days not already in the local cache.
+
+    Args:
+        conn: Database connection
+        view: schema.view name
+        date_column: Date column used as the incremental key
+        cache_dir: Parquet cache directory (None: no cache)
+        refresh: Ignore the cache and fetch everything
+
+    Returns:
+        All rows of the view, sorted by date_column
+    """
+    if not _VIEW_NAME.match(view):
+        raise ValueError(f"Invalid view name: {view}")
+    schema, name = view.split(".")
+    base = sql.SQL("SELECT * FROM {}").format(sql.Identifier(schema, name))
+
+    path = cache_dir / f"{view}.parquet" if cache_dir is not None else None
+    cached = None
+    if path is not None and path.exists() and not refresh:
+        cached = pd.read_parquet(path)
+
+    if cached is not None and len(cached) > 0:
+        since = cached[date_column].max()
+        query = sql.SQL("{} WHERE {} >= {}").format(
+            base, sql.Identifier(date_column), sql.Literal(since.date())
+        )
+        fetched = copy_query(conn, query, parse_dates=[date_column])
+        kept = cached[cached[date_column] < since]
+        df = pd.concat([kept, fetched], ignore_index=True) if len(kept) else fetched
+    else:
+        df = copy_query(conn, base, parse_dates=[date_column])
+
+    df = df.sort_values(date_column, ignore_index=True)
+    if path is not None:
+        _write_parquet(df, path)
+    return df
+
+
+def _write_parquet(df: pd.DataFrame, path: Path) -> None:
+    """Write to a temporary file and rename, so a crash never leaves half a cache."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def load_categories(conn: psycopg2.extensions.connection) -> list[Category]:
+    """Categories in sort_order."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT name, coarse_category FROM ref.dim_category_time_personal ORDER BY sort_order"
+        )
+        return [Category(name=name, coarse_category=coarse) for name, coarse in cur.fetchall()]
+
+
+def paired_matrices(df: pd.DataFrame, categories: list[Category]) -> PairedSamples:
+    """Build the (target, actual) matrices from daily_category_hours_paired.
+
+    Days where either side sums to zero (incomplete days) are dropped.
+    """
+    keys = [c.name.lower() for c in categories]
+    target_cols = [f"target_{key}" for key in keys]
+    actual_cols = [f"actual_{key}" for key in keys]
+    missing = [col for col in target_cols + actual_cols if col not in df.columns]
+    if missing:
+        raise ValueError(f"Paired view has no columns for: {', '.join(missing)}")
+
+    targets = df[target_cols].to_numpy(dtype=float)
+    actuals = df[actual_cols].to_numpy(dtype=float)
+    valid = (targets.sum(axis=1) > 0) & (actuals.sum(axis=1) > 0)
+    return PairedSamples(
+        dates=df["date"].to_numpy(dtype="datetime64[D]")[valid],
+        targets=targets[valid],
+        actuals=actuals[valid],
+    )
+
+
+def load_paired_samples(
+    conn: psycopg2.extensions.connection,
+    categories: list[Category],
+    cache_dir: Path | None = CACHE_DIR,
+    refresh: bool = False,
+) -> PairedSamples:
+    """Load analysis.daily_category_hours_paired as (target, actual) matrices."""
+    df = load_view(conn, PAIRED_VIEW, cache_dir=cache_dir, refresh=refresh)
+    return paired_matrices(df, categories)
@@ -6,7 +6,12 @@ using numerical optimization. The cost matrix captures how "easily"
 time flows between categories.
 
 Usage:
-    python -m analyzer.estimate_cost_matrix
+    python -m analyzer.estimate_cost_matrix [--full] [--tolerance 1e-3]
+
+By default the fit is incremental. It is skipped when the input matches the
+last fit, and otherwise warm-started from the last solution (see
+analyzer.fit_state). The seed is rewritten only when some cost moves by
+more than --tolerance.
 
 Output:
     - packages/transform/seeds/cost_matrix_time_categories.csv
@@ -15,17 +20,27 @@ Output:
 
 from __future__ import annotations
 
-import os
+import argparse
+from dataclasses import dataclass
 from pathlib import Path
-from urllib.parse import urlparse
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import psycopg2
 import seaborn as sns
-from dotenv import load_dotenv
-from scipy.optimize import linprog, minimize
+from scipy.optimize import minimize
+
+from analyzer.data import (
+    PROJECT_ROOT,
+    Category,
+    PairedSamples,
+    connect,
+    load_categories,
+    load_paired_samples,
+)
+from analyzer.fit_state import build_state, fingerprint, load_fit_state, save_fit_state
+from analyzer.parallel import Backend, TransportSweep
+from analyzer.transport import Method, exact_solver
 
 
 def emd(p: np.ndarray, q: np.ndarray, C: np.ndarray) -> float:
@@ -39,226 +54,211 @@ def emd(p: np.ndarray, q: np.ndarray, C: np.ndarray) -> float:
         C: Cost matrix (n x m)
 
     Returns:
-        EMD value
+        EMD value (inf if the LP fails)
     """
-    n, m = len(p), len(q)
-
-    # Flatten cost matrix for linear program
-    c = C.flatten()
-
-    # Equality constraints: sum over j of T[i,j] = p[i], sum over i of T[i,j] = q[j]
-    # Build constraint matrix A_eq
-    A_eq = np.zeros((n + m, n * m))
-
-    # Row sum constraints (supply)
-    for i in range(n):
-        A_eq[i, i * m : (i + 1) * m] = 1
-
-    # Column sum constraints (demand)
-    for j in range(m):
-        for i in range(n):
-            A_eq[n + j, i * m + j] = 1
-
-    b_eq = np.concatenate([p, q])
+    cost, _ = exact_solver(len(p), len(q)).solve(p, q, C)
+    return cost
 
-    # Solve linear program
-    result = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=(0, None), method="highs")
 
-    if result.success:
-        return float(result.fun)
-    else:
-        # Fallback: return a large value
-        return float("inf")
-
-# Category order (must match dim_category_time_personal sort_order)
-CATEGORIES = [
-    "Vitals",
-    "Sleep",
-    "Exercise",
-    "Overhead",
-    "Work",
-    "Education",
-    "Creative",
-    "Social",
-    "Meta",
-    "Pleasure",
-]
-
-# Coarse category groups for initial cost matrix
-COARSE_GROUPS = {
-    "Vitals": "Essentials",
-    "Sleep": "Essentials",
-    "Exercise": "Essentials",
-    "Overhead": "Obligation",
-    "Work": "Obligation",
-    "Education": "Obligation",
-    "Creative": "Leisure",
-    "Social": "Leisure",
-    "Meta": "Leisure",
-    "Pleasure": "Leisure",
-}
-
-
-def load_paired_data() -> pd.DataFrame:
-    """Load actual-target paired data from PostgreSQL."""
-    # Load environment variables
-    project_root = Path(__file__).parent.parent.parent.parent.parent
-    load_dotenv(project_root / ".env")
-
-    database_url = os.getenv("DIRECT_DATABASE_URL")
-    if not database_url:
-        raise ValueError("DIRECT_DATABASE_URL must be set in .env")
-
-    # Parse database URL
-    parsed = urlparse(database_url)
-    conn = psycopg2.connect(
-        host=parsed.hostname,
-        port=parsed.port or 5432,
-        user=parsed.username,
-        password=parsed.password,
-        dbname=parsed.path.lstrip("/"),
-    )
+@dataclass(slots=True)
+class CostMatrixFit:
+    """Raw result of fit_cost_matrix (before normalization).
 
-    # Query paired data from analysis schema
-    query = "SELECT * FROM analysis.daily_category_hours_paired"
-    df = pd.read_sql(query, conn)
-    conn.close()
+    C keeps the off-diagonal sum of the initial matrix.
+    """
 
-    return df
+    C: np.ndarray
+    loss: float
+    iterations: int
+    evaluations: int
+    success: bool
 
 
 def build_initial_cost_matrix(
-    categories: list[str],
-    groups: dict[str, str],
+    categories: list[Category],
     same_group_cost: float = 1.0,
     diff_group_cost: float = 2.0,
 ) -> np.ndarray:
     """Build initial cost matrix based on category hierarchy.
 
-    Same group (Essentials, Obligation, Leisure) -> lower cost
-    Different group -> higher cost
+    Same coarse category (Essentials, Obligation, Leisure) -> lower cost
+    Different coarse category -> higher cost
     """
-    k = len(categories)
-    C = np.zeros((k, k))
-    for i, cat_i in enumerate(categories):
-        for j, cat_j in enumerate(categories):
-            if i == j:
-                C[i, j] = 0
-            elif groups[cat_i] == groups[cat_j]:
-                C[i, j] = same_group_cost
-            else:
-                C[i, j] = diff_group_cost
-    return C
-
-
-def extract_vectors(df: pd.DataFrame) -> list[tuple[np.ndarray, np.ndarray]]:
-    """Extract (target, actual) vector pairs from DataFrame."""
-    samples = []
-
-    actual_cols = [f"actual_{cat.lower()}" for cat in CATEGORIES]
-    target_cols = [f"target_{cat.lower()}" for cat in CATEGORIES]
-
-    for _, row in df.iterrows():
-        actual = np.array([row[col] for col in actual_cols], dtype=float)
-        target = np.array([row[col] for col in target_cols], dtype=float)
+    groups = np.array([c.coarse_category for c in categories])
+    C = np.where(groups[:, None] == groups[None, :], same_group_cost, diff_group_cost)
+    np.fill_diagonal(C, 0)
+    return C.astype(float)
 
-        # Skip rows with zero total (incomplete days)
-        if actual.sum() > 0 and target.sum() > 0:
-            samples.append((target, actual))
 
-    return samples
-
-
-def estimate_cost_matrix(
-    samples: list[tuple[np.ndarray, np.ndarray]],
+def fit_cost_matrix(
+    samples: PairedSamples,
     C_init: np.ndarray,
     reg: float = 0.1,
     verbose: bool = True,
-    max_samples: int = 100,
+    max_samples: int | None = None,
     max_iter: int = 100,
-) -> np.ndarray:
-    """Estimate cost matrix using inverse optimal transport.
+    method: Method = "exact",
+    epsilon: float = 0.01,
+    backend: Backend = "serial",
+    workers: int | None = None,
+) -> CostMatrixFit:
+    """Fit the cost matrix by inverse optimal transport (unnormalized).
+
+    Transport costs alone do not fix the scale of C, and the loss is lowest
+    at C = 0. The off-diagonal sum is therefore held at that of C_init: the
+    optimizer works on free off-diagonal weights X, and C = scale * X / sum(X).
 
     Args:
-        samples: List of (target, actual) vector pairs
-        C_init: Initial cost matrix
+        samples: (target, actual) hours per day
+        C_init: Initial cost matrix (the hierarchy prior, or a previous fit to warm-start)
         reg: Regularization parameter
         verbose: Print progress
-        max_samples: Maximum number of samples to use (for speed)
+        max_samples: Maximum number of samples to use (None: all)
         max_iter: Maximum number of optimizer iterations
+        method: Transport solver, "exact" (LP) or "sinkhorn" (entropic)
+        epsilon: Entropic regularization for the "sinkhorn" solver
+        backend: Where the per-sample transport problems run:
+            "serial", "thread" or "process" (same result for all)
+        workers: Pool size for "thread" / "process" (default: CPU count)
 
     Returns:
-        Estimated cost matrix (k x k)
+        CostMatrixFit with the raw optimizer solution
+
+    Raises:
+        ValueError: If C_init has no positive off-diagonal cost
     """
     k = len(C_init)
+    off_diagonal = ~np.eye(k, dtype=bool)
+    scale = float(C_init[off_diagonal].sum())
+    if not scale > 0:
+        raise ValueError("C_init must have a positive off-diagonal cost")
+
+    targets, actuals = samples.targets, samples.actuals
 
     # Subsample if too many samples (randomly select)
-    if len(samples) > max_samples:
+    if max_samples is not None and len(targets) > max_samples:
         np.random.seed(42)
-        indices = np.random.choice(len(samples), max_samples, replace=False)
-        samples = [samples[i] for i in indices]
+        indices = np.random.choice(len(targets), max_samples, replace=False)
+        targets, actuals = targets[indices], actuals[indices]
         if verbose:
-            print(f"Subsampled to {len(samples)} samples for efficiency")
+            print(f"Subsampled to {len(targets)} samples for efficiency")
+
+    # Normalize to probability distributions
+    P = targets / targets.sum(axis=1, keepdims=True)
+    Q = actuals / actuals.sum(axis=1, keepdims=True)
 
     iteration_count = [0]
 
-    def objective(C_flat: np.ndarray) -> float:
-        C = C_flat.reshape(k, k)
-        np.fill_diagonal(C, 0)
+    def to_matrix(x: np.ndarray) -> np.ndarray:
+        C = np.zeros((k, k))
+        C[off_diagonal] = scale * x / x.sum()
+        return C
 
-        loss = 0.0
-        for target, actual in samples:
-            # Normalize to probability distribution
-            p = target / target.sum()
-            q = actual / actual.sum()
+    def objective(x: np.ndarray) -> tuple[float, np.ndarray]:
+        C = to_matrix(x)
 
-            # EMD (Wasserstein-1 distance) using scipy
-            loss += emd(p, q, C)
+        # Wasserstein-1 distance for every (target, actual) pair.
+        # W(p, q; C) = min_T <T, C> is linear in C for a fixed plan, so its
+        # gradient is the optimal plan. For sinkhorn this is the gradient of
+        # the entropic objective, the usual approximation.
+        loss, grad = sweep(C)
 
-        # L2 regularization to avoid trivial solution
+        # L2 regularization spreads the fixed total over the entries
         loss += reg * np.sum(C**2)
+        grad += 2 * reg * C
+
+        # Chain rule through C = scale * x / sum(x)
+        g = grad[off_diagonal]
+        grad_x = scale / x.sum() * (g - np.dot(g, C[off_diagonal]) / scale)
 
         iteration_count[0] += 1
         if verbose and iteration_count[0] % 10 == 0:
             print(f"  Iteration {iteration_count[0]}: loss = {loss:.4f}")
 
-        return loss
+        return loss, grad_x
 
     if verbose:
-        print(f"Starting optimization with {len(samples)} samples...")
+        print(f"Starting optimization with {len(P)} samples...")
         print(f"Initial cost matrix shape: {C_init.shape}")
         print(f"Max iterations: {max_iter}")
+        print(f"Transport solver: {method} ({backend})")
 
-    result = minimize(
-        objective,
-        C_init.flatten(),
-        method="L-BFGS-B",
-        bounds=[(0, None)] * (k * k),
-        options={"maxiter": max_iter, "disp": False},
-    )
+    # Only off-diagonal entries are free (staying in a category costs nothing)
+    x0 = C_init[off_diagonal].astype(float)
+
+    with TransportSweep(P, Q, method, epsilon, backend, workers) as sweep:
+        result = minimize(
+            objective,
+            x0,
+            jac=True,
+            method="L-BFGS-B",
+            bounds=[(0, None)] * len(x0),
+            options={"maxiter": max_iter, "disp": False},
+        )
 
     if verbose:
         print(f"Optimization finished. Success: {result.success}")
         print(f"Final loss: {result.fun:.4f}")
         print(f"Total function evaluations: {iteration_count[0]}")
 
-    C_optimal = result.x.reshape(k, k)
+    return CostMatrixFit(
+        C=to_matrix(result.x),
+        loss=float(result.fun),
+        iterations=int(result.nit),
+        evaluations=iteration_count[0],
+        success=bool(result.success),
+    )
 
-    # Normalize: max = 1
-    if C_optimal.max() > 0:
-        C_optimal = C_optimal / C_optimal.max()
 
+def normalize_cost_matrix(C: np.ndarray) -> np.ndarray:
+    """Scale a fitted cost matrix to max = 1 with a zero diagonal.
+
+    Raises:
+        ValueError: If the matrix has no positive finite maximum (the fit collapsed)
+    """
+    C_optimal = C.copy()
     np.fill_diagonal(C_optimal, 0)
 
-    return C_optimal
+    # Normalize: max = 1
+    peak = C_optimal.max()
+    if not np.isfinite(C_optimal).all() or not peak > 0:
+        raise ValueError(f"Estimated cost matrix collapsed (max = {peak})")
+
+    return C_optimal / peak
+
+
+def estimate_cost_matrix(
+    samples: PairedSamples,
+    C_init: np.ndarray,
+    reg: float = 0.1,
+    verbose: bool = True,
+    max_samples: int | None = None,
+    max_iter: int = 100,
+    method: Method = "exact",
+    epsilon: float = 0.01,
+    backend: Backend = "serial",
+    workers: int | None = None,
+) -> np.ndarray:
+    """Estimate cost matrix using inverse optimal transport.
+
+    Same arguments as fit_cost_matrix.
+
+    Returns:
+        Estimated cost matrix (k x k), normalized to max = 1
+    """
+    fit = fit_cost_matrix(
+        samples, C_init, reg=reg, verbose=verbose, max_samples=max_samples,
+        max_iter=max_iter, method=method, epsilon=epsilon, backend=backend, workers=workers,
+    )
+    return normalize_cost_matrix(fit.C)
 
 
-def save_cost_matrix_csv(C: np.ndarray, output_path: Path) -> None:
+def save_cost_matrix_csv(C: np.ndarray, names: list[str], output_path: Path) -> None:
     """Save cost matrix as CSV seed file."""
     # Create DataFrame with from/to category names
     rows = []
-    for i, from_cat in enumerate(CATEGORIES):
-        for j, to_cat in enumerate(CATEGORIES):
+    for i, from_cat in enumerate(names):
+        for j, to_cat in enumerate(names):
             rows.append(
                 {"from_category": from_cat, "to_category": to_cat, "cost": round(C[i, j], 6)}
             )
@@ -268,13 +268,24 @@ def save_cost_matrix_csv(C: np.ndarray, output_path: Path) -> None:
     print(f"Saved cost matrix to {output_path}")
 
 
-def plot_cost_matrix(C: np.ndarray, output_path: Path) -> None:
+def read_cost_matrix_csv(names: list[str], path: Path) -> np.ndarray | None:
+    """Read a saved cost matrix seed (None if missing or for other categories)."""
+    if not path.exists():
+        return None
+    df = pd.read_csv(path)
+    if set(df["from_category"]) != set(names) or set(df["to_category"]) != set(names):
+        return None
+    matrix = df.pivot(index="from_category", columns="to_category", values="cost")
+    return matrix.loc[names, names].to_numpy(dtype=float)
+
+
+def plot_cost_matrix(C: np.ndarray, names: list[str], output_path: Path) -> None:
     """Plot cost matrix as heatmap."""
     plt.figure(figsize=(10, 8))
     sns.heatmap(
         C,
-        xticklabels=CATEGORIES,
-        yticklabels=CATEGORIES,
+        xticklabels=names,
+        yticklabels=names,
         annot=True,
         fmt=".2f",
         cmap="YlOrRd",
@@ -292,40 +303,93 @@ def plot_cost_matrix(C: np.ndarray, output_path: Path) -> None:
 
 def main() -> None:
     """Main entry point."""
-    project_root = Path(__file__).parent.parent.parent.parent.parent
+    parser = argparse.ArgumentParser(description="Estimate the time category cost matrix")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the saved fit state and refit from the hierarchy prior",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-3,
+        help="Rewrite the seed only if some cost moves by more than this",
+    )
+    parser.add_argument("--method", choices=["exact", "sinkhorn"], default="exact")
+    parser.add_argument("--backend", choices=["serial", "thread", "process"], default="serial")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
 
     # Create output directories
-    seeds_dir = project_root / "packages" / "transform" / "seeds"
-    output_dir = project_root / "packages" / "analyzer" / "output"
+    seeds_dir = PROJECT_ROOT / "packages" / "transform" / "seeds"
+    output_dir = PROJECT_ROOT / "packages" / "analyzer" / "output"
     output_dir.mkdir(parents=True, exist_ok=True)
+    seed_path = seeds_dir / "cost_matrix_time_categories.csv"
 
-    # Load data
+    # Load data (new days only; earlier days come from the local cache)
     print("Loading paired data from Supabase...")
-    df = load_paired_data()
-    print(f"Loaded {len(df)} rows")
-
-    # Extract vectors
-    samples = extract_vectors(df)
-    print(f"Extracted {len(samples)} valid (target, actual) pairs")
+    with connect() as conn:
+        categories = load_categories(conn)
+        samples = load_paired_samples(conn, categories)
+    names = [c.name for c in categories]
+    print(f"Loaded {len(names)} categories and {len(samples.targets)} valid (target, actual) pairs")
 
-    if len(samples) == 0:
+    if len(samples.targets) == 0:
         print("No valid samples found. Exiting.")
         return
 
-    # Build initial cost matrix from hierarchy
-    C_init = build_initial_cost_matrix(CATEGORIES, COARSE_GROUPS)
-    print("Built initial cost matrix from category hierarchy")
+    # Everything that changes the result; backend and workers do not.
+    # "scale" marks the fixed off-diagonal sum, so states from the
+    # unconstrained (collapsing) fit are neither reused nor warm-started.
+    params = {
+        "reg": 0.1, "max_iter": 100, "method": args.method, "epsilon": 0.01,
+        "scale": "off_diagonal_sum",
+    }
+    digest = fingerprint(samples, categories, params)
+    state = None if args.full else load_fit_state()
+
+    if state is not None and state.fingerprint == digest:
+        print(f"Input unchanged since the last fit ({state.fitted_at}). Skipping.")
+        return
 
-    # Estimate cost matrix
-    C_optimal = estimate_cost_matrix(samples, C_init, reg=0.1, verbose=True)
+    if state is not None and state.can_warm_start(categories, params):
+        C_init = np.array(state.C)
+        print(f"Warm-starting from the last fit ({state.samples} pairs up to {state.last_date})")
+    else:
+        # Build initial cost matrix from hierarchy
+        C_init = build_initial_cost_matrix(categories)
+        print("Built initial cost matrix from category hierarchy")
 
-    # Save results
-    save_cost_matrix_csv(C_optimal, seeds_dir / "cost_matrix_time_categories.csv")
-    plot_cost_matrix(C_optimal, output_dir / "cost_matrix_heatmap.png")
+    # Estimate cost matrix
+    fit = fit_cost_matrix(
+        samples, C_init, reg=params["reg"], verbose=True, max_iter=params["max_iter"],
+        method=args.method, epsilon=params["epsilon"],
+        backend=args.backend, workers=args.workers,
+    )
+    try:
+        C_optimal = normalize_cost_matrix(fit.C)
+    except ValueError as e:
+        # Neither the state nor the seed is written, so the next run starts over
+        raise SystemExit(f"Error: {e}") from e
+    save_fit_state(build_state(
+        digest, categories, params, samples, fit.C, fit.loss, fit.iterations, fit.evaluations,
+    ))
+
+    # Save results only if the matrix actually moved
+    C_previous = read_cost_matrix_csv(names, seed_path)
+    if C_previous is not None:
+        change = float(np.abs(C_optimal - C_previous).max())
+        if change <= args.tolerance:
+            print(f"Max cost change {change:.2e} <= {args.tolerance:g}; keeping {seed_path.name}")
+            return
+        print(f"Max cost change {change:.2e}")
+
+    save_cost_matrix_csv(C_optimal, names, seed_path)
+    plot_cost_matrix(C_optimal, names, output_dir / "cost_matrix_heatmap.png")
 
     # Print summary
     print("\nEstimated Cost Matrix:")
-    print(pd.DataFrame(C_optimal, index=CATEGORIES, columns=CATEGORIES).round(3))
+    print(pd.DataFrame(C_optimal, index=names, columns=names).round(3))
 
 
 if __name__ == "__main__":
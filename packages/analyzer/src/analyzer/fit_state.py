@@ -0,0 +1,107 @@
+"""Persisted state of the last cost-matrix fit, for incremental re-estimation.
+
+The state records what the last fit saw (a fingerprint of the categories,
+the paired samples and the fit parameters) and what it produced (the raw
+optimizer solution and its statistics). With it, a nightly run can skip
+the fit when the input has not changed. When new days arrive, it can
+warm-start from the previous solution instead of the hierarchy prior.
+
+SciPy's L-BFGS-B cannot be seeded with curvature pairs, so the optimizer
+state that carries over between runs is the solution point itself.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from analyzer.data import PROJECT_ROOT, Category, PairedSamples
+
+STATE_PATH = PROJECT_ROOT / "packages" / "analyzer" / ".cache" / "cost_matrix_state.json"
+
+
+@dataclass(slots=True)
+class FitState:
+    """What the last fit saw and produced."""
+
+    fingerprint: str
+    categories: list[str]
+    params: dict[str, Any]
+    C: list[list[float]]  # raw (unnormalized) solution
+    loss: float
+    iterations: int
+    evaluations: int
+    samples: int
+    last_date: str | None
+    fitted_at: str
+
+    def can_warm_start(self, categories: list[Category], params: dict[str, Any]) -> bool:
+        """Same categories and fit parameters, so the solution is a valid starting point."""
+        return self.categories == [c.name for c in categories] and self.params == params
+
+
+def fingerprint(
+    samples: PairedSamples,
+    categories: list[Category],
+    params: dict[str, Any],
+) -> str:
+    """SHA-256 of everything that determines the fit result."""
+    h = hashlib.sha256()
+    h.update(json.dumps(
+        {"categories": [[c.name, c.coarse_category] for c in categories], "params": params},
+        sort_keys=True,
+    ).encode())
+    for array in (
+        samples.dates.astype("datetime64[D]").astype(np.int64),
+        samples.targets.astype(np.float64),
+        samples.actuals.astype(np.float64),
+    ):
+        h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def build_state(
+    fingerprint: str,
+    categories: list[Category],
+    params: dict[str, Any],
+    samples: PairedSamples,
+    C: np.ndarray,
+    loss: float,
+    iterations: int,
+    evaluations: int,
+) -> FitState:
+    return FitState(
+        fingerprint=fingerprint,
+        categories=[c.name for c in categories],
+        params=params,
+        C=C.tolist(),
+        loss=loss,
+        iterations=iterations,
+        evaluations=evaluations,
+        samples=len(samples.dates),
+        last_date=str(samples.dates.max()) if len(samples.dates) else None,
+        fitted_at=datetime.now(UTC).isoformat(timespec="seconds"),
+    )
+
+
+def load_fit_state(path: Path = STATE_PATH) -> FitState | None:
+    """Load the last fit state (None if missing or unreadable)."""
+    try:
+        return FitState(**json.loads(path.read_text(encoding="utf-8")))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def save_fit_state(state: FitState, path: Path = STATE_PATH) -> None:
+    """Write to a temporary file and rename, so a crash never leaves half a state file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(asdict(state), indent=2), encoding="utf-8")
+    os.replace(tmp, path)
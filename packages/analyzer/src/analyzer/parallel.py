@@ -0,0 +1,167 @@
+"""Parallel transport sweeps for the cost-matrix objective.
+
+Every objective evaluation solves the same set of (target, actual) pairs
+under a new cost matrix, and the pairs are independent. The pairs are split
+into fixed-size chunks. Each chunk returns its partial cost sum and summed
+plan, and the partials are reduced in chunk order. The chunking does not
+depend on the number of workers, so the result is bit-for-bit the same for
+every backend and worker count.
+
+Backends:
+
+- serial: chunks in the calling thread
+- thread: a thread pool. Only the parts that release the GIL (the HiGHS
+  solve, NumPy kernels) overlap; linprog's input handling is Python.
+- process: a process pool. P and Q are placed in shared memory once, so an
+  evaluation only sends C and the chunk bounds to the workers.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Literal
+
+import numpy as np
+
+from analyzer.transport import Method, transport
+
+Backend = Literal["serial", "thread", "process"]
+
+# Pairs per chunk. Part of the reduction order, so changing it changes the
+# last bits of the result; the worker count does not.
+CHUNK_SIZE = 64
+
+# Worker-side views of the shared P and Q (process backend)
+_shared: dict[str, np.ndarray] = {}
+_segments: list[shared_memory.SharedMemory] = []
+
+
+def _solve_chunk(
+    P: np.ndarray,
+    Q: np.ndarray,
+    C: np.ndarray,
+    method: Method,
+    epsilon: float,
+) -> tuple[float, np.ndarray]:
+    result = transport(P, Q, C, method=method, epsilon=epsilon)
+    return float(result.cost.sum()), result.plan.sum(axis=0)
+
+
+def _attach(names: dict[str, tuple[str, tuple[int, ...]]]) -> None:
+    """Process pool initializer: map the shared arrays into this worker."""
+    for key, (name, shape) in names.items():
+        # Pool workers share the parent's resource tracker, so attaching here
+        # does not hand ownership to the worker; the parent unlinks in close()
+        segment = shared_memory.SharedMemory(name=name)
+        _segments.append(segment)
+        _shared[key] = np.ndarray(shape, dtype=np.float64, buffer=segment.buf)
+
+
+def _solve_shared_chunk(
+    start: int,
+    stop: int,
+    C: np.ndarray,
+    method: Method,
+    epsilon: float,
+) -> tuple[float, np.ndarray]:
+    return _solve_chunk(_shared["P"][start:stop], _shared["Q"][start:stop], C, method, epsilon)
+
+
+class TransportSweep:
+    """Sum of transport costs and plans over a fixed set of pairs.
+
+    Args:
+        P: Source distributions (B x n)
+        Q: Target distributions (B x m)
+        method: Transport solver, "exact" or "sinkhorn"
+        epsilon: Entropic regularization for "sinkhorn"
+        backend: "serial", "thread" or "process"
+        workers: Pool size (default: CPU count)
+    """
+
+    def __init__(
+        self,
+        P: np.ndarray,
+        Q: np.ndarray,
+        method: Method = "exact",
+        epsilon: float = 0.01,
+        backend: Backend = "serial",
+        workers: int | None = None,
+    ):
+        if backend not in ("serial", "thread", "process"):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.P = np.ascontiguousarray(P, dtype=np.float64)
+        self.Q = np.ascontiguousarray(Q, dtype=np.float64)
+        self.method = method
+        self.epsilon = epsilon
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.chunks = [
+            (start, min(start + CHUNK_SIZE, len(self.P)))
+            for start in range(0, len(self.P), CHUNK_SIZE)
+        ]
+        self._segments: list[shared_memory.SharedMemory] = []
+        self._executor: Executor | None = None
+
+        if backend == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        elif backend == "process":
+            names = {"P": self._share(self.P), "Q": self._share(self.Q)}
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_attach, initargs=(names,)
+            )
+
+    def _share(self, array: np.ndarray) -> tuple[str, tuple[int, ...]]:
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._segments.append(segment)
+        np.ndarray(array.shape, dtype=np.float64, buffer=segment.buf)[:] = array
+        return segment.name, array.shape
+
+    def __call__(self, C: np.ndarray) -> tuple[float, np.ndarray]:
+        """Total transport cost and summed plan under C."""
+        if self.backend == "serial":
+            partials = [
+                _solve_chunk(self.P[a:b], self.Q[a:b], C, self.method, self.epsilon)
+                for a, b in self.chunks
+            ]
+        elif self.backend == "thread":
+            assert self._executor is not None
+            partials = list(self._executor.map(
+                lambda chunk: _solve_chunk(
+                    self.P[chunk[0]:chunk[1]], self.Q[chunk[0]:chunk[1]],
+                    C, self.method, self.epsilon,
+                ),
+                self.chunks,
+            ))
+        else:
+            assert self._executor is not None
+            futures = [
+                self._executor.submit(_solve_shared_chunk, a, b, C, self.method, self.epsilon)
+                for a, b in self.chunks
+            ]
+            partials = [future.result() for future in futures]
+
+        # Reduce in chunk order so the sum does not depend on scheduling
+        cost = 0.0
+        plan = np.zeros((self.P.shape[1], self.Q.shape[1]))
+        for chunk_cost, chunk_plan in partials:
+            cost += chunk_cost
+            plan += chunk_plan
+        return cost, plan
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def __enter__(self) -> TransportSweep:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -0,0 +1,69 @@
+"""Token-budget-aware request batching for the embedding API."""
+
+from dataclasses import dataclass
+from typing import Sequence
+
+
+@dataclass
+class Batch:
+    """1リクエスト分のテキスト範囲 [start, end)"""
+    start: int
+    end: int
+    tokens: int
+    max_items: int
+    max_tokens: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+    @property
+    def item_fill(self) -> float:
+        """件数上限に対する充填率"""
+        return self.size / self.max_items
+
+    @property
+    def token_fill(self) -> float:
+        """トークン上限に対する充填率（単独で上限超過するテキストは1を超える）"""
+        return self.tokens / self.max_tokens
+
+
+def plan_batches(token_counts: Sequence[int], max_items: int, max_tokens: int) -> list[Batch]:
+    """
+    入力順を保ったままテキストをリクエストに詰める
+    各バッチは件数max_items以下かつ合計トークンmax_tokens以下
+    （1テキストだけでmax_tokensを超える場合はそのテキスト単独のバッチにする）
+    """
+    if max_items < 1 or max_tokens < 1:
+        raise ValueError("max_items and max_tokens must be >= 1")
+
+    batches: list[Batch] = []
+    start = 0
+    tokens = 0
+
+    for i, count in enumerate(token_counts):
+        if i > start and (i - start >= max_items or tokens + count > max_tokens):
+            batches.append(Batch(start, i, tokens, max_items, max_tokens))
+            start = i
+            tokens = 0
+        tokens += count
+
+    if start < len(token_counts):
+        batches.append(Batch(start, len(token_counts), tokens, max_items, max_tokens))
+
+    return batches
+
+
+def summarize_batches(batches: Sequence[Batch]) -> str:
+    """バッチ計画の充填率サマリ"""
+    if not batches:
+        return "0 batches"
+
+    token_fills = [b.token_fill for b in batches]
+    item_fills = [b.item_fill for b in batches]
+    return (
+        f"{len(batches)} batches, {sum(b.tokens for b in batches)} tokens "
+        f"(token fill avg {sum(token_fills) / len(batches):.0%}, "
+        f"min {min(token_fills):.0%}, max {max(token_fills):.0%}; "
+        f"item fill avg {sum(item_fills) / len(batches):.0%})"
+    )
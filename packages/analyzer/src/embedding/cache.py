@@ -0,0 +1,153 @@
+"""Content-addressed embedding cache keyed by (model, embedding text hash)."""
+
+import hashlib
+import io
+import sqlite3
+from pathlib import Path
+from typing import Mapping, Protocol, Sequence
+
+import numpy as np
+
+from .config import Config
+from .db import ConnectionPool
+from .pgcopy import encode_copy_binary
+from .types import Embedding
+
+# SQLiteのバインド変数上限（999）未満に抑える
+_SQLITE_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    """embedding用テキストのSHA256"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(Protocol):
+    """embeddingキャッシュのインターフェース"""
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> dict[str, Embedding]:
+        """キャッシュ済みのembeddingをhash→vectorで返す（ミスは含まない）"""
+        ...
+
+    def put_many(self, model: str, entries: Mapping[str, Embedding]) -> None:
+        """embeddingを保存（既存キーは上書きしない）"""
+        ...
+
+
+class TableEmbeddingCache:
+    """rag.embedding_cacheテーブルによるキャッシュ"""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> dict[str, Embedding]:
+        if not hashes:
+            return {}
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT text_hash, embedding::real[]
+                    FROM rag.embedding_cache
+                    WHERE model = %s AND text_hash = ANY(%s)
+                    """,
+                    (model, list(hashes))
+                )
+                rows = cur.fetchall()
+            conn.rollback()
+
+        return {row[0]: np.asarray(row[1], dtype=np.float32) for row in rows}
+
+    def put_many(self, model: str, entries: Mapping[str, Embedding]) -> None:
+        if not entries:
+            return
+
+        data = encode_copy_binary(
+            [(model, h, embedding) for h, embedding in entries.items()],
+            ("text", "text", "vector"),
+        )
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TEMP TABLE embedding_cache_staging (
+                        model text, text_hash text, embedding vector
+                    ) ON COMMIT DROP
+                    """
+                )
+                cur.copy_expert(
+                    "COPY embedding_cache_staging FROM STDIN WITH (FORMAT binary)",
+                    io.BytesIO(data),
+                )
+                cur.execute(
+                    """
+                    INSERT INTO rag.embedding_cache (model, text_hash, embedding)
+                    SELECT model, text_hash, embedding FROM embedding_cache_staging
+                    ON CONFLICT (model, text_hash) DO NOTHING
+                    """
+                )
+            conn.commit()
+
+
+class SqliteEmbeddingCache:
+    """ローカルSQLiteファイルによるキャッシュ（float32で保存）"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> dict[str, Embedding]:
+        found: dict[str, Embedding] = {}
+        for i in range(0, len(hashes), _SQLITE_CHUNK):
+            part = list(hashes[i : i + _SQLITE_CHUNK])
+            placeholders = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT text_hash, embedding FROM embedding_cache "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *part],
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, entries: Mapping[str, Embedding]) -> None:
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO embedding_cache (model, text_hash, embedding) VALUES (?, ?, ?)",
+            [
+                (model, h, np.asarray(embedding, dtype=np.float32).tobytes())
+                for h, embedding in entries.items()
+            ],
+        )
+        self._conn.commit()
+
+    def clear(self) -> None:
+        """全エントリを削除（実行チェックポイントとして使う場合の完了時）"""
+        self._conn.execute("DELETE FROM embedding_cache")
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def create_embedding_cache(config: Config, pool: ConnectionPool) -> EmbeddingCache | None:
+    """設定に応じたキャッシュを生成（"none"ならキャッシュしない）"""
+    if config.embedding_cache == "table":
+        return TableEmbeddingCache(pool)
+    if config.embedding_cache == "sqlite":
+        return SqliteEmbeddingCache(config.embedding_cache_path)
+    if config.embedding_cache == "none":
+        return None
+    raise ValueError(f"Unknown EMBEDDING_CACHE: {config.embedding_cache}")
@@ -1,17 +1,55 @@
 """Chunking logic for documents."""
 
 import re
+from bisect import bisect_left
+from functools import lru_cache
+
 import tiktoken
 
 from .types import Chunk, FrontmatterDict, RawDocument
 
-# トークン数推定用エンコーダ（概算）
-_encoder = tiktoken.get_encoding("cl100k_base")
+# 切り出したピースを単独でencodeした数は、境界をまたぐトークンの分だけ
+# ドキュメント全体のトークン位置から求めた数とずれる（1か所あたり数トークン）。
+# 概算がmax_tokens - RECOUNT_SLACKを超えるピースだけ数え直す
+RECOUNT_SLACK = 16
+
+
+@lru_cache(maxsize=1)
+def get_encoder() -> tiktoken.Encoding:
+    """トークン数推定用エンコーダ（概算）。初回利用時にロードする"""
+    return tiktoken.get_encoding("cl100k_base")
 
 
 def estimate_tokens(text: str) -> int:
     """トークン数を推定"""
-    return len(_encoder.encode(text))
+    return len(get_encoder().encode_ordinary(text))
+
+
+class TokenOffsets:
+    """
+    テキストを1回だけencodeし、各トークンの開始文字位置から
+    任意の文字範囲のトークン数を求める（範囲をまたぐトークンは開始位置側に数える）
+    """
+
+    def __init__(self, text: str):
+        encoder = get_encoder()
+        _, self.starts = encoder.decode_with_offsets(encoder.encode_ordinary(text))
+
+    def count(self, start: int, end: int) -> int:
+        """文字範囲[start, end)のトークン数"""
+        return bisect_left(self.starts, end) - bisect_left(self.starts, start)
+
+    def window_bounds(self, start: int, end: int, max_tokens: int) -> list[tuple[int, int, int]]:
+        """文字範囲[start, end)をmax_tokensトークンずつの窓に分割（開始, 終了, トークン数）"""
+        first = bisect_left(self.starts, start)
+        last = bisect_left(self.starts, end)
+        bounds: list[tuple[int, int, int]] = []
+        for i in range(first, last, max_tokens):
+            j = min(i + max_tokens, last)
+            window_start = start if i == first else self.starts[i]
+            window_end = end if j == last else self.starts[j]
+            bounds.append((window_start, window_end, j - i))
+        return bounds
 
 
 def extract_slug_from_filename(filename: str) -> str:
@@ -58,100 +96,199 @@ def get_context_previous(chunks: list[Chunk], current_index: int) -> str | None:
     return "。".join(sentences[-2:]) + "。"
 
 
-def split_by_h3(content: str, parent_heading: str, h2_heading: str, base_index: int) -> list[Chunk]:
-    """h3で再分割"""
-    chunks: list[Chunk] = []
-    current_h3: str | None = None
-    current_content: list[str] = []
+class _Document:
+    """行単位の分割とトークン数計算（ドキュメント全体を1回だけencode）"""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.lines = content.split("\n")
+        # line_starts[i]: i行目の開始文字位置（末尾に番兵）
+        self.line_starts = [0]
+        for line in self.lines:
+            self.line_starts.append(self.line_starts[-1] + len(line) + 1)
+        self.tokens = TokenOffsets(content)
+
+    def runs(self, line_ids: list[int]) -> list[tuple[int, int]]:
+        """行番号リストを連続区間[first, last)に分解"""
+        runs: list[tuple[int, int]] = []
+        for i in line_ids:
+            if runs and runs[-1][1] == i:
+                runs[-1] = (runs[-1][0], i + 1)
+            else:
+                runs.append((i, i + 1))
+        return runs
+
+    def count(self, line_ids: list[int]) -> int:
+        return sum(
+            self.tokens.count(self.line_starts[first], self.line_starts[last])
+            for first, last in self.runs(line_ids)
+        )
+
+    def text(self, line_ids: list[int]) -> str:
+        return "\n".join(self.lines[i] for i in line_ids).strip()
+
+
+# (heading, content, token_count)
+_Piece = tuple[str, str, int]
+
+
+def _split_section(doc: _Document, heading: str, line_ids: list[int], max_tokens: int) -> list[_Piece]:
+    """
+    上限を超えるセクションを h3 → 段落 → トークン窓 の順に分割
+    分割位置はドキュメント全体のトークン位置から決めるが、境界をまたぐトークン
+    （BPEの結合、CJKや絵文字のバイト列の途中で切れるトークン）があると切り出した
+    ピースを単独でencodeした数とずれるため、上限に近いピースだけ数え直して
+    max_tokensを超えるものは再分割する
+    """
+    pieces: list[_Piece] = []
+    for piece in _plan_section(doc, heading, line_ids, max_tokens):
+        sub_heading, content, tokens = piece
+        if tokens > max_tokens - RECOUNT_SLACK:
+            pieces.extend(_fit_piece(sub_heading, content, max_tokens))
+        else:
+            pieces.append(piece)
+    return pieces
 
-    for line in content.split("\n"):
+
+def _plan_section(doc: _Document, heading: str, line_ids: list[int], max_tokens: int) -> list[_Piece]:
+    """ドキュメント全体のトークン位置だけを使った分割（トークン数は概算）"""
+    tokens = doc.count(line_ids)
+    if tokens <= max_tokens:
+        return [(heading, doc.text(line_ids), tokens)]
+
+    print(f"  [WARN] Chunk exceeds {max_tokens} tokens ({tokens}): {heading}")
+
+    # h3で再分割（最初のh3より前の本文はh2見出しのまま残す）
+    groups: list[tuple[str, list[int]]] = [(heading, [])]
+    for i in line_ids:
+        line = doc.lines[i]
         if line.startswith("### "):
-            if current_h3 is not None:
-                chunks.append(Chunk(
-                    chunk_index=base_index + len(chunks),
-                    parent_heading=parent_heading,
-                    heading=f"{h2_heading} > {current_h3}",
-                    content="\n".join(current_content).strip(),
-                ))
-            current_h3 = line[4:].strip()
-            current_content = []
+            groups.append((f"{heading} > {line[4:].strip()}", []))
         else:
-            current_content.append(line)
+            groups[-1][1].append(i)
+
+    pieces: list[_Piece] = []
+    for sub_heading, sub_ids in groups:
+        if sub_ids:
+            pieces.extend(_split_paragraphs(doc, sub_heading, sub_ids, max_tokens))
+    return pieces
+
+
+def _split_paragraphs(doc: _Document, heading: str, line_ids: list[int], max_tokens: int) -> list[_Piece]:
+    """空行区切りの段落を上限まで詰め、1段落で超える場合はトークン窓で分割"""
+    tokens = doc.count(line_ids)
+    if tokens <= max_tokens:
+        return [(heading, doc.text(line_ids), tokens)]
+
+    paragraphs: list[list[int]] = [[]]
+    for i in line_ids:
+        paragraphs[-1].append(i)
+        if not doc.lines[i].strip():
+            paragraphs.append([])
+
+    pieces: list[_Piece] = []
+    current: list[int] = []
+    current_tokens = 0
+
+    for para in paragraphs:
+        if not para:
+            continue
+        para_tokens = doc.count(para)
+
+        if current and current_tokens + para_tokens > max_tokens:
+            pieces.append((heading, doc.text(current), current_tokens))
+            current, current_tokens = [], 0
+
+        if para_tokens > max_tokens:
+            pieces.extend(_split_windows(doc, heading, para, max_tokens))
+        else:
+            current.extend(para)
+            current_tokens += para_tokens
 
-    # 最後のチャンク
-    if current_h3 is not None:
-        chunks.append(Chunk(
-            chunk_index=base_index + len(chunks),
-            parent_heading=parent_heading,
-            heading=f"{h2_heading} > {current_h3}",
-            content="\n".join(current_content).strip(),
-        ))
-    elif current_content:
-        # h3がない場合はそのまま
-        chunks.append(Chunk(
-            chunk_index=base_index,
-            parent_heading=parent_heading,
-            heading=h2_heading,
-            content="\n".join(current_content).strip(),
-        ))
+    if current:
+        pieces.append((heading, doc.text(current), current_tokens))
 
-    return chunks
+    return pieces
+
+
+def _split_windows(doc: _Document, heading: str, line_ids: list[int], max_tokens: int) -> list[_Piece]:
+    """トークン位置でmax_tokensごとに機械的に分割（最終手段）"""
+    pieces: list[_Piece] = []
+    for first, last in doc.runs(line_ids):
+        start = doc.line_starts[first]
+        end = doc.line_starts[last] - 1  # 末尾の改行を含めない
+        for window_start, window_end, tokens in doc.tokens.window_bounds(start, end, max_tokens):
+            pieces.append((heading, doc.content[window_start:window_end].strip(), tokens))
+    return pieces
+
+
+def _fit_piece(heading: str, content: str, max_tokens: int) -> list[_Piece]:
+    """
+    ピースを単独でencodeし、max_tokensを超えていればピース自身のトークン位置で分割し直す
+    切り出した窓も数え直し、超えていれば超過分だけ窓を縮める
+    """
+    tokens = estimate_tokens(content)
+    if tokens <= max_tokens:
+        return [(heading, content, tokens)]
+
+    starts = TokenOffsets(content).starts
+    pieces: list[_Piece] = []
+    i = 0
+    while i < len(starts):
+        j = min(i + max_tokens, len(starts))
+        while True:
+            end = starts[j] if j < len(starts) else len(content)
+            window = content[starts[i]:end].strip()
+            tokens = estimate_tokens(window)
+            if tokens <= max_tokens or j - i == 1:
+                break
+            j = max(i + 1, j - (tokens - max_tokens))
+        if window:
+            pieces.append((heading, window, tokens))
+        i = j
+    return pieces
 
 
 def chunk_document(doc: RawDocument, max_tokens: int = 32000) -> list[Chunk]:
     """
     ドキュメントを##（h2）でチャンキング
-    32K超過時は###で再分割
+    max_tokens超過時は ###（h3）→ 段落 → トークン窓 の順に再分割する
+    分割位置とtoken_countはドキュメント全体を1回encodeした結果から求め、
+    上限に近いチャンクだけ本文を単独でencodeし直す（token_countの誤差はRECOUNT_SLACK未満）
     """
-    raw_chunks: list[tuple[str, str, str]] = []  # (parent_heading, heading, content)
+    document = _Document(doc.content)
+    sections: list[tuple[str, str, list[int]]] = []  # (parent_heading, heading, line_ids)
     current_h1: str | None = None
     current_heading: str | None = None
-    current_content: list[str] = []
-
-    lines = doc.content.split("\n")
+    current_lines: list[int] = []
 
-    for line in lines:
+    for i, line in enumerate(document.lines):
         if line.startswith("# "):
             current_h1 = line[2:].strip()
         elif line.startswith("## "):
             if current_heading is not None:
                 parent = get_parent_heading(current_h1, doc.frontmatter, doc.file_path)
-                raw_chunks.append((parent, current_heading, "\n".join(current_content).strip()))
+                sections.append((parent, current_heading, current_lines))
             current_heading = line[3:].strip()
-            current_content = []
+            current_lines = []
         elif current_heading is not None:
-            current_content.append(line)
+            current_lines.append(i)
 
     # 最後のチャンク
     if current_heading is not None:
         parent = get_parent_heading(current_h1, doc.frontmatter, doc.file_path)
-        raw_chunks.append((parent, current_heading, "\n".join(current_content).strip()))
+        sections.append((parent, current_heading, current_lines))
 
-    # トークン数チェックと再分割
     chunks: list[Chunk] = []
-    for parent_heading, heading, content in raw_chunks:
-        tokens = estimate_tokens(content)
-
-        if tokens <= max_tokens:
+    for parent_heading, heading, line_ids in sections:
+        for sub_heading, content, tokens in _split_section(document, heading, line_ids, max_tokens):
             chunks.append(Chunk(
                 chunk_index=len(chunks),
                 parent_heading=parent_heading,
-                heading=heading,
+                heading=sub_heading,
                 content=content,
+                token_count=tokens,
             ))
-        else:
-            # h3で再分割
-            print(f"  [WARN] Chunk exceeds {max_tokens} tokens ({tokens}): {heading}")
-            sub_chunks = split_by_h3(content, parent_heading, heading, len(chunks))
-
-            if len(sub_chunks) == 1 and estimate_tokens(sub_chunks[0].content) > max_tokens:
-                # h3でも分割できない場合は警告
-                print(f"  [ERROR] Cannot split chunk: {heading} ({tokens} tokens)")
-                print(f"          Manual intervention required")
-
-            for sub_chunk in sub_chunks:
-                sub_chunk.chunk_index = len(chunks)
-                chunks.append(sub_chunk)
 
     # context_previousを付加
     for i, chunk in enumerate(chunks):
@@ -183,6 +320,15 @@ def build_embedding_text(chunk: Chunk, frontmatter: FrontmatterDict) -> str:
     return "\n\n".join(parts)
 
 
+def estimate_embedding_tokens(chunk: Chunk, text: str) -> int:
+    """
+    build_embedding_textの出力のトークン数を推定
+    本文はチャンキング時に数えたtoken_countを再利用し、メタデータ部分だけを数える
+    """
+    header = text[: len(text) - len(chunk.content)]
+    return chunk.token_count + estimate_tokens(header)
+
+
 def filter_empty_chunks(chunks: list[Chunk]) -> list[Chunk]:
     """空のチャンクを除外"""
     return [c for c in chunks if c.content.strip()]
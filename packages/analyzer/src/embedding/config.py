@@ -3,7 +3,7 @@
 import os
 from dataclasses import dataclass
 
-import psycopg2
+from .db import ConnectionPool, get_pool
 
 
 @dataclass
@@ -11,23 +11,48 @@ class Config:
     database_url: str
     voyage_api_key: str
     batch_size: int = 128
+    max_batch_tokens: int = 800_000  # 1リクエストの合計トークン上限（推定値ベース）
     max_tokens: int = 32000  # Voyage AI voyage-3-liteの制限
+    pool_size: int = 4
+    max_concurrency: int = 4  # 並行して送信するバッチ数（1なら逐次）
+    requests_per_minute: int = 2000
+    tokens_per_minute: int = 16_000_000
+    embedding_cache: str = "table"  # table | sqlite | none
+    embedding_cache_path: str = ".cache/embeddings.sqlite3"
+    chunk_workers: int = 1  # チャンキングのプロセス数（1なら逐次）
+    incremental: bool = True  # 保存済みチャンクとの差分だけを書き込む
+    stream: bool = False  # ウィンドウ単位で読み込み・embedding・コミットする
+    window_docs: int = 50
+    window_tokens: int = 200_000
+    lexical_index_path: str = ""  # 空ならBM25インデックスを更新しない
+    near_dup_threshold: float = 0.0  # 本文の推定Jaccard類似度がこれ以上ならembeddingを共有（0で無効）
+    checkpoint_path: str = ".cache/embedding-checkpoint.sqlite3"  # 空なら途中結果を保存しない
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 60.0
+    work_queue: bool = False  # ドキュメントをリースして処理する（複数ワーカーを同時に起動できる）
+    worker_id: str = ""  # 空ならホスト名-PID
+    claim_size: int = 32  # 1回にリースするドキュメント数
+    lease_seconds: float = 300.0
+    watch: bool = False  # LISTEN/NOTIFYで変更を待ち受けるデーモンとして動く
+    watch_debounce_seconds: float = 2.0
+    watch_max_delay_seconds: float = 30.0
+    watch_poll_seconds: float = 300.0  # 通知の取りこぼしを拾う全件チェックの間隔
+    metrics_path: str = ""  # スパン・実行サマリーを追記するJSON Linesファイル（空で無効）
+    metrics_textfile: str = ""  # node_exporterのtextfile collector用の.promファイル（空で無効）
 
 
-def _get_voyage_api_key_from_vault(database_url: str) -> str:
-    """VaultからVoyage API Keyを取得"""
-    conn = psycopg2.connect(database_url)
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT decrypted_secret::jsonb->>'api_key' FROM vault.decrypted_secrets WHERE name = 'voyage'"
-        )
-        row = cur.fetchone()
-        if not row or not row[0]:
-            raise ValueError("VOYAGE_API_KEY not found in vault")
-        return row[0]
-    finally:
-        conn.close()
+def _get_voyage_api_key_from_vault(pool: ConnectionPool) -> str:
+    """VaultからVoyage API Keyを取得（パイプラインと同じ接続プールを使用）"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT decrypted_secret::jsonb->>'api_key' FROM vault.decrypted_secrets WHERE name = 'voyage'"
+            )
+            row = cur.fetchone()
+        conn.rollback()
+    if not row or not row[0]:
+        raise ValueError("VOYAGE_API_KEY not found in vault")
+    return row[0]
 
 
 def load_config() -> Config:
@@ -36,13 +61,58 @@ def load_config() -> Config:
     if not database_url:
         raise ValueError("DIRECT_DATABASE_URL is required")
 
+    work_queue = os.environ.get("EMBED_WORK_QUEUE", "") in ("1", "true")
+    watch = os.environ.get("EMBED_WATCH", "") in ("1", "true")
+    # watchモードはリースを取らずに通知されたドキュメントを処理するため、
+    # ワークキューモードの保存（リース保持の確認）と組み合わせられない
+    if work_queue and watch:
+        raise ValueError("EMBED_WATCH and EMBED_WORK_QUEUE cannot be used together")
+    # 各ワーカーが自分の処理したドキュメントだけを反映したBM25インデックスで同じファイルを
+    # 置き換えるため、最後に保存したワーカー以外の更新が失われる（全ワーカーの終了後に作り直す）
+    lexical_index_path = os.environ.get("LEXICAL_INDEX_PATH", "")
+    if work_queue and lexical_index_path:
+        raise ValueError("LEXICAL_INDEX_PATH and EMBED_WORK_QUEUE cannot be used together")
+
+    pool_size = int(os.environ.get("DB_POOL_SIZE", "4"))
+
     # 環境変数にあればそれを使用、なければVaultから取得
     voyage_api_key = os.environ.get("VOYAGE_API_KEY")
     if not voyage_api_key:
-        voyage_api_key = _get_voyage_api_key_from_vault(database_url)
+        voyage_api_key = _get_voyage_api_key_from_vault(get_pool(database_url, pool_size))
 
     return Config(
         database_url=database_url,
         voyage_api_key=voyage_api_key,
         batch_size=int(os.environ.get("BATCH_SIZE", "128")),
+        max_batch_tokens=int(os.environ.get("MAX_BATCH_TOKENS", "800000")),
+        pool_size=pool_size,
+        max_concurrency=int(os.environ.get("EMBED_CONCURRENCY", "4")),
+        requests_per_minute=int(os.environ.get("VOYAGE_RPM", "2000")),
+        tokens_per_minute=int(os.environ.get("VOYAGE_TPM", "16000000")),
+        embedding_cache=os.environ.get("EMBEDDING_CACHE", "table"),
+        embedding_cache_path=os.environ.get(
+            "EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3"
+        ),
+        chunk_workers=int(os.environ.get("CHUNK_WORKERS", "1")),
+        incremental=os.environ.get("EMBED_INCREMENTAL", "1") in ("1", "true"),
+        stream=os.environ.get("EMBED_STREAM", "") in ("1", "true"),
+        window_docs=int(os.environ.get("EMBED_WINDOW_DOCS", "50")),
+        window_tokens=int(os.environ.get("EMBED_WINDOW_TOKENS", "200000")),
+        lexical_index_path=lexical_index_path,
+        near_dup_threshold=float(os.environ.get("EMBED_NEAR_DUP_THRESHOLD", "0")),
+        checkpoint_path=os.environ.get(
+            "EMBED_CHECKPOINT_PATH", ".cache/embedding-checkpoint.sqlite3"
+        ),
+        breaker_failures=int(os.environ.get("CIRCUIT_BREAKER_FAILURES", "5")),
+        breaker_reset_seconds=float(os.environ.get("CIRCUIT_BREAKER_RESET_SECONDS", "60")),
+        work_queue=work_queue,
+        worker_id=os.environ.get("EMBED_WORKER_ID", ""),
+        claim_size=int(os.environ.get("EMBED_CLAIM_SIZE", "32")),
+        lease_seconds=float(os.environ.get("EMBED_LEASE_SECONDS", "300")),
+        watch=watch,
+        watch_debounce_seconds=float(os.environ.get("EMBED_WATCH_DEBOUNCE_SECONDS", "2")),
+        watch_max_delay_seconds=float(os.environ.get("EMBED_WATCH_MAX_DELAY_SECONDS", "30")),
+        watch_poll_seconds=float(os.environ.get("EMBED_WATCH_POLL_SECONDS", "300")),
+        metrics_path=os.environ.get("EMBED_METRICS_PATH", ""),
+        metrics_textfile=os.environ.get("EMBED_METRICS_TEXTFILE", ""),
     )
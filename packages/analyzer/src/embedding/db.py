@@ -1,11 +1,266 @@
 """Database operations for embedding module."""
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import io
+import threading
 from contextlib import contextmanager
-from typing import Generator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Generator, Iterator, Sequence
+
+import numpy as np
+import numpy.typing as npt
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import RealDictCursor, execute_values
+
+from .pgcopy import encode_copy_binary
+from .types import (
+    ChunkWithEmbedding,
+    DocumentWrite,
+    Embedding,
+    EmbeddingModel,
+    ExistingChunk,
+    IndexedChunk,
+    RawDocument,
+    ShadowChunk,
+)
+
+# embeddingはfloat32のままpgvectorのバイナリ形式で送る（テキスト化しない）
+# embedding_bitsはsearch_chunks_quantizedの候補検索用の符号（NOT NULLなので常に書く）
+_COPY_CHUNKS_SQL = """
+    COPY rag.chunks
+        (document_id, chunk_index, parent_heading, heading, content, embedding, text_hash,
+         embedding_bits)
+    FROM STDIN WITH (FORMAT binary)
+"""
+_CHUNK_COLUMN_KINDS = ("uuid", "int4", "text", "text", "text", "vector", "text", "varbit")
+
+# 上書き対象の行は一時テーブルにバイナリCOPYしてからUPDATEする
+_CREATE_CHUNK_UPDATES_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS chunk_updates (
+        id uuid,
+        parent_heading text,
+        heading text,
+        content text,
+        embedding vector,
+        text_hash text,
+        embedding_bits varbit
+    ) ON COMMIT DELETE ROWS
+"""
+_COPY_CHUNK_UPDATES_SQL = "COPY chunk_updates FROM STDIN WITH (FORMAT binary)"
+_CHUNK_UPDATE_COLUMN_KINDS = ("uuid", "text", "text", "text", "vector", "text", "varbit")
+_UPDATE_CHUNKS_SQL = """
+    UPDATE rag.chunks AS c SET
+        parent_heading = u.parent_heading,
+        heading = u.heading,
+        content = u.content,
+        embedding = u.embedding,
+        text_hash = u.text_hash,
+        embedding_bits = u.embedding_bits
+    FROM chunk_updates AS u
+    WHERE c.id = u.id
+"""
+
+# UNIQUE (document_id, chunk_index) に抵触しないよう、一度負の値に退避してから確定する
+_SHIFT_CHUNKS_SQL = """
+    UPDATE rag.chunks AS c SET chunk_index = -1 - v.chunk_index
+    FROM (VALUES %s) AS v (id, chunk_index)
+    WHERE c.id = v.id::uuid
+"""
+
+_UPSERT_EMBEDDING_STATE_SQL = """
+    INSERT INTO rag.embedding_state (document_id, content_hash, embedded_at)
+    VALUES %s
+    ON CONFLICT (document_id) DO UPDATE SET
+        content_hash = EXCLUDED.content_hash,
+        embedded_at = EXCLUDED.embedded_at
+"""
+_UPSERT_EMBEDDING_STATE_TEMPLATE = "(%s, %s, NOW())"
+
+# frontmatter.tagsが配列でないドキュメントはタグなしとして扱う
+_INDEXED_CHUNKS_SQL = """
+    SELECT
+        c.id,
+        c.document_id,
+        c.chunk_index,
+        d.frontmatter->>'title' AS title,
+        c.heading,
+        c.content,
+        d.file_path,
+        CASE WHEN jsonb_typeof(d.frontmatter->'tags') = 'array'
+            THEN ARRAY(SELECT jsonb_array_elements_text(d.frontmatter->'tags'))
+            ELSE '{}'::text[]
+        END AS tags,
+        c.embedding::real[] AS embedding,
+        s.embedded_at
+    FROM rag.chunks c
+    JOIN raw.github_contents__documents d ON c.document_id = d.id
+    JOIN rag.embedding_state s ON c.document_id = s.document_id
+    WHERE %(since)s::timestamptz IS NULL OR s.embedded_at > %(since)s::timestamptz
+    ORDER BY c.document_id, c.chunk_index
+"""
+
+# embeddingが必要でリースされていない（または期限切れの）ドキュメントをリースする
+# 並行するワーカーがロック中の行は飛ばし、スナップショット後に他のワーカーがリースした行は
+# ON CONFLICTのWHEREで弾く（RETURNINGに出た行だけが自分のリース）
+_CLAIM_DOCUMENTS_SQL = """
+    WITH candidates AS (
+        SELECT d.id, d.content_hash
+        FROM raw.github_contents__documents d
+        LEFT JOIN rag.embedding_state es ON d.id = es.document_id
+        LEFT JOIN rag.embedding_leases l ON d.id = l.document_id
+        WHERE
+            (es.document_id IS NULL OR es.content_hash != d.content_hash)
+            AND (l.document_id IS NULL OR l.leased_until < NOW())
+            AND d.id NOT IN (SELECT id FROM get_superseded_document_ids())
+        ORDER BY d.id
+        LIMIT %(limit)s
+        FOR NO KEY UPDATE OF d SKIP LOCKED
+    ),
+    claimed AS (
+        INSERT INTO rag.embedding_leases (document_id, content_hash, worker_id, leased_until)
+        SELECT id, content_hash, %(worker_id)s, NOW() + make_interval(secs => %(lease_seconds)s)
+        FROM candidates
+        ON CONFLICT (document_id) DO UPDATE SET
+            content_hash = EXCLUDED.content_hash,
+            worker_id = EXCLUDED.worker_id,
+            leased_until = EXCLUDED.leased_until,
+            attempts = CASE
+                WHEN rag.embedding_leases.content_hash = EXCLUDED.content_hash
+                THEN rag.embedding_leases.attempts + 1
+                ELSE 1
+            END,
+            claimed_at = NOW()
+        WHERE rag.embedding_leases.leased_until < NOW()
+        RETURNING document_id
+    )
+    SELECT d.id, d.file_path, d.frontmatter, d.content, d.content_hash
+    FROM claimed c
+    JOIN raw.github_contents__documents d ON c.document_id = d.id
+    ORDER BY d.id
+"""
+
+
+_EMBEDDING_MODEL_COLUMNS = """
+    model, dimensions, output_dimension, status, last_document_id, chunks_embedded, tokens_used
+"""
+
+# モデル移行: 新モデルのembeddingはembedding_nextに書き、どのテキストから作ったかをembedding_next_hashに残す
+_COPY_SHADOW_SQL = "COPY shadow_updates FROM STDIN WITH (FORMAT binary)"
+_SHADOW_COLUMN_KINDS = ("uuid", "text", "vector", "varbit")
+_UPDATE_SHADOW_SQL = """
+    UPDATE rag.chunks AS c SET
+        embedding_next = u.embedding,
+        embedding_next_hash = u.text_hash,
+        embedding_next_bits = u.embedding_bits,
+        text_hash = COALESCE(c.text_hash, u.text_hash)
+    FROM shadow_updates u
+    WHERE c.id = u.id AND (c.text_hash IS NULL OR c.text_hash = u.text_hash)
+"""
+
+# チャンクが最新のcontent_hashから作られているドキュメントだけを移行対象にする
+# （embedding待ちのドキュメントは通常のパイプラインで書き直された後にcatch-upで拾う）
+_CURRENT_DOCUMENTS_SQL = """
+    SELECT d.id, d.file_path, d.frontmatter, d.content, d.content_hash
+    FROM raw.github_contents__documents d
+    JOIN rag.embedding_state s ON d.id = s.document_id AND d.content_hash = s.content_hash
+"""
+
+_SHADOW_INDEX = "chunks_embedding_next_idx"
+# embedding_bitsのHNSWはbit(次元数)へのキャストに張る（search_chunks_quantizedも同じ式で並べる）
+_SHADOW_BITS_INDEX = "chunks_embedding_next_bits_idx"
+# 検証済みのこのCHECKがあれば、切り替え時のSET NOT NULLはrag.chunksを読まずに済む
+_SHADOW_BITS_CHECK = "chunks_embedding_next_bits_not_null"
+
+
+class LeaseLostError(Exception):
+    """リースが期限切れで他のワーカーに取られたため保存しなかった"""
+
+
+class EmbeddingModelChangedError(Exception):
+    """書き込み中にrag.chunks.embeddingのモデルが切り替わったため保存しなかった"""
+
+
+def _to_embedding_model(row: Sequence[Any]) -> EmbeddingModel:
+    return EmbeddingModel(
+        model=row[0],
+        dimensions=row[1],
+        output_dimension=row[2],
+        status=row[3],
+        last_document_id=str(row[4]) if row[4] is not None else None,
+        chunks_embedded=row[5],
+        tokens_used=row[6],
+    )
+
+
+def binary_codes(embedding: Embedding) -> npt.NDArray[np.bool_]:
+    """正の成分を1とするビット列（pgvectorのbinary_quantizeと同じ）"""
+    return np.asarray(embedding) > 0
+
+
+def chunk_rows(document_id: str, chunks: Sequence[ChunkWithEmbedding]) -> list[tuple]:
+    """rag.chunksへ挿入する行タプルを生成"""
+    return [
+        (
+            document_id,
+            chunk.chunk_index,
+            chunk.parent_heading,
+            chunk.heading,
+            chunk.content,
+            chunk.embedding,
+            chunk.text_hash,
+            binary_codes(chunk.embedding),
+        )
+        for chunk in chunks
+    ]
+
+
+def insert_chunk_rows(cur: psycopg2.extensions.cursor, rows: Sequence[tuple]) -> int:
+    """チャンク行をバイナリCOPYで1回で挿入し、送信バイト数を返す"""
+    if not rows:
+        return 0
+
+    data = encode_copy_binary(rows, _CHUNK_COLUMN_KINDS)
+    cur.copy_expert(_COPY_CHUNKS_SQL, io.BytesIO(data))
+    return len(data)
+
+
+def update_chunk_rows(cur: psycopg2.extensions.cursor, rows: Sequence[tuple]) -> int:
+    """(id, parent_heading, heading, content, embedding, text_hash, embedding_bits)で既存行を上書き"""
+    if not rows:
+        return 0
+
+    cur.execute(_CREATE_CHUNK_UPDATES_SQL)
+    cur.execute("TRUNCATE chunk_updates")
+    data = encode_copy_binary(rows, _CHUNK_UPDATE_COLUMN_KINDS)
+    cur.copy_expert(_COPY_CHUNK_UPDATES_SQL, io.BytesIO(data))
+    cur.execute(_UPDATE_CHUNKS_SQL)
+    return len(data)
 
-from .types import ChunkWithEmbedding, RawDocument
+
+def _to_indexed_chunk(row: dict[str, Any]) -> IndexedChunk:
+    return IndexedChunk(
+        id=str(row["id"]),
+        document_id=str(row["document_id"]),
+        chunk_index=row["chunk_index"],
+        title=row["title"],
+        heading=row["heading"],
+        content=row["content"],
+        file_path=row["file_path"],
+        tags=row["tags"],
+        embedding=np.asarray(row["embedding"], dtype=np.float32),
+        embedded_at=row["embedded_at"],
+    )
+
+
+def _to_raw_document(row: dict[str, Any]) -> RawDocument:
+    return RawDocument(
+        id=str(row["id"]),
+        file_path=row["file_path"],
+        frontmatter=row["frontmatter"] or {},
+        content=row["content"],
+        content_hash=row["content_hash"],
+    )
 
 
 @contextmanager
@@ -18,33 +273,711 @@ def get_connection(database_url: str) -> Generator[psycopg2.extensions.connectio
         conn.close()
 
 
+@dataclass
+class PoolStats:
+    """接続プールの統計"""
+    hits: int = 0  # アイドル接続を再利用した回数
+    misses: int = 0  # 新規に接続を確立した回数
+    discarded: int = 0  # 切断済みなどで破棄した接続数
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ConnectionPool:
+    """
+    psycopg2接続プール
+    同時に貸し出す接続数をsizeで制限し、返却された接続を再利用する
+    """
+
+    def __init__(self, database_url: str, size: int = 4):
+        if size < 1:
+            raise ValueError("pool size must be >= 1")
+        self.database_url = database_url
+        self.size = size
+        self.stats = PoolStats()
+        self._idle: list[psycopg2.extensions.connection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self) -> Generator[psycopg2.extensions.connection, None, None]:
+        """接続を借りて、ブロック終了時にプールへ返却"""
+        self._slots.acquire()
+        try:
+            conn = self._acquire()
+            try:
+                yield conn
+            finally:
+                self._release(conn)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """アイドル接続をすべて閉じる"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _acquire(self) -> psycopg2.extensions.connection:
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    self.stats.hits += 1
+                    return conn
+                self.stats.discarded += 1
+            self.stats.misses += 1
+        return psycopg2.connect(self.database_url)
+
+    def _release(self, conn: psycopg2.extensions.connection) -> None:
+        # 未完了のトランザクションを次の利用者に持ち越さない
+        if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+
+        with self._lock:
+            if conn.closed:
+                self.stats.discarded += 1
+            else:
+                self._idle.append(conn)
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database_url: str, size: int = 4) -> ConnectionPool:
+    """
+    database_urlごとに共有される接続プールを取得
+    既に作成済みの場合はsizeを無視して既存のプールを返す
+    """
+    with _pools_lock:
+        pool = _pools.get(database_url)
+        if pool is None:
+            pool = ConnectionPool(database_url, size)
+            _pools[database_url] = pool
+        return pool
+
+
 class DocsRepository:
     """PostgreSQLドキュメントリポジトリ"""
 
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, pool: ConnectionPool | None = None):
         self.database_url = database_url
+        self.pool = pool or get_pool(database_url)
+        self._local = threading.local()
+
+    @contextmanager
+    def session(self) -> Generator[None, None, None]:
+        """
+        Unit of work: ブロック内のリポジトリ操作を1接続・1トランザクションにまとめる
+        正常終了でcommit、例外でrollback。ネストした場合は外側のセッションに合流する
+        """
+        if getattr(self._local, "conn", None) is not None:
+            yield
+            return
+
+        with self.pool.connection() as conn:
+            self._local.conn = conn
+            try:
+                yield
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._local.conn = None
+
+    @contextmanager
+    def _transaction(self) -> Generator[psycopg2.extensions.connection, None, None]:
+        """
+        1操作分のトランザクション
+        セッション中はその接続上のSAVEPOINTとして実行し、失敗時はその操作だけ巻き戻す
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with conn.cursor() as cur:
+                cur.execute("SAVEPOINT repository_op")
+            try:
+                yield conn
+            except Exception:
+                with conn.cursor() as cur:
+                    cur.execute("ROLLBACK TO SAVEPOINT repository_op")
+                raise
+            with conn.cursor() as cur:
+                cur.execute("RELEASE SAVEPOINT repository_op")
+            return
+
+        with self.pool.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
 
     def get_documents_needing_embedding(self) -> list[RawDocument]:
         """embeddingが必要なドキュメントを取得"""
-        with get_connection(self.database_url) as conn:
+        with self._transaction() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("SELECT * FROM get_documents_needing_embedding()")
                 rows = cur.fetchall()
 
-        return [
-            RawDocument(
-                id=str(row["id"]),
-                file_path=row["file_path"],
-                frontmatter=row["frontmatter"] or {},
-                content=row["content"],
-                content_hash=row["content_hash"],
+        return [_to_raw_document(row) for row in rows]
+
+    def get_documents_needing_embedding_by_ids(
+        self,
+        document_ids: Sequence[str],
+    ) -> list[RawDocument]:
+        """指定したドキュメントのうちembeddingが必要なもの（通知を受けたドキュメント用）"""
+        if not document_ids:
+            return []
+
+        with self._transaction() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """
+                    SELECT d.id, d.file_path, d.frontmatter, d.content, d.content_hash
+                    FROM raw.github_contents__documents d
+                    LEFT JOIN rag.embedding_state es ON d.id = es.document_id
+                    WHERE
+                        d.id = ANY(%s::uuid[])
+                        AND (es.document_id IS NULL OR es.content_hash != d.content_hash)
+                    """,
+                    (list(document_ids),)
+                )
+                rows = cur.fetchall()
+
+        return [_to_raw_document(row) for row in rows]
+
+    def iter_documents_needing_embedding(self, fetch_size: int = 100) -> Iterator[RawDocument]:
+        """
+        embeddingが必要なドキュメントをサーバーサイドカーソルで逐次取得
+        イテレーション中はプールの接続を1本占有する
+        """
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor(
+                    name="documents_needing_embedding", cursor_factory=RealDictCursor
+                ) as cur:
+                    cur.itersize = fetch_size
+                    cur.execute("SELECT * FROM get_documents_needing_embedding()")
+                    for row in cur:
+                        yield _to_raw_document(row)
+            finally:
+                conn.rollback()
+
+    def iter_indexed_chunks(
+        self,
+        since: datetime | None = None,
+        fetch_size: int = 1000,
+    ) -> Iterator[IndexedChunk]:
+        """
+        embedding済みチャンクをサーバーサイドカーソルで逐次取得（ドキュメント・chunk_index順）
+        sinceを指定するとembedded_atがそれより新しいドキュメントのチャンクだけを返す
+        """
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor(name="indexed_chunks", cursor_factory=RealDictCursor) as cur:
+                    cur.itersize = fetch_size
+                    cur.execute(_INDEXED_CHUNKS_SQL, {"since": since})
+                    for row in cur:
+                        yield _to_indexed_chunk(row)
+            finally:
+                conn.rollback()
+
+    def claim_documents(
+        self,
+        worker_id: str,
+        limit: int,
+        lease_seconds: float,
+    ) -> list[RawDocument]:
+        """
+        embeddingが必要なドキュメントを最大limit件リースして返す
+        他のワーカーがリース中のドキュメントは返さない（期限切れのリースは取り直す）
+        """
+        with self._transaction() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    _CLAIM_DOCUMENTS_SQL,
+                    {"worker_id": worker_id, "limit": limit, "lease_seconds": lease_seconds},
+                )
+                rows = cur.fetchall()
+
+        return [_to_raw_document(row) for row in rows]
+
+    def extend_leases(
+        self,
+        worker_id: str,
+        document_ids: Sequence[str],
+        lease_seconds: float,
+    ) -> set[str]:
+        """リースの期限を延ばし、まだ自分が保持しているドキュメントIDを返す（ハートビート）"""
+        if not document_ids:
+            return set()
+
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE rag.embedding_leases
+                    SET leased_until = NOW() + make_interval(secs => %s)
+                    WHERE worker_id = %s AND document_id = ANY(%s::uuid[])
+                    RETURNING document_id
+                    """,
+                    (lease_seconds, worker_id, list(document_ids))
+                )
+                rows = cur.fetchall()
+
+        return {str(row[0]) for row in rows}
+
+    def release_leases(self, worker_id: str, document_ids: Sequence[str]) -> None:
+        """処理しないまま手放すリースを削除（他のワーカーがすぐに取れるようにする）"""
+        if not document_ids:
+            return
+
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM rag.embedding_leases "
+                    "WHERE worker_id = %s AND document_id = ANY(%s::uuid[])",
+                    (worker_id, list(document_ids))
+                )
+
+    def now(self) -> datetime:
+        """DBサーバーの現在時刻（embedded_atと同じ時計で比較するため）"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT clock_timestamp()")
+                row = cur.fetchone()
+
+        return row[0]
+
+    def get_freshness_lags(self, since: datetime) -> list[float]:
+        """
+        since以降にembeddingしたドキュメントの鮮度遅延（取得されてからembeddingされるまでの秒数）
+        どちらの時刻もDBサーバーの時計なので、クライアントとの時計のずれは影響しない
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT EXTRACT(EPOCH FROM s.embedded_at - d.fetched_at)::float8
+                    FROM rag.embedding_state s
+                    JOIN raw.github_contents__documents d ON s.document_id = d.id
+                    WHERE s.embedded_at >= %s AND s.content_hash = d.content_hash
+                    """,
+                    (since,)
+                )
+                rows = cur.fetchall()
+
+        return [max(0.0, row[0]) for row in rows]
+
+    def get_active_embedding_model(self) -> EmbeddingModel | None:
+        """rag.chunks.embeddingが保持しているモデル"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT {_EMBEDDING_MODEL_COLUMNS} FROM rag.embedding_models "
+                    "WHERE status = 'active'"
+                )
+                row = cur.fetchone()
+
+        return _to_embedding_model(row) if row else None
+
+    def get_embedding_models(self) -> list[EmbeddingModel]:
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT {_EMBEDDING_MODEL_COLUMNS} FROM rag.embedding_models "
+                    "ORDER BY created_at"
+                )
+                rows = cur.fetchall()
+
+        return [_to_embedding_model(row) for row in rows]
+
+    def start_model_migration(
+        self,
+        model: str,
+        dimensions: int,
+        output_dimension: int | None = None,
+    ) -> EmbeddingModel:
+        """
+        モデル移行を開始（移行中なら既存のチェックポイントを返す）し、shadow列を用意する
+        同時に移行できるモデルは1つだけ
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT {_EMBEDDING_MODEL_COLUMNS} FROM rag.embedding_models "
+                    "WHERE model = %s OR status = 'migrating' FOR UPDATE",
+                    (model,)
+                )
+                rows = [_to_embedding_model(row) for row in cur.fetchall()]
+                for existing in rows:
+                    if existing.model != model:
+                        raise ValueError(f"Migration to {existing.model} is already in progress")
+                    if existing.status == "active":
+                        raise ValueError(f"{model} is already the active model")
+                    if existing.status == "migrating":
+                        if existing.dimensions != dimensions:
+                            raise ValueError(
+                                f"Migration to {model} was started with {existing.dimensions} "
+                                f"dimensions, not {dimensions}"
+                            )
+                        return existing
+
+                # 以前retiredにしたモデルへ戻す場合はチェックポイントを最初からやり直す
+                cur.execute(
+                    """
+                    INSERT INTO rag.embedding_models (model, dimensions, output_dimension, status)
+                    VALUES (%s, %s, %s, 'migrating')
+                    ON CONFLICT (model) DO UPDATE SET
+                        dimensions = EXCLUDED.dimensions,
+                        output_dimension = EXCLUDED.output_dimension,
+                        status = 'migrating',
+                        last_document_id = NULL,
+                        chunks_embedded = 0,
+                        tokens_used = 0,
+                        updated_at = NOW()
+                    """,
+                    (model, dimensions, output_dimension)
+                )
+                # NULL許容・デフォルトなしの列追加はメタデータのみの変更なので一瞬で終わる
+                cur.execute(
+                    f"""
+                    ALTER TABLE rag.chunks
+                        ADD COLUMN embedding_next vector({int(dimensions)}),
+                        ADD COLUMN embedding_next_hash TEXT,
+                        ADD COLUMN embedding_next_bits bit varying
+                    """
+                )
+
+        return EmbeddingModel(model, dimensions, "migrating", output_dimension=output_dimension)
+
+    def cancel_model_migration(self, model: str) -> None:
+        """移行を中止し、shadow列（とそのインデックス）を削除"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE rag.embedding_models SET status = 'retired', updated_at = NOW() "
+                    "WHERE model = %s AND status = 'migrating'",
+                    (model,)
+                )
+                if cur.rowcount == 0:
+                    raise ValueError(f"No migration to {model} is in progress")
+                cur.execute(
+                    "ALTER TABLE rag.chunks "
+                    "DROP COLUMN IF EXISTS embedding_next, DROP COLUMN IF EXISTS embedding_next_hash, "
+                    "DROP COLUMN IF EXISTS embedding_next_bits"
+                )
+
+    def get_current_documents_after(
+        self,
+        after_id: str | None,
+        limit: int,
+    ) -> list[RawDocument]:
+        """チャンクが最新のドキュメントをID順にafter_idの次からlimit件（移行のページング用）"""
+        with self._transaction() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    _CURRENT_DOCUMENTS_SQL
+                    + " WHERE %(after)s::uuid IS NULL OR d.id > %(after)s::uuid"
+                    + " ORDER BY d.id LIMIT %(limit)s",
+                    {"after": after_id, "limit": limit},
+                )
+                rows = cur.fetchall()
+
+        return [_to_raw_document(row) for row in rows]
+
+    def get_stale_shadow_documents(self, limit: int) -> list[RawDocument]:
+        """embedding_nextが現在のテキストと一致しないチャンクを持つ、チャンクが最新のドキュメント"""
+        with self._transaction() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    _CURRENT_DOCUMENTS_SQL
+                    + """
+                    WHERE d.id IN (
+                        SELECT document_id FROM rag.chunks
+                        WHERE embedding_next_hash IS DISTINCT FROM text_hash
+                    )
+                    ORDER BY d.id LIMIT %(limit)s
+                    """,
+                    {"limit": limit},
+                )
+                rows = cur.fetchall()
+
+        return [_to_raw_document(row) for row in rows]
+
+    def count_stale_shadow_chunks(self) -> int:
+        """embedding_nextが未作成または古いチャンク数（0になるまで切り替えられない）"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT COUNT(*) FROM rag.chunks "
+                    "WHERE embedding_next_hash IS DISTINCT FROM text_hash"
+                )
+                row = cur.fetchone()
+
+        return row[0]
+
+    def get_shadow_chunks(self, document_ids: Sequence[str]) -> dict[str, list[ShadowChunk]]:
+        """ドキュメントごとの保存済みチャンクとshadow列の状態"""
+        if not document_ids:
+            return {}
+
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT document_id, id, chunk_index, text_hash, embedding_next_hash
+                    FROM rag.chunks
+                    WHERE document_id = ANY(%s::uuid[])
+                    ORDER BY document_id, chunk_index
+                    """,
+                    (list(document_ids),)
+                )
+                rows = cur.fetchall()
+
+        chunks: dict[str, list[ShadowChunk]] = {}
+        for document_id, chunk_id, chunk_index, text_hash, shadow_hash in rows:
+            chunks.setdefault(str(document_id), []).append(
+                ShadowChunk(str(chunk_id), chunk_index, text_hash, shadow_hash)
             )
-            for row in rows
-        ]
+        return chunks
+
+    def save_shadow_embeddings(
+        self,
+        model: str,
+        rows: Sequence[tuple[str, str, Any]],
+        last_document_id: str | None,
+        tokens: int,
+    ) -> int:
+        """
+        (chunk id, text_hash, embedding)をembedding_nextに書き、同じトランザクションで
+        チェックポイント（last_document_id・件数・トークン数）を進める。更新した行数を返す
+        書き込みまでにチャンクのテキストが変わっていた行は更新しない
+        """
+        data = encode_copy_binary(
+            [
+                (chunk_id, h, embedding, binary_codes(embedding))
+                for chunk_id, h, embedding in rows
+            ],
+            _SHADOW_COLUMN_KINDS,
+        )
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                updated = 0
+                if rows:
+                    cur.execute(
+                        "CREATE TEMP TABLE shadow_updates "
+                        "(id uuid, text_hash text, embedding vector, embedding_bits varbit) "
+                        "ON COMMIT DROP"
+                    )
+                    cur.copy_expert(_COPY_SHADOW_SQL, io.BytesIO(data))
+                    cur.execute(_UPDATE_SHADOW_SQL)
+                    updated = cur.rowcount
+                    cur.execute("DROP TABLE shadow_updates")
+                cur.execute(
+                    """
+                    UPDATE rag.embedding_models SET
+                        last_document_id = COALESCE(%s::uuid, last_document_id),
+                        chunks_embedded = chunks_embedded + %s,
+                        tokens_used = tokens_used + %s,
+                        updated_at = NOW()
+                    WHERE model = %s AND status = 'migrating'
+                    """,
+                    (last_document_id, updated, tokens, model)
+                )
+                if cur.rowcount == 0:
+                    raise ValueError(f"No migration to {model} is in progress")
+
+        return updated
+
+    def build_shadow_index(self) -> None:
+        """
+        embedding_nextとembedding_next_bitsのHNSWインデックスをCONCURRENTLYで作成（検索・書き込みを止めない）
+        前回中断して無効なインデックスが残っていれば作り直す
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT dimensions FROM rag.embedding_models WHERE status = 'migrating'")
+                row = cur.fetchone()
+        if row is None:
+            raise ValueError("No migration is in progress")
+        dimensions = int(row[0])
+        indexes = {
+            _SHADOW_INDEX: "USING hnsw (embedding_next vector_cosine_ops)",
+            _SHADOW_BITS_INDEX: f"USING hnsw ((embedding_next_bits::bit({dimensions})) bit_hamming_ops)",
+        }
+
+        with self.pool.connection() as conn:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    for name, method in indexes.items():
+                        cur.execute(
+                            "SELECT i.indisvalid FROM pg_index i "
+                            "WHERE i.indexrelid = to_regclass(%s)",
+                            (f"rag.{name}",)
+                        )
+                        row = cur.fetchone()
+                        if row is not None and row[0]:
+                            continue
+                        if row is not None:
+                            cur.execute(f"DROP INDEX CONCURRENTLY rag.{name}")
+                        cur.execute(f"CREATE INDEX CONCURRENTLY {name} ON rag.chunks {method}")
+            finally:
+                conn.autocommit = False
+
+    def validate_shadow_bits(self) -> None:
+        """
+        embedding_next_bitsがNULLでないことをCHECK制約 NOT VALIDで付けてから検証する
+        VALIDATEの全件スキャンはSHARE UPDATE EXCLUSIVEロックなので検索・書き込みを止めない
+        付けてから切り替えまでの間、shadow列のないチャンクの挿入は失敗する（切り替えもそれまで待つ）
+        NULLが残っていれば制約を外してValueError
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"ALTER TABLE rag.chunks DROP CONSTRAINT IF EXISTS {_SHADOW_BITS_CHECK}, "
+                    f"ADD CONSTRAINT {_SHADOW_BITS_CHECK} "
+                    "CHECK (embedding_next_bits IS NOT NULL) NOT VALID"
+                )
+        try:
+            with self._transaction() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"ALTER TABLE rag.chunks VALIDATE CONSTRAINT {_SHADOW_BITS_CHECK}")
+        except psycopg2.errors.CheckViolation as e:
+            self.drop_shadow_bits_check()
+            raise ValueError("Some chunks have no embedding_next_bits yet") from e
+
+    def drop_shadow_bits_check(self) -> None:
+        """validate_shadow_bitsで付けたCHECK制約を外す（切り替えに失敗したとき用）"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"ALTER TABLE rag.chunks DROP CONSTRAINT IF EXISTS {_SHADOW_BITS_CHECK}")
+
+    def swap_embedding_model(self, model: str) -> None:
+        """
+        1トランザクションでembedding_nextをembeddingに、旧embeddingをembedding_prevに切り替え、
+        rag.embedding_modelsのactiveを移す。未移行のチャンクが残っていれば何もせずValueError
+        """
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                # 書き込み側（save_documents）と同じく、モデル行 → rag.chunksの順にロックする
+                cur.execute(
+                    "SELECT model, status FROM rag.embedding_models "
+                    "WHERE status IN ('active', 'migrating') FOR UPDATE"
+                )
+                statuses = dict(cur.fetchall())
+                if statuses.get(model) != "migrating":
+                    raise ValueError(f"No migration to {model} is in progress")
+                cur.execute("LOCK TABLE rag.chunks IN ACCESS EXCLUSIVE MODE")
+                cur.execute(
+                    "SELECT COUNT(*) FROM rag.chunks "
+                    "WHERE embedding_next_hash IS DISTINCT FROM text_hash"
+                )
+                stale = cur.fetchone()[0]
+                if stale:
+                    raise ValueError(f"{stale} chunks are not migrated to {model} yet")
+                for name in (_SHADOW_INDEX, _SHADOW_BITS_INDEX):
+                    cur.execute(
+                        "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)",
+                        (f"rag.{name}",)
+                    )
+                    row = cur.fetchone()
+                    if row is None or not row[0]:
+                        raise ValueError(f"Index {name} is missing or invalid")
+                cur.execute(
+                    "SELECT convalidated FROM pg_constraint "
+                    "WHERE conrelid = 'rag.chunks'::regclass AND conname = %s",
+                    (_SHADOW_BITS_CHECK,)
+                )
+                row = cur.fetchone()
+                if row is None or not row[0]:
+                    raise ValueError(f"Constraint {_SHADOW_BITS_CHECK} is missing or not validated")
+
+                cur.execute("ALTER TABLE rag.chunks DROP COLUMN IF EXISTS embedding_prev")
+                cur.execute("ALTER TABLE rag.chunks RENAME COLUMN embedding TO embedding_prev")
+                cur.execute("ALTER TABLE rag.chunks RENAME COLUMN embedding_next TO embedding")
+                cur.execute("ALTER TABLE rag.chunks DROP COLUMN embedding_next_hash")
+                # 旧embedding_bitsのインデックスは列と一緒に消える
+                cur.execute("ALTER TABLE rag.chunks DROP COLUMN embedding_bits")
+                cur.execute(
+                    "ALTER TABLE rag.chunks RENAME COLUMN embedding_next_bits TO embedding_bits"
+                )
+                # 検証済みのCHECKがNULLのないことを保証するので、SET NOT NULLはテーブルを読まない
+                cur.execute("ALTER TABLE rag.chunks ALTER COLUMN embedding_bits SET NOT NULL")
+                cur.execute(f"ALTER TABLE rag.chunks DROP CONSTRAINT {_SHADOW_BITS_CHECK}")
+                cur.execute(
+                    f"ALTER INDEX rag.{_SHADOW_BITS_INDEX} RENAME TO chunks_embedding_bits_idx"
+                )
+                cur.execute(
+                    "ALTER INDEX IF EXISTS rag.chunks_embedding_idx "
+                    "RENAME TO chunks_embedding_prev_idx"
+                )
+                cur.execute(f"ALTER INDEX rag.{_SHADOW_INDEX} RENAME TO chunks_embedding_idx")
+                cur.execute(
+                    "UPDATE rag.embedding_models SET status = 'retired', updated_at = NOW() "
+                    "WHERE status = 'active'"
+                )
+                cur.execute(
+                    "UPDATE rag.embedding_models "
+                    "SET status = 'active', activated_at = NOW(), updated_at = NOW() "
+                    "WHERE model = %s",
+                    (model,)
+                )
+
+    def drop_previous_embeddings(self) -> None:
+        """切り替え前のembedding列（切り戻し用に残している）を削除"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute("ALTER TABLE rag.chunks DROP COLUMN IF EXISTS embedding_prev")
+
+    def get_chunked_document_ids(self) -> set[str]:
+        """rag.chunksにチャンクが存在するドキュメントID"""
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT document_id FROM rag.chunks")
+                rows = cur.fetchall()
+
+        return {str(row[0]) for row in rows}
+
+    def get_existing_chunks(self, document_ids: Sequence[str]) -> dict[str, list[ExistingChunk]]:
+        """ドキュメントごとの保存済みチャンク（差分判定用、embeddingは読まない）"""
+        if not document_ids:
+            return {}
+
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT document_id, id, chunk_index, text_hash
+                    FROM rag.chunks
+                    WHERE document_id = ANY(%s::uuid[])
+                    ORDER BY document_id, chunk_index
+                    """,
+                    (list(document_ids),)
+                )
+                rows = cur.fetchall()
+
+        existing: dict[str, list[ExistingChunk]] = {}
+        for document_id, chunk_id, chunk_index, text_hash in rows:
+            existing.setdefault(str(document_id), []).append(
+                ExistingChunk(id=str(chunk_id), chunk_index=chunk_index, text_hash=text_hash)
+            )
+        return existing
 
     def get_superseded_document_ids(self) -> set[str]:
         """旧バージョンとしてマークされたドキュメントIDを取得"""
-        with get_connection(self.database_url) as conn:
+        with self._transaction() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT id FROM get_superseded_document_ids()")
                 rows = cur.fetchall()
@@ -53,42 +986,25 @@ class DocsRepository:
 
     def delete_chunks(self, document_id: str) -> None:
         """ドキュメントの既存チャンクを削除"""
-        with get_connection(self.database_url) as conn:
+        with self._transaction() as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     "DELETE FROM rag.chunks WHERE document_id = %s",
                     (document_id,)
                 )
-            conn.commit()
 
     def insert_chunks(self, document_id: str, chunks: list[ChunkWithEmbedding]) -> None:
         """チャンクを挿入"""
         if not chunks:
             return
 
-        with get_connection(self.database_url) as conn:
+        with self._transaction() as conn:
             with conn.cursor() as cur:
-                for chunk in chunks:
-                    cur.execute(
-                        """
-                        INSERT INTO rag.chunks
-                            (document_id, chunk_index, parent_heading, heading, content, embedding)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        """,
-                        (
-                            document_id,
-                            chunk.chunk_index,
-                            chunk.parent_heading,
-                            chunk.heading,
-                            chunk.content,
-                            chunk.embedding,
-                        )
-                    )
-            conn.commit()
+                insert_chunk_rows(cur, chunk_rows(document_id, chunks))
 
     def record_embedding_hash(self, document_id: str, content_hash: str) -> None:
         """embedding生成済みのhashを記録"""
-        with get_connection(self.database_url) as conn:
+        with self._transaction() as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -100,4 +1016,96 @@ class DocsRepository:
                     """,
                     (document_id, content_hash)
                 )
-            conn.commit()
+
+    def save_documents(
+        self,
+        documents: Sequence[DocumentWrite],
+        lease_owner: str | None = None,
+        model: str | None = None,
+    ) -> int:
+        """
+        複数ドキュメントのチャンク書き込みとhash記録を1トランザクションで実行し、COPYで送ったバイト数を返す
+        各操作は全ドキュメント分をまとめて1ステートメントで送る
+        lease_ownerを指定すると、そのワーカーがリースを保持していることを確認してから書き込み、
+        同じトランザクションでリースを削除する（保持していなければLeaseLostError）
+        modelを指定すると、それがactiveなモデルであることを確認してから書き込む
+        （モデル移行の切り替え後に旧モデルのembeddingを書かない。違えばEmbeddingModelChangedError）
+        """
+        if not documents:
+            return 0
+
+        replaced_ids = [d.document_id for d in documents if d.replace]
+        deleted_ids = [chunk_id for d in documents for chunk_id in d.deleted_ids]
+        shifted = [item for d in documents for item in d.shifted]
+        updated = [
+            (
+                chunk_id,
+                chunk.parent_heading,
+                chunk.heading,
+                chunk.content,
+                chunk.embedding,
+                chunk.text_hash,
+                binary_codes(chunk.embedding),
+            )
+            for d in documents
+            for chunk_id, chunk in d.updated
+        ]
+        rows = [row for d in documents for row in chunk_rows(d.document_id, d.inserted)]
+        states = [(d.document_id, d.content_hash) for d in documents]
+
+        document_ids = [d.document_id for d in documents]
+
+        with self._transaction() as conn:
+            with conn.cursor() as cur:
+                if model is not None:
+                    cur.execute(
+                        "SELECT model FROM rag.embedding_models WHERE status = 'active' FOR SHARE"
+                    )
+                    row = cur.fetchone()
+                    if row is None or row[0] != model:
+                        raise EmbeddingModelChangedError(
+                            f"active embedding model is {row[0] if row else None}, not {model}"
+                        )
+                if lease_owner is not None:
+                    cur.execute(
+                        "SELECT document_id FROM rag.embedding_leases "
+                        "WHERE worker_id = %s AND document_id = ANY(%s::uuid[]) FOR UPDATE",
+                        (lease_owner, document_ids)
+                    )
+                    held = {str(row[0]) for row in cur.fetchall()}
+                    lost = [document_id for document_id in document_ids if document_id not in held]
+                    if lost:
+                        raise LeaseLostError(f"lease lost for {len(lost)} documents: {lost[0]}")
+                if replaced_ids:
+                    cur.execute(
+                        "DELETE FROM rag.chunks WHERE document_id = ANY(%s::uuid[])",
+                        (replaced_ids,)
+                    )
+                if deleted_ids:
+                    cur.execute(
+                        "DELETE FROM rag.chunks WHERE id = ANY(%s::uuid[])",
+                        (deleted_ids,)
+                    )
+                if shifted:
+                    execute_values(cur, _SHIFT_CHUNKS_SQL, shifted, page_size=len(shifted))
+                    cur.execute(
+                        "UPDATE rag.chunks SET chunk_index = -1 - chunk_index "
+                        "WHERE id = ANY(%s::uuid[])",
+                        ([chunk_id for chunk_id, _ in shifted],)
+                    )
+                written = update_chunk_rows(cur, updated) + insert_chunk_rows(cur, rows)
+                execute_values(
+                    cur,
+                    _UPSERT_EMBEDDING_STATE_SQL,
+                    states,
+                    template=_UPSERT_EMBEDDING_STATE_TEMPLATE,
+                    page_size=len(states),
+                )
+                if lease_owner is not None:
+                    cur.execute(
+                        "DELETE FROM rag.embedding_leases "
+                        "WHERE worker_id = %s AND document_id = ANY(%s::uuid[])",
+                        (lease_owner, document_ids)
+                    )
+
+        return written
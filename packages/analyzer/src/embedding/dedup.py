@@ -0,0 +1,137 @@
+"""Collapse duplicate embedding inputs before calling the API.
+
+Identical embedding texts (same hash) always share one API input. With a
+near-duplicate threshold, chunks whose content has an estimated Jaccard
+similarity at or above the threshold (MinHash over character 5-gram
+shingles, candidates found by LSH banding) also reuse one representative's
+vector.
+"""
+
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+# MinHashのハッシュ関数の数（= BANDS × ROWS）
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = 4
+SHINGLE_SIZE = 5
+
+# これより短い本文は近似重複の対象にしない（見出しだけのチャンクなどを誤って束ねない）
+MIN_NEAR_DUP_CHARS = 80
+
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, 2**32, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**32, NUM_PERM, dtype=np.uint64)
+_MASK = np.uint64(0xFFFFFFFF)
+
+
+@dataclass(slots=True)
+class DedupPlan:
+    """
+    テキスト列に対する重複排除計画
+    representativesはAPIに送るテキストの添字、owner_to_rep[i]はテキストiが使うrepresentativesの位置
+    """
+    representatives: list[int] = field(default_factory=list)
+    owner_to_rep: list[int] = field(default_factory=list)
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+    tokens_saved: int = 0
+
+    @property
+    def collapsed(self) -> int:
+        return self.exact_duplicates + self.near_duplicates
+
+
+def _shingles(content: str) -> npt.NDArray[np.uint64]:
+    text = "".join(unicodedata.normalize("NFKC", content).split())
+    grams = {text[i : i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    return np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)
+    )
+
+
+def minhash(content: str) -> npt.NDArray[np.uint64]:
+    """本文のMinHashシグネチャ（NUM_PERM個の最小ハッシュ値）"""
+    shingles = _shingles(content)
+    return ((np.outer(shingles, _A) + _B) & _MASK).min(axis=0)
+
+
+def plan_dedup(
+    hashes: Sequence[str],
+    token_counts: Sequence[int],
+    contents: Sequence[str] | None = None,
+    near_threshold: float = 0.0,
+) -> DedupPlan:
+    """
+    同じhashのテキストを1つにまとめる
+    near_threshold > 0 かつcontentsがある場合は、本文の推定Jaccard類似度が閾値以上のものもまとめる
+    代表は最初に出現したテキスト
+    """
+    plan = DedupPlan()
+    rep_of_hash: dict[str, int] = {}
+    signatures: list[npt.NDArray[np.uint64] | None] = []
+    buckets: dict[tuple[int, bytes], list[int]] = {}
+    near = near_threshold > 0 and contents is not None
+
+    for i, h in enumerate(hashes):
+        rep = rep_of_hash.get(h)
+        if rep is not None:
+            plan.owner_to_rep.append(rep)
+            plan.exact_duplicates += 1
+            plan.tokens_saved += token_counts[i]
+            continue
+
+        if near:
+            assert contents is not None
+            rep = _find_near(contents[i], plan, signatures, buckets, near_threshold)
+            if rep is not None:
+                rep_of_hash[h] = rep
+                plan.owner_to_rep.append(rep)
+                plan.near_duplicates += 1
+                plan.tokens_saved += token_counts[i]
+                continue
+
+        rep = len(plan.representatives)
+        rep_of_hash[h] = rep
+        plan.representatives.append(i)
+        plan.owner_to_rep.append(rep)
+
+    return plan
+
+
+def _find_near(
+    content: str,
+    plan: DedupPlan,
+    signatures: list[npt.NDArray[np.uint64] | None],
+    buckets: dict[tuple[int, bytes], list[int]],
+    threshold: float,
+) -> int | None:
+    """
+    既存の代表から近似重複を探す。見つからなければ新しい代表としてLSHに登録してNoneを返す
+    signaturesとbucketsは代表の添字（plan.representativesの位置）で管理する
+    """
+    signature = minhash(content) if len(content) >= MIN_NEAR_DUP_CHARS else None
+    if signature is not None:
+        bands = [
+            (b, signature[b * LSH_ROWS : (b + 1) * LSH_ROWS].tobytes()) for b in range(LSH_BANDS)
+        ]
+        best, best_similarity = None, threshold
+        for key in bands:
+            for rep in buckets.get(key, []):
+                candidate = signatures[rep]
+                assert candidate is not None
+                similarity = float(np.mean(candidate == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = rep, similarity
+        if best is not None:
+            return best
+        for key in bands:
+            buckets.setdefault(key, []).append(len(plan.representatives))
+
+    signatures.append(signature)
+    return None
@@ -0,0 +1,82 @@
+"""Chunk-level diff between stored rag.chunks rows and freshly chunked output."""
+
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from .types import ExistingChunk
+
+
+@dataclass
+class ChunkDiff:
+    """
+    新チャンク（chunk_index, text_hash）と既存行の対応
+    unchanged: 同じ位置・同じ内容 → 何もしない
+    shifted: 同じ内容で位置だけ移動 → chunk_indexのみ更新
+    changed: 同じ位置で内容が変化 → 既存行を上書き（要embedding）
+    inserted: 対応する既存行なし → 新規挿入（要embedding）
+    deleted: どの新チャンクにも対応しない既存行 → 削除
+    """
+    unchanged: list[int] = field(default_factory=list)  # chunk_index
+    shifted: list[tuple[str, int]] = field(default_factory=list)  # (chunk id, 新chunk_index)
+    changed: list[tuple[str, int]] = field(default_factory=list)  # (chunk id, chunk_index)
+    inserted: list[int] = field(default_factory=list)  # chunk_index
+    deleted: list[str] = field(default_factory=list)  # chunk id
+
+    @property
+    def reused(self) -> int:
+        """embeddingを再利用するチャンク数"""
+        return len(self.unchanged) + len(self.shifted)
+
+    @property
+    def needs_embedding(self) -> set[int]:
+        """embeddingが必要な新チャンクのchunk_index"""
+        return {idx for _, idx in self.changed} | set(self.inserted)
+
+
+def diff_chunks(existing: Sequence[ExistingChunk], new: Sequence[tuple[int, str]]) -> ChunkDiff:
+    """
+    既存行と新チャンク(chunk_index, text_hash)を突き合わせる
+    text_hashはbuild_embedding_textの出力のhashなので、見出し・本文・context_previous・
+    メタデータのいずれかが変わればembeddingも変わるものとして扱う
+    """
+    diff = ChunkDiff()
+    remaining = {c.id: c for c in existing}
+    by_index = {c.chunk_index: c for c in existing}
+
+    # 1. 同じ位置・同じ内容
+    unmatched: list[tuple[int, str]] = []
+    for idx, h in new:
+        row = by_index.get(idx)
+        if row is not None and row.text_hash == h and row.id in remaining:
+            diff.unchanged.append(idx)
+            del remaining[row.id]
+        else:
+            unmatched.append((idx, h))
+
+    # 2. 同じ内容の行が別の位置にある（前後の挿入・削除で位置がずれた）
+    by_hash: dict[str, list[ExistingChunk]] = {}
+    for row in sorted(remaining.values(), key=lambda c: c.chunk_index):
+        if row.text_hash is not None:
+            by_hash.setdefault(row.text_hash, []).append(row)
+
+    still_unmatched: list[int] = []
+    for idx, h in unmatched:
+        candidates = by_hash.get(h)
+        if candidates:
+            row = candidates.pop(0)
+            diff.shifted.append((row.id, idx))
+            del remaining[row.id]
+        else:
+            still_unmatched.append(idx)
+
+    # 3. 同じ位置の行が残っていれば上書き、なければ新規
+    for idx in still_unmatched:
+        row = by_index.get(idx)
+        if row is not None and row.id in remaining:
+            diff.changed.append((row.id, idx))
+            del remaining[row.id]
+        else:
+            diff.inserted.append(idx)
+
+    diff.deleted = list(remaining)
+    return diff
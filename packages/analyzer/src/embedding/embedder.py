@@ -1,58 +1,395 @@
 """Voyage AI embedding client."""
 
+import asyncio
+import threading
 import time
-from typing import Any, Sequence
+from dataclasses import dataclass, field
+from typing import Any, Callable, Sequence
 
+import numpy as np
+import numpy.typing as npt
 import voyageai
 
+from .batching import Batch, plan_batches, summarize_batches
+from .chunker import estimate_tokens
+from .metrics import Metrics
+from .query import QueryEmbedder, QueryStats
+from .ratelimit import RateLimiter
+from .resilience import CircuitBreaker, backoff_delay, is_transient
+from .types import Embedding
+
+# embedding行列（テキスト数 × 次元数、float32）
+EmbeddingMatrix = npt.NDArray[np.float32]
+
+# rag.embedding_modelsにactiveなモデルがない場合のモデル
+DEFAULT_MODEL = "voyage-3-lite"
+
+# voyage-3-lite (Tier 1) のレート制限
+DEFAULT_REQUESTS_PER_MINUTE = 2000
+DEFAULT_TOKENS_PER_MINUTE = 16_000_000
+
+# 1リクエストあたりの上限（voyage-3-liteは1000件・1Mトークン）
+# トークン数はtiktokenでの推定値なので、Voyage側のトークナイザとの差を見込んで余裕を持たせる
+DEFAULT_MAX_BATCH_TOKENS = 800_000
+
+# 成功したバッチごとに (バッチ, そのバッチのembedding行列) で呼ばれる
+OnBatch = Callable[[Batch, EmbeddingMatrix], None]
+
+
+@dataclass(slots=True)
+class BatchFailure:
+    """リトライしても失敗したバッチ"""
+    batch: Batch
+    error: Exception
+
+
+@dataclass(slots=True)
+class PartialEmbeddings:
+    """
+    一部のバッチが失敗しうるembedding結果
+    embeddingsは入力順の行列で、failuresに含まれるバッチの行は未定義（全バッチ失敗なら0列）
+    """
+    embeddings: EmbeddingMatrix
+    failures: list[BatchFailure] = field(default_factory=list)
+
+    def succeeded(self) -> npt.NDArray[np.bool_]:
+        """行ごとに成功したか"""
+        mask = np.ones(self.embeddings.shape[0], dtype=bool)
+        for failure in self.failures:
+            mask[failure.batch.start : failure.batch.end] = False
+        return mask
+
+
+def _store(out: EmbeddingMatrix | None, total: int, batch: Batch, embeddings: Any) -> EmbeddingMatrix:
+    """レスポンスのembeddingをfloat32に変換して行列の該当行に書き込む（行列は初回に確保）"""
+    block = np.asarray(embeddings, dtype=np.float32)
+    if out is None:
+        out = np.empty((total, block.shape[1]), dtype=np.float32)
+    out[batch.start : batch.end] = block
+    return out
+
+
+def _partial(out: EmbeddingMatrix | None, total: int, failures: list[BatchFailure]) -> PartialEmbeddings:
+    if out is None:
+        out = np.zeros((total, 0), dtype=np.float32)
+    failures.sort(key=lambda f: f.batch.start)
+    return PartialEmbeddings(out, failures)
+
+
+def _plan(
+    texts: Sequence[str],
+    token_counts: Sequence[int] | None,
+    batch_size: int,
+    max_batch_tokens: int,
+) -> list[Batch]:
+    """トークン数からバッチを計画し、充填率を表示"""
+    if token_counts is None:
+        token_counts = [estimate_tokens(t) for t in texts]
+    batches = plan_batches(token_counts, batch_size, max_batch_tokens)
+    print(f"  Planned {summarize_batches(batches)}")
+    return batches
+
 
 class EmbeddingClient:
     """Voyage AI Embedding クライアント"""
 
-    def __init__(self, api_key: str, batch_size: int = 128):
+    def __init__(
+        self,
+        api_key: str,
+        batch_size: int = 128,
+        max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        breaker: CircuitBreaker | None = None,
+        model: str = DEFAULT_MODEL,
+        output_dimension: int | None = None,
+        metrics: Metrics | None = None,
+    ):
         self.client = voyageai.Client(api_key=api_key)
         self.batch_size = batch_size
-        self.model = "voyage-3-lite"
+        self.max_batch_tokens = max_batch_tokens
+        self.model = model
+        self.output_dimension = output_dimension
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.breaker = breaker
+        self.metrics = metrics or Metrics()
+        self._queries: QueryEmbedder | None = None
+        self._queries_lock = threading.Lock()
 
-    def embed_texts(self, texts: Sequence[str]) -> list[list[float]]:
+    def embed_query(self, text: str) -> Embedding:
         """
-        テキストのリストをembedding化
-        batch_sizeごとに分割して処理
+        検索クエリ1件をembedding化（input_type="query"）
+        正規化したクエリでキャッシュし、数ms以内に届いた他スレッドのクエリと1リクエストにまとめる
         """
-        all_embeddings: list[list[float]] = []
+        return self.query_embedder().embed(text)
+
+    def query_embedder(self) -> QueryEmbedder:
+        """クエリ用のキャッシュ・マイクロバッチャ（初回呼び出しで起動）"""
+        # 複数スレッドの初回呼び出しが重なってもバッチスレッドは1つだけ起動する
+        with self._queries_lock:
+            if self._queries is None:
+                self._queries = QueryEmbedder(self.embed_queries, max_batch=self.batch_size)
+            return self._queries
 
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i : i + self.batch_size]
+    def query_stats(self) -> QueryStats:
+        """クエリembeddingのキャッシュヒット率とレイテンシ（p50/p99）"""
+        return self.query_embedder().stats()
 
-            response = self._embed_with_retry(list(batch))
-            all_embeddings.extend(response.embeddings)
+    def embed_queries(self, texts: Sequence[str]) -> EmbeddingMatrix:
+        """検索クエリをキャッシュなしで1リクエストでembedding化"""
+        self._acquire(sum(estimate_tokens(t) for t in texts))
+        response = self._embed_with_retry(list(texts), input_type="query")
+        return np.asarray(response.embeddings, dtype=np.float32)
 
+    def embed_texts(
+        self,
+        texts: Sequence[str],
+        token_counts: Sequence[int] | None = None,
+    ) -> EmbeddingMatrix:
+        """
+        テキストのリストをembedding化し、入力順のfloat32行列で返す
+        件数batch_size・合計max_batch_tokens以内のバッチに分割して処理
+        token_countsを渡さない場合はここで推定する
+        """
+        out: EmbeddingMatrix | None = None
+
+        for batch in _plan(texts, token_counts, self.batch_size, self.max_batch_tokens):
             # レート制限対策
-            if i + self.batch_size < len(texts):
-                time.sleep(0.1)
+            self._acquire(batch.tokens)
+            response = self._embed_with_retry(list(texts[batch.start : batch.end]))
+            out = _store(out, len(texts), batch, response.embeddings)
+
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
 
-        return all_embeddings
+    def embed_texts_partial(
+        self,
+        texts: Sequence[str],
+        token_counts: Sequence[int] | None = None,
+        on_batch: OnBatch | None = None,
+    ) -> PartialEmbeddings:
+        """
+        embed_textsと同じだが、失敗したバッチを記録して残りのバッチを続ける
+        サーキットブレーカーが開いた後のバッチはAPIを呼ばずに失敗する
+        """
+        out: EmbeddingMatrix | None = None
+        failures: list[BatchFailure] = []
+
+        for batch in _plan(texts, token_counts, self.batch_size, self.max_batch_tokens):
+            try:
+                self._acquire(batch.tokens)
+                response = self._embed_with_retry(list(texts[batch.start : batch.end]))
+            except Exception as e:
+                print(f"  Batch {batch.start}-{batch.end} failed: {e}")
+                failures.append(BatchFailure(batch, e))
+                continue
+            out = _store(out, len(texts), batch, response.embeddings)
+            if on_batch is not None:
+                on_batch(batch, out[batch.start : batch.end])
+
+        return _partial(out, len(texts), failures)
+
+    def _acquire(self, tokens: int) -> None:
+        """レート制限の枠を待って取得し、送信トークン数を記録"""
+        with self.metrics.span("api.rate_limit"):
+            self.limiter.acquire(tokens)
+        self.metrics.add("api_requests")
+        self.metrics.add("tokens_sent", tokens)
 
     def _embed_with_retry(
         self,
         texts: list[str],
+        input_type: str = "document",
         max_retries: int = 3,
         base_delay: float = 1.0,
     ) -> Any:
-        """リトライ付きembedding"""
+        """
+        リトライ付きembedding
+        一時的エラー（429・5xx・接続エラー）だけをRetry-Afterまたは指数バックオフでリトライする
+        """
+        for attempt in range(max_retries):
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                with self.metrics.span("api.embed", texts=len(texts), attempt=attempt):
+                    response = self.client.embed(
+                        texts=texts,
+                        model=self.model,
+                        input_type=input_type,
+                        output_dimension=self.output_dimension,
+                    )
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure(e)
+                if attempt == max_retries - 1 or not is_transient(e):
+                    raise
+
+                delay = backoff_delay(attempt, base_delay, e)
+                print(f"  Retry {attempt + 1}/{max_retries} after {delay:.1f}s: {e}")
+                self.metrics.add("api_retries")
+                with self.metrics.span("api.backoff"):
+                    time.sleep(delay)
+            else:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return response
+
+        raise RuntimeError("Unreachable")
+
+
+class AsyncEmbeddingClient:
+    """
+    Voyage AI Embedding クライアント（asyncio版）
+    最大max_concurrencyバッチを並行して送信し、結果は入力順で返す
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        batch_size: int = 128,
+        max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        max_concurrency: int = 4,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        breaker: CircuitBreaker | None = None,
+        model: str = DEFAULT_MODEL,
+        output_dimension: int | None = None,
+        metrics: Metrics | None = None,
+    ):
+        self.client = voyageai.AsyncClient(api_key=api_key)
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.model = model
+        self.output_dimension = output_dimension
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.breaker = breaker
+        self.metrics = metrics or Metrics()
+
+    def embed_texts(
+        self,
+        texts: Sequence[str],
+        token_counts: Sequence[int] | None = None,
+    ) -> EmbeddingMatrix:
+        """同期呼び出し用ラッパー（EmbeddingClient.embed_textsと同じ契約）"""
+        return asyncio.run(self.embed_texts_async(texts, token_counts))
+
+    async def embed_texts_async(
+        self,
+        texts: Sequence[str],
+        token_counts: Sequence[int] | None = None,
+    ) -> EmbeddingMatrix:
+        """
+        テキストのリストをembedding化し、入力順のfloat32行列で返す
+        件数batch_size・合計max_batch_tokens以内のバッチに分割し、バッチを並行処理する
+        """
+        batches = _plan(texts, token_counts, self.batch_size, self.max_batch_tokens)
+        out: EmbeddingMatrix | None = None
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(batch: Batch) -> None:
+            nonlocal out
+            async with semaphore:
+                await self._acquire(batch.tokens)
+                response = await self._embed_with_retry(list(texts[batch.start : batch.end]))
+            out = _store(out, len(texts), batch, response.embeddings)
+
+        # 1バッチでも失敗したら残りはキャンセルし、最初の例外をそのまま送出
+        try:
+            async with asyncio.TaskGroup() as group:
+                for batch in batches:
+                    group.create_task(run_batch(batch))
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0] from None
+
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+    def embed_texts_partial(
+        self,
+        texts: Sequence[str],
+        token_counts: Sequence[int] | None = None,
+        on_batch: OnBatch | None = None,
+    ) -> PartialEmbeddings:
+        """同期呼び出し用ラッパー（EmbeddingClient.embed_texts_partialと同じ契約）"""
+        return asyncio.run(self.embed_texts_partial_async(texts, token_counts, on_batch))
+
+    async def embed_texts_partial_async(
+        self,
+        texts: Sequence[str],
+        token_counts: Sequence[int] | None = None,
+        on_batch: OnBatch | None = None,
+    ) -> PartialEmbeddings:
+        """
+        embed_texts_asyncと同じだが、失敗したバッチを記録して他のバッチはキャンセルしない
+        on_batchはイベントループのスレッドで、バッチの完了順に呼ばれる
+        """
+        batches = _plan(texts, token_counts, self.batch_size, self.max_batch_tokens)
+        out: EmbeddingMatrix | None = None
+        failures: list[BatchFailure] = []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(batch: Batch) -> None:
+            nonlocal out
+            try:
+                async with semaphore:
+                    await self._acquire(batch.tokens)
+                    response = await self._embed_with_retry(list(texts[batch.start : batch.end]))
+            except Exception as e:
+                print(f"  Batch {batch.start}-{batch.end} failed: {e}")
+                failures.append(BatchFailure(batch, e))
+                return
+            out = _store(out, len(texts), batch, response.embeddings)
+            if on_batch is not None:
+                on_batch(batch, out[batch.start : batch.end])
+
+        async with asyncio.TaskGroup() as group:
+            for batch in batches:
+                group.create_task(run_batch(batch))
+
+        return _partial(out, len(texts), failures)
+
+    async def _acquire(self, tokens: int) -> None:
+        """レート制限の枠を待って取得し、送信トークン数を記録"""
+        with self.metrics.span("api.rate_limit"):
+            await self.limiter.acquire_async(tokens)
+        self.metrics.add("api_requests")
+        self.metrics.add("tokens_sent", tokens)
+
+    async def _embed_with_retry(
+        self,
+        texts: list[str],
+        input_type: str = "document",
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+    ) -> Any:
+        """
+        リトライ付きembedding
+        一時的エラー（429・5xx・接続エラー）だけをRetry-Afterまたは指数バックオフでリトライする
+        """
         for attempt in range(max_retries):
+            if self.breaker is not None:
+                self.breaker.before_call()
             try:
-                return self.client.embed(
-                    texts=texts,
-                    model=self.model,
-                    input_type="document",
-                )
+                with self.metrics.span("api.embed", texts=len(texts), attempt=attempt):
+                    response = await self.client.embed(
+                        texts=texts,
+                        model=self.model,
+                        input_type=input_type,
+                        output_dimension=self.output_dimension,
+                    )
             except Exception as e:
-                if attempt == max_retries - 1:
+                if self.breaker is not None:
+                    self.breaker.record_failure(e)
+                if attempt == max_retries - 1 or not is_transient(e):
                     raise
 
-                delay = base_delay * (2 ** attempt)
-                print(f"  Retry {attempt + 1}/{max_retries} after {delay}s: {e}")
-                time.sleep(delay)
+                delay = backoff_delay(attempt, base_delay, e)
+                print(f"  Retry {attempt + 1}/{max_retries} after {delay:.1f}s: {e}")
+                self.metrics.add("api_retries")
+                with self.metrics.span("api.backoff"):
+                    await asyncio.sleep(delay)
+            else:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return response
 
         raise RuntimeError("Unreachable")
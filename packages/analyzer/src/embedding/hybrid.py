@@ -0,0 +1,100 @@
+"""Hybrid retrieval: reciprocal-rank fusion of vector and BM25 results."""
+
+from dataclasses import dataclass
+from typing import Hashable, Sequence, TypeVar
+
+import numpy.typing as npt
+
+from .lexical import LexicalIndex
+from .local_index import LocalIndex
+
+# RRFの平滑化定数（Cormack et al. 2009 の推奨値）
+RRF_K = 60
+
+K = TypeVar("K", bound=Hashable)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[K]], k: int = RRF_K) -> list[tuple[K, float]]:
+    """各ランキングの 1 / (k + 順位) を合計し、スコア降順で返す（順位は1始まり）"""
+    scores: dict[K, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+@dataclass(slots=True)
+class HybridHit:
+    """ハイブリッド検索結果（順位はそれぞれの検索で1始まり、ヒットしなければNone）"""
+    id: str
+    title: str | None
+    heading: str
+    content: str
+    file_path: str
+    score: float
+    vector_rank: int | None
+    lexical_rank: int | None
+
+
+class HybridSearcher:
+    """
+    LocalIndex（ベクトル）とLexicalIndex（BM25）を組み合わせた検索
+    両者のチャンクは(document_id, chunk_index)で対応付ける
+    """
+
+    def __init__(self, vectors: LocalIndex, lexical: LexicalIndex):
+        self.vectors = vectors
+        self.lexical = lexical
+        self._rows = {
+            (chunk.document_id, chunk.chunk_index): row
+            for row, chunk in enumerate(vectors.chunks)
+        }
+
+    def search(
+        self,
+        query: str,
+        query_embedding: npt.ArrayLike,
+        filter_tags: Sequence[str] | None = None,
+        match_count: int = 5,
+        candidates: int = 50,
+        nprobe: int | None = None,
+    ) -> list[HybridHit]:
+        """
+        それぞれ上位candidates件を取り、RRFで統合した上位match_count件
+        BM25側のヒットでもベクトルインデックスにないチャンク（未エクスポート）は除く
+        """
+        vector_rows = [
+            row
+            for row, _ in self.vectors.search_rows(
+                query_embedding,
+                filter_tags=filter_tags,
+                match_count=candidates,
+                similarity_threshold=-1.0,
+                nprobe=nprobe,
+            )[0]
+        ]
+
+        allowed = self.vectors.allowed_rows(filter_tags)
+        lexical_rows: list[int] = []
+        for hit in self.lexical.search(query, candidates):
+            row = self._rows.get((hit.document_id, hit.chunk_index))
+            if row is not None and (allowed is None or allowed[row]):
+                lexical_rows.append(row)
+
+        vector_rank = {row: rank for rank, row in enumerate(vector_rows, start=1)}
+        lexical_rank = {row: rank for rank, row in enumerate(lexical_rows, start=1)}
+
+        hits = []
+        for row, score in reciprocal_rank_fusion([vector_rows, lexical_rows])[:match_count]:
+            chunk = self.vectors.chunks[row]
+            hits.append(HybridHit(
+                id=chunk.id,
+                title=chunk.title,
+                heading=chunk.heading,
+                content=chunk.content,
+                file_path=chunk.file_path,
+                score=score,
+                vector_rank=vector_rank.get(row),
+                lexical_rank=lexical_rank.get(row),
+            ))
+        return hits
@@ -0,0 +1,90 @@
+"""Work-queue leases: worker identity and a heartbeat that keeps claims alive."""
+
+import os
+import socket
+import threading
+from types import TracebackType
+from typing import Iterable
+
+from .db import DocsRepository
+
+
+def default_worker_id() -> str:
+    """ホスト名とPIDからワーカーIDを作る（EMBED_WORKER_IDが未設定の場合）"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseHeartbeat:
+    """
+    保持中のリースをバックグラウンドスレッドで定期的に延長する
+    間隔はリース期間の1/3なので、2回続けて失敗しても期限は切れない
+    終了時に残っているリース（処理途中で例外になった分）は解放する
+    """
+
+    def __init__(
+        self,
+        db: DocsRepository,
+        worker_id: str,
+        lease_seconds: float,
+        interval: float | None = None,
+    ):
+        self.db = db
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval if interval is not None else lease_seconds / 3
+        self.beats = 0
+        self._held: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            held, self._held = list(self._held), set()
+        if held:
+            try:
+                self.db.release_leases(self.worker_id, held)
+            except Exception as e:
+                print(f"  [WARN] Lease release failed: {e}")
+
+    def hold(self, document_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._held.update(document_ids)
+
+    def drop(self, document_ids: Iterable[str]) -> None:
+        """処理が終わった（保存済み、または失敗して期限切れを待つ）リースを延長対象から外す"""
+        with self._lock:
+            self._held.difference_update(document_ids)
+
+    def beat(self) -> None:
+        """保持中のリースを延長し、他のワーカーに取られたものは延長対象から外す"""
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return
+        extended = self.db.extend_leases(self.worker_id, held, self.lease_seconds)
+        self.beats += 1
+        with self._lock:
+            # 延長中に保存が終わってリースが消えたものは除く
+            lost = (set(held) - extended) & self._held
+            self._held -= lost
+        if lost:
+            print(f"  [WARN] Lost {len(lost)} leases (expired and claimed by another worker)")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"  [WARN] Lease heartbeat failed: {e}")
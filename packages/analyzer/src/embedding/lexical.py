@@ -0,0 +1,421 @@
+"""Japanese-aware BM25 inverted index over chunk headings and content.
+
+Text is NFKC-normalized and case-folded, then split into:
+  - character bigrams over runs of kana/kanji (single characters stay unigrams)
+  - ASCII identifiers such as ``fct_time_records_actual_split``, indexed whole
+    and additionally split on ``_``, ``.`` and ``-``
+
+Each term's postings are a byte string of varint-encoded (doc gap, term
+frequency) pairs. Replacing a document's chunks tombstones the old postings
+and appends new ones; the index is compacted once tombstones pile up.
+
+The saved file records a watermark (the latest embedding_state.embedded_at
+it reflects). Loading it catches up from rag.chunks since the watermark, so
+documents committed by a run that failed or was killed before saving are
+not missed.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from .db import DocsRepository
+from .local_index import REFRESH_OVERLAP
+from .types import Chunk, IndexedChunk
+
+# BM25パラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 削除済み（tombstone）エントリがこの割合を超えたら詰め直す
+COMPACT_RATIO = 0.25
+
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff々〆]+")
+_IDENTIFIER = re.compile(r"[a-z0-9_]+(?:[.\-][a-z0-9_]+)*")
+_IDENTIFIER_PARTS = re.compile(r"[_.\-]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """検索用トークン列（日本語は文字bigram、英数字は識別子単位＋構成要素）"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens: list[str] = []
+
+    for match in _CJK_RUN.finditer(text):
+        run = match.group()
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+
+    for match in _IDENTIFIER.finditer(text):
+        identifier = match.group()
+        tokens.append(identifier)
+        parts = [p for p in _IDENTIFIER_PARTS.split(identifier) if p]
+        if len(parts) > 1:
+            tokens.extend(parts)
+
+    return tokens
+
+
+def chunk_text(heading: str, content: str) -> str:
+    """インデックス対象テキスト（見出し＋本文）"""
+    return f"{heading}\n{content}"
+
+
+def _encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data: bytes | bytearray) -> npt.NDArray[np.int64]:
+    """LEB128形式のvarint列を一括デコード"""
+    if not data:
+        return np.empty(0, dtype=np.int64)
+
+    raw = np.frombuffer(bytes(data), dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shifts = 7 * (np.arange(len(raw)) - np.repeat(starts, ends - starts + 1))
+    payload = (raw & 0x7F).astype(np.int64) << shifts
+    return np.add.reduceat(payload, starts)
+
+
+@dataclass(slots=True)
+class LexicalHit:
+    """BM25検索結果（rag.chunksの(document_id, chunk_index)で識別）"""
+    document_id: str
+    chunk_index: int
+    score: float
+
+
+class LexicalIndex:
+    """
+    BM25転置インデックス
+    エントリ（チャンク）には追加順の連番を振り、ポスティングは連番の差分で圧縮する
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path is not None else None
+        self._postings: dict[str, bytearray] = {}
+        self._last_entry: dict[str, int] = {}  # 各ポスティングに最後に追加した連番
+        self._keys: list[tuple[str, int]] = []  # 連番 → (document_id, chunk_index)
+        self._lengths: list[int] = []
+        self._alive: list[bool] = []
+        self._entries_by_document: dict[str, list[int]] = {}
+        self._live_count = 0
+        self._live_length = 0
+        self._arrays: tuple[npt.NDArray[np.float32], npt.NDArray[np.bool_]] | None = None
+        # rag.chunksから反映済みの最新embedded_at（Noneなら未構築扱いで作り直す）
+        self.watermark: datetime | None = None
+
+    @property
+    def size(self) -> int:
+        """有効なチャンク数"""
+        return self._live_count
+
+    @property
+    def tombstones(self) -> int:
+        return len(self._keys) - self._live_count
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings)
+
+    @property
+    def postings_bytes(self) -> int:
+        return sum(len(p) for p in self._postings.values())
+
+    def posting_count(self) -> int:
+        """(エントリ, tf)ペアの総数（tombstoneを含む）"""
+        return sum(len(decode_varints(p)) // 2 for p in self._postings.values())
+
+    def replace_document(self, document_id: str, chunks: Sequence[Chunk]) -> None:
+        """ドキュメントのチャンクを入れ替える（空なら削除）"""
+        self._remove(document_id)
+        entries = [
+            self._add(document_id, chunk.chunk_index, chunk_text(chunk.heading, chunk.content))
+            for chunk in chunks
+        ]
+        if entries:
+            self._entries_by_document[document_id] = entries
+        self._arrays = None
+
+        if self.tombstones > COMPACT_RATIO * max(len(self._keys), 1):
+            self.compact()
+
+    def remove_document(self, document_id: str) -> None:
+        self.replace_document(document_id, [])
+
+    def _add(self, document_id: str, chunk_index: int, text: str) -> int:
+        entry = len(self._keys)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = bytearray()
+                gap = entry
+            else:
+                gap = entry - self._last_entry[term]
+            _encode_varint(gap, postings)
+            _encode_varint(tf, postings)
+            self._last_entry[term] = entry
+
+        self._keys.append((document_id, chunk_index))
+        self._lengths.append(len(tokens))
+        self._alive.append(True)
+        self._live_count += 1
+        self._live_length += len(tokens)
+        return entry
+
+    def _remove(self, document_id: str) -> None:
+        for entry in self._entries_by_document.pop(document_id, []):
+            self._alive[entry] = False
+            self._live_count -= 1
+            self._live_length -= self._lengths[entry]
+
+    def compact(self) -> None:
+        """tombstoneを除いて連番を振り直し、ポスティングを再エンコード"""
+        alive = np.asarray(self._alive, dtype=bool)
+        remap = np.cumsum(alive) - 1
+
+        postings: dict[str, bytearray] = {}
+        last_entry: dict[str, int] = {}
+        for term, data in self._postings.items():
+            entries, tfs = self._decode(data)
+            keep = alive[entries]
+            if not keep.any():
+                continue
+            entries = remap[entries[keep]]
+            gaps = np.diff(entries, prepend=0)
+            out = bytearray()
+            for gap, tf in zip(gaps.tolist(), tfs[keep].tolist()):
+                _encode_varint(gap, out)
+                _encode_varint(tf, out)
+            postings[term] = out
+            last_entry[term] = int(entries[-1])
+
+        self._postings = postings
+        self._last_entry = last_entry
+        self._keys = [key for key, a in zip(self._keys, self._alive) if a]
+        self._lengths = [n for n, a in zip(self._lengths, self._alive) if a]
+        self._alive = [True] * len(self._keys)
+        self._entries_by_document = {}
+        for entry, (document_id, _) in enumerate(self._keys):
+            self._entries_by_document.setdefault(document_id, []).append(entry)
+        self._arrays = None
+
+    @staticmethod
+    def _decode(data: bytes | bytearray) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        values = decode_varints(data)
+        return np.cumsum(values[0::2]), values[1::2]
+
+    def search(self, query: str, limit: int = 10) -> list[LexicalHit]:
+        """BM25スコアの上位limit件"""
+        terms = set(tokenize(query))
+        if not terms or self._live_count == 0 or limit < 1:
+            return []
+
+        if self._arrays is None:
+            self._arrays = (
+                np.asarray(self._lengths, dtype=np.float32),
+                np.asarray(self._alive, dtype=bool),
+            )
+        lengths, alive = self._arrays
+        avgdl = self._live_length / self._live_count
+        scores = np.zeros(len(self._keys), dtype=np.float32)
+
+        for term in terms:
+            data = self._postings.get(term)
+            if data is None:
+                continue
+            entries, tfs = self._decode(data)
+            live = alive[entries]
+            df = int(live.sum())
+            if df == 0:
+                continue
+            entries, tf = entries[live], tfs[live].astype(np.float32)
+            idf = np.log(1 + (self._live_count - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[entries] / avgdl)
+            scores[entries] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [
+            LexicalHit(*self._keys[entry], score=float(scores[entry])) for entry in matched
+        ]
+
+    def save(self, path: str | Path | None = None) -> None:
+        """1ファイル（npz）に書き出す。一時ファイル経由で置き換えるので読み手は壊れたファイルを見ない"""
+        path = Path(path) if path is not None else self.path
+        if path is None:
+            raise ValueError("path is required")
+        if self.tombstones:
+            self.compact()
+
+        terms = list(self._postings)
+        blob = b"".join(self._postings[t] for t in terms)
+        offsets = np.cumsum([0] + [len(self._postings[t]) for t in terms], dtype=np.int64)
+        meta = {
+            "terms": terms,
+            "last_entry": [self._last_entry[t] for t in terms],
+            "keys": self._keys,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), np.uint8),
+                postings=np.frombuffer(blob, dtype=np.uint8),
+                offsets=offsets,
+                lengths=np.asarray(self._lengths, dtype=np.int64),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LexicalIndex":
+        index = cls(path)
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            blob = data["postings"].tobytes()
+            offsets = data["offsets"].tolist()
+            lengths = data["lengths"].tolist()
+
+        for i, (term, last) in enumerate(zip(meta["terms"], meta["last_entry"])):
+            index._postings[term] = bytearray(blob[offsets[i] : offsets[i + 1]])
+            index._last_entry[term] = last
+        index._keys = [(document_id, chunk_index) for document_id, chunk_index in meta["keys"]]
+        index._lengths = lengths
+        index._alive = [True] * len(lengths)
+        for entry, (document_id, _) in enumerate(index._keys):
+            index._entries_by_document.setdefault(document_id, []).append(entry)
+        index._live_count = len(lengths)
+        index._live_length = sum(lengths)
+        watermark = meta.get("watermark")
+        index.watermark = datetime.fromisoformat(watermark) if watermark else None
+        return index
+
+    @classmethod
+    def build(
+        cls,
+        chunks: Iterable[tuple[str, Chunk]],
+        path: str | Path | None = None,
+    ) -> "LexicalIndex":
+        """(document_id, Chunk)の列から構築"""
+        index = cls(path)
+        for document_id, chunk in chunks:
+            text = chunk_text(chunk.heading, chunk.content)
+            entry = index._add(document_id, chunk.chunk_index, text)
+            index._entries_by_document.setdefault(document_id, []).append(entry)
+        return index
+
+
+def _to_chunk(chunk: IndexedChunk) -> Chunk:
+    return Chunk(chunk.chunk_index, "", chunk.heading, chunk.content)
+
+
+def _advance(watermark: datetime | None, chunk: IndexedChunk) -> datetime | None:
+    if chunk.embedded_at and (watermark is None or chunk.embedded_at > watermark):
+        return chunk.embedded_at
+    return watermark
+
+
+def build_from_repository(repo: DocsRepository, path: str | Path | None = None) -> LexicalIndex:
+    """rag.chunksの保存済みチャンクから構築"""
+    watermark: datetime | None = None
+
+    def chunks() -> Iterable[tuple[str, Chunk]]:
+        nonlocal watermark
+        for chunk in repo.iter_indexed_chunks():
+            watermark = _advance(watermark, chunk)
+            yield chunk.document_id, _to_chunk(chunk)
+
+    index = LexicalIndex.build(chunks(), path)
+    index.watermark = watermark
+    return index
+
+
+def catch_up(index: LexicalIndex, repo: DocsRepository) -> int:
+    """
+    watermark以降にembeddingされたドキュメントのチャンクで差し替え、チャンクがなくなったドキュメントを削除
+    embedded_atはトランザクション開始時刻なので、REFRESH_OVERLAPだけ遡って取り直す
+    戻り値は差し替え・削除したドキュメント数
+    """
+    since = index.watermark - REFRESH_OVERLAP if index.watermark else None
+    watermark = index.watermark
+    changed: dict[str, list[Chunk]] = {}
+    for chunk in repo.iter_indexed_chunks(since=since):
+        changed.setdefault(chunk.document_id, []).append(_to_chunk(chunk))
+        watermark = _advance(watermark, chunk)
+
+    live_ids = repo.get_chunked_document_ids()
+    removed = [d for d in index._entries_by_document if d not in live_ids]
+    for document_id, chunks in changed.items():
+        index.replace_document(document_id, chunks)
+    for document_id in removed:
+        index.remove_document(document_id)
+    index.watermark = watermark
+    return len(changed) + len(removed)
+
+
+def load_or_build(repo: DocsRepository, path: str | Path) -> LexicalIndex:
+    """保存済みインデックスを読み込んでrag.chunksに追いつかせる。なければrag.chunksから構築する"""
+    if Path(path).exists():
+        index = LexicalIndex.load(path)
+        if index.watermark is not None:
+            updated = catch_up(index, repo)
+            print(f"Lexical index caught up: {updated} documents updated")
+            return index
+        print(f"Lexical index has no watermark, rebuilding: {path}")
+    else:
+        print(f"Building lexical index from rag.chunks: {path}")
+    return build_from_repository(repo, path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lexical (BM25) index over rag.chunks")
+    parser.add_argument("path", help="Index file (.npz)")
+    parser.add_argument("--query", help="Search instead of rebuilding")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.query:
+        index = LexicalIndex.load(args.path)
+        for hit in index.search(args.query, args.limit):
+            print(f"{hit.score:8.3f}  {hit.document_id}#{hit.chunk_index}")
+        return 0
+
+    database_url = os.environ.get("DIRECT_DATABASE_URL")
+    if not database_url:
+        raise ValueError("DIRECT_DATABASE_URL is required")
+
+    repo = DocsRepository(database_url)
+    start = time.perf_counter()
+    index = build_from_repository(repo, args.path)
+    index.save()
+    repo.pool.close()
+    print(f"{index.size} chunks, {index.terms} terms, "
+          f"{index.postings_bytes / 2**20:.1f} MiB postings in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
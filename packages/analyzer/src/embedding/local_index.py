@@ -0,0 +1,606 @@
+"""In-process vector search over a memory-mapped export of rag.chunks.
+
+Layout of an index root:
+
+    CURRENT               name of the live version directory
+    v<timestamp>/
+        vectors.f32       L2-normalized float32 matrix (count x dim), row-major
+        chunks.jsonl      one metadata record per row
+        manifest.json     dim, count, watermark (max embedded_at), IVF settings
+        ivf.npz           optional coarse quantizer (centroids + inverted lists)
+
+A refresh writes a new version directory and swaps CURRENT atomically, so
+readers holding an open index keep a consistent snapshot.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from .db import DocsRepository
+from .types import Embedding, IndexedChunk
+
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+IVF_FILE = "ivf.npz"
+
+# embedded_atはトランザクション開始時刻なので、コミットが遅れた更新を取りこぼさないよう遡って再取得する
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+# 全件検索で一度にスコア計算する行数（スコア行列のメモリを抑える）
+SEARCH_BLOCK_ROWS = 65_536
+
+# エクスポート時にまとめて書き込む行数
+WRITE_BLOCK_ROWS = 4096
+
+
+@dataclass(slots=True)
+class ChunkMeta:
+    """インデックス1行分のメタデータ（chunks.jsonlの1レコード）"""
+    id: str
+    document_id: str
+    chunk_index: int
+    title: str | None
+    heading: str
+    content: str
+    file_path: str
+    tags: list[str]
+
+
+@dataclass(slots=True)
+class SearchHit:
+    """検索結果（search_chunks RPCと同じ列）"""
+    id: str
+    title: str | None
+    heading: str
+    content: str
+    file_path: str
+    similarity: float
+
+
+@dataclass(slots=True)
+class IvfIndex:
+    """
+    IVF（転置ファイル）粗量子化器
+    list_idのリストの行番号は order[offsets[list_id]:offsets[list_id + 1]]
+    """
+    centroids: npt.NDArray[np.float32]
+    order: npt.NDArray[np.int64]
+    offsets: npt.NDArray[np.int64]
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def candidates(self, query: Embedding, nprobe: int) -> npt.NDArray[np.int64]:
+        """クエリに近いnprobe個のリストに属する行番号"""
+        nprobe = max(1, min(nprobe, self.nlist))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self.order[self.offsets[list_id] : self.offsets[list_id + 1]] for list_id in lists]
+        )
+
+
+def normalize(vectors: npt.ArrayLike) -> npt.NDArray[np.float32]:
+    """行ごとにL2正規化（ゼロベクトルはそのまま）"""
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _iter_blocks(n: int, block_rows: int) -> Iterator[tuple[int, int]]:
+    for start in range(0, n, block_rows):
+        yield start, min(start + block_rows, n)
+
+
+def assign_ivf(vectors: npt.NDArray[np.float32], centroids: npt.NDArray[np.float32]) -> IvfIndex:
+    """各行を最も近いセントロイドのリストに割り当てる"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start, end in _iter_blocks(len(vectors), SEARCH_BLOCK_ROWS):
+        labels[start:end] = np.argmax(vectors[start:end] @ centroids.T, axis=1)
+
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=len(centroids))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return IvfIndex(centroids=centroids, order=order, offsets=offsets)
+
+
+def train_ivf(
+    vectors: npt.NDArray[np.float32],
+    nlist: int,
+    iterations: int = 20,
+    max_training_rows: int = 256,
+    seed: int = 0,
+) -> IvfIndex:
+    """
+    球面k-meansでセントロイドを学習してIVFを構築
+    学習にはリストあたり最大max_training_rows行のサンプルを使う
+    """
+    n = len(vectors)
+    nlist = max(1, min(nlist, n))
+    rng = np.random.default_rng(seed)
+    sample_size = min(n, nlist * max_training_rows)
+    sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))])
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        # 空になったリストは前回のセントロイドを維持
+        empty = ~np.any(sums, axis=1)
+        sums[empty] = centroids[empty]
+        centroids = normalize(sums)
+
+    return assign_ivf(vectors, centroids)
+
+
+def _top_k(
+    scores: npt.NDArray[np.float32],
+    rows: npt.NDArray[np.int64],
+    k: int,
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]:
+    """スコア上位k件を降順で返す"""
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[part], rows[part]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+class LocalIndex:
+    """
+    エクスポート済みインデックス（読み取り専用）
+    ベクトルはmemmapで開くため、検索に必要なページだけがメモリに載る
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        manifest: dict[str, Any],
+        vectors: npt.NDArray[np.float32],
+        chunks: list[ChunkMeta],
+        ivf: IvfIndex | None,
+    ):
+        self.directory = directory
+        self.manifest = manifest
+        self.vectors = vectors
+        self.chunks = chunks
+        self.ivf = ivf
+        self._tag_rows: dict[str, npt.NDArray[np.int64]] | None = None
+
+    @classmethod
+    def open(cls, root: str | Path) -> "LocalIndex":
+        """CURRENTが指すバージョンを開く"""
+        root = Path(root)
+        directory = root / (root / CURRENT_FILE).read_text().strip()
+        manifest = json.loads((directory / MANIFEST_FILE).read_text())
+
+        count, dim = manifest["count"], manifest["dim"]
+        if count:
+            vectors = np.memmap(
+                directory / VECTORS_FILE, dtype=np.float32, mode="r", shape=(count, dim)
+            )
+        else:
+            vectors = np.empty((0, dim), dtype=np.float32)
+
+        with open(directory / CHUNKS_FILE, encoding="utf-8") as f:
+            chunks = [ChunkMeta(**json.loads(line)) for line in f]
+
+        ivf = None
+        if (directory / IVF_FILE).exists():
+            with np.load(directory / IVF_FILE) as data:
+                ivf = IvfIndex(data["centroids"], data["order"], data["offsets"])
+
+        return cls(directory, manifest, vectors, chunks, ivf)
+
+    @property
+    def size(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def dim(self) -> int:
+        return int(self.manifest["dim"])
+
+    @property
+    def watermark(self) -> datetime | None:
+        """エクスポート済みの最新embedded_at"""
+        value = self.manifest.get("watermark")
+        return datetime.fromisoformat(value) if value else None
+
+    def allowed_rows(self, filter_tags: Sequence[str] | None) -> npt.NDArray[np.bool_] | None:
+        """いずれかのタグを持つ行のマスク（search_chunksの ?| と同じ意味）"""
+        if filter_tags is None:
+            return None
+
+        if self._tag_rows is None:
+            tag_rows: dict[str, list[int]] = {}
+            for row, chunk in enumerate(self.chunks):
+                for tag in chunk.tags:
+                    tag_rows.setdefault(tag, []).append(row)
+            self._tag_rows = {tag: np.asarray(rows) for tag, rows in tag_rows.items()}
+
+        mask = np.zeros(self.size, dtype=bool)
+        for tag in filter_tags:
+            rows = self._tag_rows.get(tag)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def search(
+        self,
+        query_embedding: npt.ArrayLike,
+        filter_tags: Sequence[str] | None = None,
+        match_count: int = 5,
+        similarity_threshold: float = 0.7,
+        nprobe: int | None = None,
+    ) -> list[SearchHit]:
+        """
+        コサイン類似度の上位match_count件（search_chunks RPCと同じ引数・結果）
+        nprobeを指定し、IVFがあればnprobe個のリストだけを検索する（近似）
+        """
+        return self.search_batch(
+            [query_embedding], filter_tags, match_count, similarity_threshold, nprobe
+        )[0]
+
+    def search_batch(
+        self,
+        query_embeddings: npt.ArrayLike,
+        filter_tags: Sequence[str] | None = None,
+        match_count: int = 5,
+        similarity_threshold: float = 0.7,
+        nprobe: int | None = None,
+    ) -> list[list[SearchHit]]:
+        """複数クエリをまとめて検索（全件検索はブロックごとの行列積1回で全クエリを処理）"""
+        return [
+            [self._hit(row, score) for row, score in ranked]
+            for ranked in self.search_rows(
+                query_embeddings, filter_tags, match_count, similarity_threshold, nprobe
+            )
+        ]
+
+    def search_rows(
+        self,
+        query_embeddings: npt.ArrayLike,
+        filter_tags: Sequence[str] | None = None,
+        match_count: int = 5,
+        similarity_threshold: float = 0.7,
+        nprobe: int | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """search_batchと同じ検索で、クエリごとに(行番号, 類似度)を返す"""
+        queries = normalize(query_embeddings)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"query dim {queries.shape[1]} != index dim {self.dim}")
+
+        mask = self.allowed_rows(filter_tags)
+        if match_count < 1 or self.size == 0:
+            return [[] for _ in queries]
+
+        if nprobe is not None and self.ivf is not None:
+            results = [self._search_ivf(q, mask, match_count, nprobe) for q in queries]
+        else:
+            results = self._search_exact(queries, mask, match_count)
+
+        return [
+            [(int(row), float(score)) for score, row in zip(scores, rows)
+             if score >= similarity_threshold]
+            for scores, rows in results
+        ]
+
+    def _search_exact(
+        self,
+        queries: npt.NDArray[np.float32],
+        mask: npt.NDArray[np.bool_] | None,
+        k: int,
+    ) -> list[tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]]:
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+
+        for start, end in _iter_blocks(self.size, SEARCH_BLOCK_ROWS):
+            rows = np.arange(start, end)
+            if mask is not None:
+                rows = rows[mask[start:end]]
+                if len(rows) == 0:
+                    continue
+                block = self.vectors[rows]
+            else:
+                block = self.vectors[start:end]
+
+            # ブロック内の上位kと、これまでの上位kを合わせて上位kに絞る（全クエリまとめて）
+            scores = queries @ block.T
+            kk = min(k, len(rows))
+            part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, part, 1)], 1)
+            best_rows = np.concatenate([best_rows, rows[part]], 1)
+            if best_scores.shape[1] > k:
+                part = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, part, 1)
+                best_rows = np.take_along_axis(best_rows, part, 1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, 1)
+        best_rows = np.take_along_axis(best_rows, order, 1)
+        return list(zip(best_scores, best_rows))
+
+    def _search_ivf(
+        self,
+        query: Embedding,
+        mask: npt.NDArray[np.bool_] | None,
+        k: int,
+        nprobe: int,
+    ) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]:
+        assert self.ivf is not None
+        rows = np.sort(self.ivf.candidates(query, nprobe))
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return _top_k(self.vectors[rows] @ query, rows, k)
+
+    def _hit(self, row: int, similarity: float) -> SearchHit:
+        chunk = self.chunks[row]
+        return SearchHit(
+            id=chunk.id,
+            title=chunk.title,
+            heading=chunk.heading,
+            content=chunk.content,
+            file_path=chunk.file_path,
+            similarity=similarity,
+        )
+
+
+class IndexWriter:
+    """
+    新しいバージョンディレクトリへ行を追記し、finishでCURRENTを差し替える
+    finishしなかった場合（例外など）は書きかけのディレクトリを削除する
+    """
+
+    def __init__(self, root: str | Path, dim: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.count = 0
+        self.directory = self.root / f"v{time.time_ns()}"
+        self.directory.mkdir()
+        self._vectors = open(self.directory / VECTORS_FILE, "wb")
+        self._chunks = open(self.directory / CHUNKS_FILE, "w", encoding="utf-8")
+
+    def __enter__(self) -> "IndexWriter":
+        return self
+
+    def __exit__(self, exc_type: object, exc: object, tb: object) -> None:
+        if not self._vectors.closed:
+            self._close()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def append(self, chunks: Sequence[ChunkMeta], vectors: npt.ArrayLike) -> None:
+        """行を追記（vectorsは未正規化でよい）"""
+        if not chunks:
+            return
+        block = normalize(vectors)
+        if block.shape != (len(chunks), self.dim):
+            raise ValueError(f"expected {(len(chunks), self.dim)} vectors, got {block.shape}")
+        self._vectors.write(block.tobytes())
+        for chunk in chunks:
+            self._chunks.write(json.dumps(asdict(chunk), ensure_ascii=False) + "\n")
+        self.count += len(chunks)
+
+    def finish(
+        self,
+        watermark: datetime | None,
+        nlist: int | None = None,
+        centroids: npt.NDArray[np.float32] | None = None,
+    ) -> LocalIndex:
+        """
+        manifestとIVFを書き、CURRENTを新バージョンに切り替える
+        centroidsを渡すと再学習せずに割り当てだけ行う（nlistより優先）
+        """
+        self._close()
+
+        ivf: IvfIndex | None = None
+        if self.count and (centroids is not None or nlist):
+            vectors = np.memmap(
+                self.directory / VECTORS_FILE, dtype=np.float32, mode="r",
+                shape=(self.count, self.dim),
+            )
+            if centroids is not None:
+                ivf = assign_ivf(vectors, centroids)
+            else:
+                assert nlist is not None
+                ivf = train_ivf(vectors, nlist)
+            np.savez(
+                self.directory / IVF_FILE,
+                centroids=ivf.centroids, order=ivf.order, offsets=ivf.offsets,
+            )
+            del vectors
+
+        manifest = {
+            "dim": self.dim,
+            "count": self.count,
+            "watermark": watermark.isoformat() if watermark else None,
+            "nlist": ivf.nlist if ivf is not None else None,
+            "created_at": datetime.now().astimezone().isoformat(),
+        }
+        (self.directory / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+
+        current = self.root / CURRENT_FILE
+        tmp = self.root / f"{CURRENT_FILE}.tmp"
+        tmp.write_text(self.directory.name)
+        os.replace(tmp, current)
+
+        # 旧バージョンを削除（開いているmemmapはunlink後も読める）
+        for old in self.root.glob("v*"):
+            if old.is_dir() and old != self.directory:
+                shutil.rmtree(old, ignore_errors=True)
+
+        return LocalIndex.open(self.root)
+
+    def _close(self) -> None:
+        self._vectors.close()
+        self._chunks.close()
+
+
+def _to_meta(chunk: IndexedChunk) -> ChunkMeta:
+    return ChunkMeta(
+        id=chunk.id,
+        document_id=chunk.document_id,
+        chunk_index=chunk.chunk_index,
+        title=chunk.title,
+        heading=chunk.heading,
+        content=chunk.content,
+        file_path=chunk.file_path,
+        tags=chunk.tags,
+    )
+
+
+def _write_chunks(
+    root: Path,
+    chunks: Iterable[IndexedChunk],
+    watermark: datetime | None,
+    dim: int | None = None,
+    keep: tuple[LocalIndex, npt.NDArray[np.int64]] | None = None,
+    nlist: int | None = None,
+    centroids: npt.NDArray[np.float32] | None = None,
+) -> LocalIndex:
+    """
+    既存インデックスの残す行（keep）とchunksを新バージョンに書き出す
+    dimが未指定の場合は最初のチャンクから決める
+    """
+    writer: IndexWriter | None = None
+    try:
+        if keep is not None:
+            index, rows = keep
+            writer = IndexWriter(root, index.dim)
+            for start, end in _iter_blocks(len(rows), WRITE_BLOCK_ROWS):
+                block = rows[start:end]
+                writer.append([index.chunks[r] for r in block], index.vectors[block])
+
+        metas: list[ChunkMeta] = []
+        vectors: list[Embedding] = []
+        for chunk in chunks:
+            if writer is None:
+                writer = IndexWriter(root, len(chunk.embedding))
+            metas.append(_to_meta(chunk))
+            vectors.append(chunk.embedding)
+            if chunk.embedded_at and (watermark is None or chunk.embedded_at > watermark):
+                watermark = chunk.embedded_at
+            if len(metas) >= WRITE_BLOCK_ROWS:
+                writer.append(metas, np.stack(vectors))
+                metas, vectors = [], []
+        if writer is None:
+            writer = IndexWriter(root, dim or 0)
+        if metas:
+            writer.append(metas, np.stack(vectors))
+
+        return writer.finish(watermark, nlist=nlist, centroids=centroids)
+    finally:
+        if writer is not None:
+            writer.__exit__(None, None, None)
+
+
+def _drop_unchanged(index: LocalIndex, chunks: list[IndexedChunk]) -> list[IndexedChunk]:
+    """REFRESH_OVERLAPで取り直したチャンクのうち、インデックスと同一のドキュメント分を除く"""
+    rows_by_doc: dict[str, list[int]] = {}
+    for row, meta in enumerate(index.chunks):
+        rows_by_doc.setdefault(meta.document_id, []).append(row)
+    chunks_by_doc: dict[str, list[IndexedChunk]] = {}
+    for chunk in chunks:
+        chunks_by_doc.setdefault(chunk.document_id, []).append(chunk)
+
+    def unchanged(document_id: str, doc_chunks: list[IndexedChunk]) -> bool:
+        rows = rows_by_doc.get(document_id, [])
+        if len(rows) != len(doc_chunks):
+            return False
+        if [index.chunks[row] for row in rows] != [_to_meta(chunk) for chunk in doc_chunks]:
+            return False
+        vectors = normalize(np.stack([chunk.embedding for chunk in doc_chunks]))
+        return bool(np.array_equal(vectors, index.vectors[rows]))
+
+    return [
+        chunk
+        for document_id, doc_chunks in chunks_by_doc.items()
+        if not unchanged(document_id, doc_chunks)
+        for chunk in doc_chunks
+    ]
+
+
+def export_index(repo: DocsRepository, root: str | Path, nlist: int | None = None) -> LocalIndex:
+    """
+    rag.chunksを全件エクスポートして新しいインデックスを作る
+    nlistを指定するとIVFも構築する（目安は sqrt(チャンク数)）
+    """
+    return _write_chunks(Path(root), repo.iter_indexed_chunks(), watermark=None, nlist=nlist)
+
+
+def refresh_index(repo: DocsRepository, root: str | Path) -> LocalIndex:
+    """
+    前回エクスポート以降にembeddingされたドキュメントだけを取り直してインデックスを更新
+    チャンクがなくなったドキュメントは削除する。IVFは既存セントロイドへ再割り当てする
+    """
+    root = Path(root)
+    index = LocalIndex.open(root)
+    watermark = index.watermark
+    since = watermark - REFRESH_OVERLAP if watermark else None
+
+    changed = _drop_unchanged(index, list(repo.iter_indexed_chunks(since=since)))
+    live_ids = repo.get_chunked_document_ids()
+    changed_ids = {chunk.document_id for chunk in changed}
+
+    keep = np.asarray(
+        [row for row, chunk in enumerate(index.chunks)
+         if chunk.document_id in live_ids and chunk.document_id not in changed_ids],
+        dtype=np.int64,
+    )
+    removed = index.size - len(keep)
+    if not changed and not removed:
+        print(f"Local index up to date ({index.size} chunks)")
+        return index
+
+    print(f"Refreshing local index: {removed} chunks dropped, {len(changed)} chunks added")
+    return _write_chunks(
+        root,
+        changed,
+        watermark,
+        dim=index.dim,
+        keep=(index, keep),
+        centroids=index.ivf.centroids if index.ivf is not None else None,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local rag.chunks vector index")
+    parser.add_argument("command", choices=["export", "refresh"])
+    parser.add_argument("root", help="Index directory")
+    parser.add_argument("--nlist", type=int, default=None, help="Build an IVF with N lists (export)")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DIRECT_DATABASE_URL")
+    if not database_url:
+        raise ValueError("DIRECT_DATABASE_URL is required")
+
+    repo = DocsRepository(database_url)
+    start = time.perf_counter()
+    if args.command == "export":
+        index = export_index(repo, args.root, nlist=args.nlist)
+    else:
+        index = refresh_index(repo, args.root)
+    repo.pool.close()
+
+    ivf = f", IVF {index.ivf.nlist} lists" if index.ivf is not None else ""
+    print(f"{index.size} chunks x {index.dim} dims{ivf} in {time.perf_counter() - start:.1f}s")
+    print(f"Watermark: {index.watermark}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
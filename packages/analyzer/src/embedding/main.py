@@ -1,9 +1,15 @@
 """Entry point for embedding analyzer."""
 
+import signal
 import sys
+import threading
+from typing import Any
 
 from .config import load_config
 from .pipeline import EmbeddingPipeline
+from .watch import DocumentWatcher
+
+_PHASES = ("fetch", "prepare", "diff", "embed", "save")
 
 
 def main() -> int:
@@ -13,11 +19,31 @@ def main() -> int:
     config = load_config()
     pipeline = EmbeddingPipeline(config)
 
+    if config.watch:
+        return _watch(pipeline)
+
     result = pipeline.run()
 
+    stats = pipeline.db.pool.stats
+    pipeline.db.pool.close()
+    pipeline.metrics.close()
+
     print("\nProcessing completed:")
     print(f"  Processed: {result.processed}")
     print(f"  Skipped:   {result.skipped}")
+    print(f"  Reused:    {result.chunks_reused} chunks")
+    if result.duplicates_collapsed:
+        print(
+            f"  Dedup:     {result.duplicates_collapsed} duplicate texts, "
+            f"{result.tokens_saved} API tokens saved"
+        )
+    print(f"  DB pool:   {stats.hits} hits / {stats.misses} misses ({stats.hit_rate:.0%} reuse)")
+    if result.cache_hits or result.cache_misses:
+        print(
+            f"  Cache:     {result.cache_hits} hits / {result.cache_misses} misses "
+            f"({result.cache_hit_rate:.0%} hit rate)"
+        )
+    _print_phases(pipeline.metrics.summary())
 
     if result.errors:
         print("\nErrors:")
@@ -28,5 +54,52 @@ def main() -> int:
     return 0
 
 
+def _print_phases(summary: dict[str, Any]) -> None:
+    """フェーズごとの所要時間とAPI呼び出しの内訳"""
+    spans = summary["spans"]
+    counters = summary["counters"]
+    phases = [name for name in _PHASES if name in spans]
+    if phases:
+        print("  Phases:    " + ", ".join(f"{name} {spans[name]['seconds']:.1f}s" for name in phases))
+    if "api.embed" in spans:
+        api = spans["api.embed"]
+        waited = spans.get("api.rate_limit", {}).get("seconds", 0.0)
+        print(
+            f"  API:       {api['count']} calls, {api['seconds']:.1f}s "
+            f"(max {api['max_seconds']:.1f}s), {waited:.1f}s rate-limited, "
+            f"{int(counters.get('api_retries', 0))} retries, "
+            f"{int(counters.get('tokens_sent', 0))} tokens"
+        )
+    print(
+        f"  Written:   {int(counters.get('chunks_written', 0))} chunks, "
+        f"{counters.get('bytes_written', 0) / 2**20:.1f} MiB"
+    )
+    print(f"  Peak RSS:  {summary['peak_rss_bytes'] / 2**20:.0f} MiB")
+
+
+def _watch(pipeline: EmbeddingPipeline) -> int:
+    """SIGINT/SIGTERMを受けるまでwatchモードで動く"""
+    config = pipeline.config
+    watcher = DocumentWatcher(
+        pipeline,
+        debounce=config.watch_debounce_seconds,
+        max_delay=config.watch_max_delay_seconds,
+        poll_interval=config.watch_poll_seconds,
+    )
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    stats = watcher.run(stop)
+    pipeline.db.pool.close()
+    pipeline.metrics.close()
+
+    print("\nWatch stopped:")
+    print(f"  Notifications: {stats.notifications} ({stats.batches} batches, {stats.polls} polls)")
+    print(f"  Processed:     {stats.processed} ({stats.errors} errors)")
+    print(f"  Freshness lag: p50 {stats.lag_p50:.1f}s / p99 {stats.lag_p99:.1f}s")
+    return 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,202 @@
+"""Run metrics: timing spans and counters, emitted as JSON lines and a Prometheus textfile.
+
+Spans wrap each pipeline phase and each API/DB call. Every finished span
+(and every gauge update) is appended to the JSON lines file as it happens, so a slow or killed run still
+shows where the time went. At the end of a run a summary line is appended and
+the Prometheus textfile (for node_exporter's textfile collector) is replaced
+atomically.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, TextIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+_PREFIX = "embedding"
+
+
+@dataclass(slots=True)
+class SpanStats:
+    """スパン名ごとの集計"""
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    errors: int = 0
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """
+    最大常駐メモリ（childrenなら終了済み子プロセスのうち最大のもの）
+    resourceモジュールがない環境（Windows）では0
+    """
+    if resource is None:
+        return 0
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class Metrics:
+    """
+    1回の実行（watchモードではデーモンの起動から）の計測。スレッドセーフ
+    events_pathを指定するとスパンが終わるたびに1行のJSONを追記する
+    """
+
+    def __init__(
+        self,
+        events_path: str | Path | None = None,
+        textfile_path: str | Path | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.textfile_path = Path(textfile_path) if textfile_path else None
+        self.spans: dict[str, SpanStats] = {}
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, dict[str, float]] = {}  # 名前 -> Prometheusのラベル文字列 -> 値
+        self._clock = clock
+        self._start = clock()
+        self._lock = threading.Lock()
+        self._events: TextIO | None = None
+        if events_path:
+            Path(events_path).parent.mkdir(parents=True, exist_ok=True)
+            self._events = open(events_path, "a", encoding="utf-8")
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+        """
+        withブロックの所要時間をnameで記録する（例外で抜けた場合もエラーとして記録）
+        yieldした辞書に入れた値はJSON行の属性に加わる
+        """
+        start = self._clock()
+        error: str | None = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._record(name, self._clock() - start, attrs, error)
+
+    def add(self, name: str, value: float = 1) -> None:
+        """カウンタを加算"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float, **labels: str) -> None:
+        """ゲージを最新の値で上書きする（events_pathを指定していれば1行のJSONも追記）"""
+        key = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        with self._lock:
+            self.gauges.setdefault(name, {})[key] = value
+            if self._events is not None:
+                event = {"run_id": self.run_id, "ts": time.time(), "gauge": name,
+                         "value": value, **labels}
+                self._events.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def _record(self, name: str, seconds: float, attrs: dict[str, Any], error: str | None) -> None:
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = SpanStats()
+            stats.count += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if error is not None:
+                stats.errors += 1
+            if self._events is not None:
+                event = {"run_id": self.run_id, "ts": time.time(), "span": name,
+                         "seconds": round(seconds, 6), **attrs}
+                if error is not None:
+                    event["error"] = error
+                self._events.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def summary(self) -> dict[str, Any]:
+        """ここまでの集計（スパン・カウンタ・最大常駐メモリ）"""
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "seconds": round(self._clock() - self._start, 6),
+                "spans": {
+                    name: {"count": s.count, "seconds": round(s.seconds, 6),
+                           "max_seconds": round(s.max_seconds, 6), "errors": s.errors}
+                    for name, s in sorted(self.spans.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": {
+                    name: dict(sorted(values.items()))
+                    for name, values in sorted(self.gauges.items())
+                },
+                "peak_rss_bytes": peak_rss_bytes(),
+                "children_peak_rss_bytes": peak_rss_bytes(children=True),
+            }
+
+    def flush(self) -> dict[str, Any]:
+        """集計をJSON行（span="summary"）とPrometheusのtextfileに書き出して返す"""
+        summary = self.summary()
+        with self._lock:
+            if self._events is not None:
+                self._events.write(json.dumps({"span": "summary", "ts": time.time(), **summary}) + "\n")
+                self._events.flush()
+        if self.textfile_path is not None:
+            write_textfile(self.textfile_path, summary)
+        return summary
+
+    def close(self) -> None:
+        with self._lock:
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+
+
+def format_prometheus(summary: dict[str, Any]) -> str:
+    """summary()をPrometheusのテキスト形式に変換"""
+    lines: list[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+        lines.append(f"# HELP {_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {_PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{_PREFIX}_{name}{labels} {float(value)!r}")
+
+    spans = summary["spans"]
+    metric("run_start_time_seconds", "gauge", "Unix time the run started.",
+           [("", summary["started_at"])])
+    metric("run_duration_seconds", "gauge", "Wall time of the run so far.",
+           [("", summary["seconds"])])
+    metric("span_seconds", "summary", "Time spent in each phase or call.",
+           [(f'_sum{{span="{name}"}}', s["seconds"]) for name, s in spans.items()]
+           + [(f'_count{{span="{name}"}}', s["count"]) for name, s in spans.items()])
+    metric("span_max_seconds", "gauge", "Slowest single occurrence of each span.",
+           [(f'{{span="{name}"}}', s["max_seconds"]) for name, s in spans.items()])
+    metric("span_errors_total", "counter", "Spans that ended with an exception.",
+           [(f'{{span="{name}"}}', s["errors"]) for name, s in spans.items()])
+    for name, value in summary["counters"].items():
+        metric(f"{name}_total", "counter", f"Total {name.replace('_', ' ')}.", [("", value)])
+    for name, values in summary["gauges"].items():
+        metric(name, "gauge", f"Latest {name.replace('_', ' ')}.",
+               [(f"{{{labels}}}" if labels else "", value) for labels, value in values.items()])
+    metric("peak_rss_bytes", "gauge", "Peak resident set size.",
+           [('{process="self"}', summary["peak_rss_bytes"]),
+            ('{process="children"}', summary["children_peak_rss_bytes"])])
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: Path, summary: dict[str, Any]) -> None:
+    """一時ファイルに書いてからrenameする（収集中に書きかけのファイルを読ませない）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(format_prometheus(summary), encoding="utf-8")
+    os.replace(tmp, path)
@@ -0,0 +1,231 @@
+"""Embedding model migration: backfill a shadow column, then swap atomically.
+
+A migration re-embeds every chunk of rag.chunks with the target model into
+rag.chunks.embedding_next, in document id order, checkpointing the last
+finished document in rag.embedding_models so an interrupted run resumes
+where it stopped. API usage is throttled to a token budget per hour.
+
+Search keeps reading rag.chunks.embedding the whole time. Chunks that the
+regular pipeline rewrites during the backfill are picked up by a catch-up
+pass, and the swap refuses to run until every chunk has a current shadow
+embedding and the new HNSW index (built CONCURRENTLY) is valid.
+The NOT NULL of the new binary codes is proven by a CHECK constraint
+validated before the swap, so the swap itself never scans rag.chunks.
+"""
+
+import argparse
+import sys
+import time
+
+from .cache import EmbeddingCache, create_embedding_cache, text_hash
+from .config import Config, load_config
+from .db import DocsRepository, get_pool
+from .embedder import EmbeddingClient
+from .preparation import DocumentPreparer
+from .resilience import CircuitBreaker
+from .types import Embedding, EmbeddingModel, RawDocument
+
+_DIMENSION_PROBE = "dimension probe"
+
+
+class ModelMigration:
+    """
+    rag.chunksを別モデルで再embeddingし、準備ができたら切り替える
+    APIに送るトークン数はtokens_per_hourに収まるよう絞る
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        model: str,
+        tokens_per_hour: float,
+        output_dimension: int | None = None,
+        page_size: int = 50,
+    ):
+        self.config = config
+        self.model = model
+        self.output_dimension = output_dimension
+        self.page_size = page_size
+        pool = get_pool(config.database_url, config.pool_size)
+        self.db = DocsRepository(config.database_url, pool)
+        self.cache: EmbeddingCache | None = create_embedding_cache(config, pool)
+        # 1分あたりの予算をバケット容量にするので、1バッチがそれを超えないようにする
+        tokens_per_minute = tokens_per_hour / 60
+        self.embedder = EmbeddingClient(
+            config.voyage_api_key,
+            config.batch_size,
+            max_batch_tokens=max(1, min(config.max_batch_tokens, int(tokens_per_minute))),
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            breaker=CircuitBreaker(config.breaker_failures, config.breaker_reset_seconds),
+            model=model,
+            output_dimension=output_dimension,
+        )
+
+    def start(self) -> EmbeddingModel:
+        """移行を開始（再開）する。次元数が指定されていなければ1回APIを呼んで確かめる"""
+        dimensions = self.output_dimension
+        if dimensions is None:
+            dimensions = self.embedder.embed_texts([_DIMENSION_PROBE]).shape[1]
+        migration = self.db.start_model_migration(self.model, dimensions, self.output_dimension)
+        print(
+            f"Migrating to {self.model} ({dimensions} dimensions), "
+            f"{migration.chunks_embedded} chunks done so far"
+        )
+        return migration
+
+    def backfill(self) -> int:
+        """チェックポイントの次のドキュメントからID順に全件を移行し、書いたチャンク数を返す"""
+        migration = self.start()
+        after_id = migration.last_document_id
+        written = 0
+        with DocumentPreparer(self.config.max_tokens, self.config.chunk_workers) as preparer:
+            while docs := self.db.get_current_documents_after(after_id, self.page_size):
+                after_id = docs[-1].id
+                written += self._migrate(preparer, docs, after_id)
+        print(f"Backfill finished: {written} chunks written")
+        return written
+
+    def catch_up(self) -> int:
+        """
+        バックフィル中に通常のパイプラインが書き直したチャンクを移行する
+        1周して1件も書けなければ止める（embedding待ちのドキュメントは通常の実行の後に拾う）
+        """
+        written = 0
+        with DocumentPreparer(self.config.max_tokens, self.config.chunk_workers) as preparer:
+            while docs := self.db.get_stale_shadow_documents(self.page_size):
+                count = self._migrate(preparer, docs, None)
+                if count == 0:
+                    break
+                written += count
+        return written
+
+    def swap(self) -> None:
+        """残りを移行し、インデックスを作ってから切り替える"""
+        self.catch_up()
+        stale = self.db.count_stale_shadow_chunks()
+        if stale:
+            raise ValueError(
+                f"{stale} chunks are not migrated yet "
+                "(run the embedding pipeline for pending documents, then retry)"
+            )
+        start = time.perf_counter()
+        self.db.build_shadow_index()
+        print(f"Built index in {time.perf_counter() - start:.1f}s")
+        self.db.validate_shadow_bits()
+        try:
+            self.db.swap_embedding_model(self.model)
+        except Exception:
+            # 制約を残すと、通常のパイプラインが新しいチャンクを挿入できない
+            self.db.drop_shadow_bits_check()
+            raise
+        print(f"Switched rag.chunks.embedding to {self.model}")
+
+    def _migrate(
+        self,
+        preparer: DocumentPreparer,
+        docs: list[RawDocument],
+        last_document_id: str | None,
+    ) -> int:
+        """ドキュメントのうちshadow列が古いチャンクだけをembeddingして書き込む"""
+        shadows = self.db.get_shadow_chunks([d.id for d in docs])
+        texts: dict[str, str] = {}  # text_hash -> テキスト（ページ内で重複を除く）
+        token_counts: dict[str, int] = {}
+        targets: list[tuple[str, str]] = []  # (chunk id, text_hash)
+
+        for doc, prepared in zip(docs, preparer.prepare(docs)):
+            if prepared is None:
+                continue
+            by_index = {c.chunk_index: c for c in shadows.get(doc.id, [])}
+            for chunk, text, tokens in zip(prepared.chunks, prepared.texts, prepared.token_counts):
+                shadow = by_index.get(chunk.chunk_index)
+                h = text_hash(text)
+                # 保存済みのチャンクと別のテキストになったもの（チャンキング規則の変更など）は
+                # 通常のパイプラインで書き直されるまで移行しない
+                if shadow is None or shadow.text_hash not in (None, h) or shadow.shadow_hash == h:
+                    continue
+                texts[h] = text
+                token_counts[h] = tokens
+                targets.append((shadow.id, h))
+
+        embeddings, misses = self._embed(texts, token_counts)
+        tokens = sum(token_counts[h] for h in misses)
+        rows = [(chunk_id, h, embeddings[h]) for chunk_id, h in targets]
+        updated = self.db.save_shadow_embeddings(self.model, rows, last_document_id, tokens)
+        print(f"  {len(docs)} documents, {updated} chunks ({tokens} tokens)")
+        return updated
+
+    def _embed(
+        self,
+        texts: dict[str, str],
+        token_counts: dict[str, int],
+    ) -> tuple[dict[str, Embedding], list[str]]:
+        """キャッシュ（モデルごと）を引き、なかったものだけAPIでembeddingする（APIに送ったhashも返す）"""
+        hashes = list(texts)
+        cached = self.cache.get_many(self.model, hashes) if self.cache and hashes else {}
+        misses = [h for h in hashes if h not in cached]
+        if not misses:
+            return cached, misses
+
+        matrix = self.embedder.embed_texts(
+            [texts[h] for h in misses], [token_counts[h] for h in misses]
+        )
+        embedded = dict(zip(misses, matrix))
+        if self.cache:
+            self.cache.put_many(self.model, embedded)
+        return {**cached, **embedded}, misses
+
+
+def _print_status(db: DocsRepository) -> None:
+    for m in db.get_embedding_models():
+        line = f"{m.status:9}  {m.model}  {m.dimensions} dimensions"
+        if m.status == "migrating":
+            line += f", {m.chunks_embedded} chunks / {m.tokens_used} tokens embedded"
+            line += f", {db.count_stale_shadow_chunks()} chunks left"
+        print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Re-embed rag.chunks with another model")
+    parser.add_argument("model", nargs="?", help="Target model (e.g. voyage-3.5-lite)")
+    parser.add_argument("--tokens-per-hour", type=float, default=10_000_000,
+                        help="API token budget per hour")
+    parser.add_argument("--output-dimension", type=int, help="output_dimension for the API")
+    parser.add_argument("--page-size", type=int, default=50, help="Documents per checkpoint")
+    parser.add_argument("--swap", action="store_true",
+                        help="After the backfill, build the index and switch search to the model")
+    parser.add_argument("--cancel", action="store_true", help="Abort the migration to the model")
+    parser.add_argument("--status", action="store_true", help="Show models and progress")
+    parser.add_argument("--drop-previous", action="store_true",
+                        help="Drop the embedding column kept from before the last swap")
+    args = parser.parse_args()
+
+    config = load_config()
+    db = DocsRepository(config.database_url, get_pool(config.database_url, config.pool_size))
+    try:
+        if args.status:
+            _print_status(db)
+            return 0
+        if args.drop_previous:
+            db.drop_previous_embeddings()
+            return 0
+        if not args.model:
+            parser.error("model is required")
+        if args.cancel:
+            db.cancel_model_migration(args.model)
+            print(f"Cancelled migration to {args.model}")
+            return 0
+
+        migration = ModelMigration(
+            config, args.model, args.tokens_per_hour, args.output_dimension, args.page_size
+        )
+        migration.backfill()
+        if args.swap:
+            migration.swap()
+        return 0
+    finally:
+        db.pool.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""PostgreSQL binary COPY encoding (including pgvector's wire format)."""
+
+import struct
+import uuid
+from typing import Any, Callable, Iterable, Sequence
+
+import numpy as np
+
+_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+
+
+def _encode_uuid(value: Any) -> bytes:
+    return uuid.UUID(str(value)).bytes
+
+
+def _encode_int4(value: Any) -> bytes:
+    return struct.pack(">i", value)
+
+
+def _encode_text(value: Any) -> bytes:
+    return str(value).encode("utf-8")
+
+
+def _encode_vector(value: Any) -> bytes:
+    """pgvector vector_recv形式: int16 次元数, int16 予約(0), float4 × 次元数（ビッグエンディアン）"""
+    arr = np.asarray(value, dtype=">f4")
+    return struct.pack(">HH", arr.shape[0], 0) + arr.tobytes()
+
+
+def _encode_varbit(value: Any) -> bytes:
+    """varbit_recv形式: int32 ビット数, 先頭ビットを最上位に詰めたバイト列"""
+    bits = np.asarray(value, dtype=bool)
+    return struct.pack(">i", bits.shape[0]) + np.packbits(bits).tobytes()
+
+
+_ENCODERS: dict[str, Callable[[Any], bytes]] = {
+    "uuid": _encode_uuid,
+    "int4": _encode_int4,
+    "text": _encode_text,
+    "vector": _encode_vector,
+    "varbit": _encode_varbit,
+}
+
+
+def encode_copy_binary(rows: Iterable[Sequence[Any]], kinds: Sequence[str]) -> bytes:
+    """
+    行をCOPY ... FROM STDIN WITH (FORMAT binary) 用のバイト列に変換
+    kindsは各列の型（uuid / int4 / text / vector / varbit）
+    """
+    encoders = [_ENCODERS[kind] for kind in kinds]
+    field_count = struct.pack(">h", len(kinds))
+
+    buf = bytearray(_HEADER)
+    for row in rows:
+        buf += field_count
+        for value, encode in zip(row, encoders):
+            if value is None:
+                buf += _NULL
+                continue
+            data = encode(value)
+            buf += struct.pack(">i", len(data))
+            buf += data
+    buf += _TRAILER
+    return bytes(buf)
@@ -1,13 +1,28 @@
 """Embedding pipeline orchestration."""
 
 import sys
-from dataclasses import dataclass
+from itertools import islice
 
-from .chunker import build_embedding_text, chunk_document, filter_empty_chunks
+from .cache import EmbeddingCache, SqliteEmbeddingCache, create_embedding_cache, text_hash
 from .config import Config
-from .db import DocsRepository
-from .embedder import EmbeddingClient
-from .types import Chunk, ChunkWithEmbedding, ProcessingResult, RawDocument
+from .db import DocsRepository, get_pool
+from .dedup import plan_dedup
+from .diff import ChunkDiff, diff_chunks
+from .embedder import DEFAULT_MODEL, AsyncEmbeddingClient, EmbeddingClient, EmbeddingMatrix
+from .lease import LeaseHeartbeat, default_worker_id
+from .lexical import LexicalIndex, load_or_build
+from .metrics import Metrics
+from .preparation import DocumentPreparer
+from .resilience import CircuitBreaker
+from .types import (
+    ChunkWithEmbedding,
+    DocumentWrite,
+    Embedding,
+    EmbeddingModel,
+    PreparedDocument,
+    ProcessingResult,
+    RawDocument,
+)
 
 # Windows console encoding fix
 if sys.platform == "win32":
@@ -15,119 +30,559 @@ if sys.platform == "win32":
     sys.stderr.reconfigure(encoding="utf-8", errors="replace")  # type: ignore
 
 
-@dataclass
-class PreparedDocument:
-    """チャンキング済みドキュメント"""
-
-    doc: RawDocument
-    chunks: list[Chunk]
-    texts: list[str]
-
-
 class EmbeddingPipeline:
     """Embeddingパイプライン"""
 
     def __init__(self, config: Config):
         self.config = config
-        self.db = DocsRepository(config.database_url)
-        self.embedder = EmbeddingClient(config.voyage_api_key, config.batch_size)
+        pool = get_pool(config.database_url, config.pool_size)
+        self.db = DocsRepository(config.database_url, pool)
+        self.cache: EmbeddingCache | None = create_embedding_cache(config, pool)
+        # 実行途中のembedding（中断後の再実行で完了済みバッチを再利用する）
+        self.checkpoint: SqliteEmbeddingCache | None = (
+            SqliteEmbeddingCache(config.checkpoint_path) if config.checkpoint_path else None
+        )
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_reset_seconds)
+        # フェーズ・API/DB呼び出しごとの所要時間とカウンタ
+        self.metrics = Metrics(config.metrics_path or None, config.metrics_textfile or None)
+        # rag.chunks.embeddingが保持しているモデルでembeddingする（モデル移行の切り替えに追従）
+        self.active_model = self.db.get_active_embedding_model()
+        self.embedder = self._create_embedder(self.active_model)
+        # ワークキューモードでは保存時にこのIDでリースを確認・解放する
+        self.lease_owner: str | None = (
+            (config.worker_id or default_worker_id()) if config.work_queue else None
+        )
+        self.lexical: LexicalIndex | None = None
+        if config.lexical_index_path:
+            self.lexical = load_or_build(self.db, config.lexical_index_path)
+
+    def _create_embedder(
+        self, active_model: EmbeddingModel | None
+    ) -> EmbeddingClient | AsyncEmbeddingClient:
+        config = self.config
+        model = active_model.model if active_model else DEFAULT_MODEL
+        output_dimension = active_model.output_dimension if active_model else None
+        if config.max_concurrency > 1:
+            return AsyncEmbeddingClient(
+                config.voyage_api_key,
+                config.batch_size,
+                max_batch_tokens=config.max_batch_tokens,
+                max_concurrency=config.max_concurrency,
+                requests_per_minute=config.requests_per_minute,
+                tokens_per_minute=config.tokens_per_minute,
+                breaker=self.breaker,
+                model=model,
+                output_dimension=output_dimension,
+                metrics=self.metrics,
+            )
+        return EmbeddingClient(
+            config.voyage_api_key,
+            config.batch_size,
+            max_batch_tokens=config.max_batch_tokens,
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            breaker=self.breaker,
+            model=model,
+            output_dimension=output_dimension,
+            metrics=self.metrics,
+        )
+
+    def _sync_model(self) -> None:
+        """前回の実行後にモデル移行で切り替わっていれば、新しいモデルのクライアントに差し替える"""
+        active = self.db.get_active_embedding_model()
+        if active is not None and active.model != self.embedder.model:
+            print(f"Embedding model switched: {self.embedder.model} -> {active.model}")
+            self.active_model = active
+            self.embedder = self._create_embedder(active)
 
     def run(self) -> ProcessingResult:
         """パイプライン実行"""
+        self._sync_model()
+        try:
+            with self.metrics.span("run"):
+                if self.config.work_queue:
+                    result = self._run_work_queue()
+                elif self.config.stream:
+                    result = self._run_streaming()
+                else:
+                    result = self._run_batch()
+        finally:
+            # 途中で失敗しても、コミット済みのウィンドウ分はBM25インデックスに残す
+            self._save_lexical()
+        self._finish(result)
+        return result
+
+    def process_documents(self, document_ids: list[str]) -> ProcessingResult:
+        """指定したドキュメントのうちembeddingが必要なものだけを処理（watchモードの通知用）"""
+        self._sync_model()
+        with self.metrics.span("fetch"), self.db.session():
+            docs = self.db.get_documents_needing_embedding_by_ids(document_ids)
+            superseded_ids = self.db.get_superseded_document_ids() if docs else set()
+
+        result = ProcessingResult()
+        if docs:
+            try:
+                with self.metrics.span("run"):
+                    self._process(docs, superseded_ids, result)
+            finally:
+                self._save_lexical()
+            self._finish(result)
+        return result
+
+    def _save_lexical(self) -> None:
+        """
+        BM25インデックスを保存（失敗しても実行結果は変えない）
+        保存されなかった更新は次回の読み込み時にwatermarkから追いつく
+        """
+        if self.lexical is None:
+            return
+        try:
+            with self.metrics.span("lexical.save"):
+                self.lexical.save()
+        except OSError as e:
+            print(f"[WARN] Lexical index save failed: {e}")
+            return
+        print(f"Lexical index: {self.lexical.size} chunks, {self.lexical.terms} terms")
+
+    def _finish(self, result: ProcessingResult) -> None:
+        """チェックポイントの後始末とメトリクスの書き出し"""
+        # エラーがなければ途中結果は不要（あれば次回の再実行で使う）
+        if self.checkpoint is not None and not result.errors:
+            self.checkpoint.clear()
+
+        self.metrics.add("documents_processed", result.processed)
+        self.metrics.add("documents_skipped", result.skipped)
+        self.metrics.add("document_errors", len(result.errors))
+        self.metrics.add("chunks_reused", result.chunks_reused)
+        self.metrics.add("cache_hits", result.cache_hits)
+        self.metrics.add("cache_misses", result.cache_misses)
+        try:
+            self.metrics.flush()
+        except OSError as e:
+            print(f"[WARN] Metrics write failed: {e}")
+
+    def _run_batch(self) -> ProcessingResult:
+        """全ドキュメントを読み込んでからまとめてembedding・保存"""
         result = ProcessingResult()
 
-        # embedding対象ドキュメントを取得
-        docs = self.db.get_documents_needing_embedding()
+        # embedding対象ドキュメントと旧バージョンIDを1接続・1スナップショットで取得
+        with self.metrics.span("fetch"), self.db.session():
+            docs = self.db.get_documents_needing_embedding()
+            superseded_ids = self.db.get_superseded_document_ids() if docs else set()
         print(f"Found {len(docs)} documents needing embedding")
 
-        if not docs:
-            return result
+        if docs:
+            self._process(docs, superseded_ids, result)
+        return result
 
+    def _process(
+        self,
+        docs: list[RawDocument],
+        superseded_ids: set[str],
+        result: ProcessingResult,
+    ) -> None:
+        """旧バージョンを除いてチャンキングし、まとめてembedding・保存"""
         # 旧バージョンを除外
-        superseded_ids = self.db.get_superseded_document_ids()
         target_docs = [d for d in docs if d.id not in superseded_ids]
-        result.skipped = len(docs) - len(target_docs)
+        result.skipped += len(docs) - len(target_docs)
 
         if result.skipped > 0:
             print(f"Excluded {result.skipped} superseded documents")
 
         if not target_docs:
-            return result
+            return
 
         # Phase 1: 全ドキュメントをチャンキング
         print("Chunking documents...")
         prepared: list[PreparedDocument] = []
         empty_docs: list[RawDocument] = []
 
-        for doc in target_docs:
-            chunks = chunk_document(doc, self.config.max_tokens)
-            chunks = filter_empty_chunks(chunks)
+        with self.metrics.span("prepare", documents=len(target_docs)), self._preparer() as preparer:
+            for doc, p in zip(target_docs, preparer.prepare(target_docs)):
+                if p is None:
+                    empty_docs.append(doc)
+                else:
+                    prepared.append(p)
 
-            if not chunks:
-                empty_docs.append(doc)
-            else:
-                texts = [build_embedding_text(c, doc.frontmatter) for c in chunks]
-                prepared.append(PreparedDocument(doc=doc, chunks=chunks, texts=texts))
+        self._embed_and_save(prepared, empty_docs, result)
+
+    def _run_streaming(self) -> ProcessingResult:
+        """
+        ストリーミング実行
+        サーバーサイドカーソルでドキュメントを読み、ウィンドウ
+        （window_docs件またはwindow_tokensトークン）ごとにembedding・コミットする
+        """
+        if self.db.pool.size < 2:
+            raise ValueError("Streaming mode requires DB_POOL_SIZE >= 2")
+
+        result = ProcessingResult()
+        with self.metrics.span("fetch"):
+            superseded_ids = self.db.get_superseded_document_ids()
+
+        found = 0
+        windows = 0
+        prepared: list[PreparedDocument] = []
+        empty_docs: list[RawDocument] = []
+        window_tokens = 0
+
+        documents = self.db.iter_documents_needing_embedding()
+        # チャンキングは並列度に応じた件数ずつまとめて行う（読み込み量は常に有界）
+        slice_size = max(1, self.config.chunk_workers) * 8
+
+        with self._preparer() as preparer:
+            while True:
+                with self.metrics.span("fetch"):
+                    docs = list(islice(documents, slice_size))
+                if not docs:
+                    break
+                found += len(docs)
+                target_docs = [d for d in docs if d.id not in superseded_ids]
+                result.skipped += len(docs) - len(target_docs)
+
+                with self.metrics.span("prepare", documents=len(target_docs)):
+                    target_prepared = preparer.prepare(target_docs)
+                for doc, p in zip(target_docs, target_prepared):
+                    if p is None:
+                        empty_docs.append(doc)
+                    else:
+                        prepared.append(p)
+                        window_tokens += sum(p.token_counts)
+
+                    if (
+                        len(prepared) + len(empty_docs) >= self.config.window_docs
+                        or window_tokens >= self.config.window_tokens
+                    ):
+                        windows += 1
+                        print(f"Window {windows}: {len(prepared) + len(empty_docs)} documents")
+                        self._embed_and_save(prepared, empty_docs, result)
+                        prepared, empty_docs, window_tokens = [], [], 0
+
+        if prepared or empty_docs:
+            windows += 1
+            print(f"Window {windows}: {len(prepared) + len(empty_docs)} documents")
+            self._embed_and_save(prepared, empty_docs, result)
+
+        print(f"Found {found} documents needing embedding ({windows} windows)")
+        if result.skipped > 0:
+            print(f"Excluded {result.skipped} superseded documents")
 
-        # 空ドキュメントの処理
-        for doc in empty_docs:
-            self.db.record_embedding_hash(doc.id, doc.content_hash)
-            result.processed += 1
+        return result
+
+    def _run_work_queue(self) -> ProcessingResult:
+        """
+        ワークキュー実行
+        embeddingが必要なドキュメントをclaim_size件ずつリースし、embedding・保存してリースを解放する
+        複数のワーカー（別プロセス・別ホスト）を同時に起動しても同じドキュメントは処理しない
+        失敗したドキュメントのリースは期限切れまで残し、このワーカーがすぐに取り直さないようにする
+        """
+        assert self.lease_owner is not None
+        result = ProcessingResult()
+        claimed = 0
+        claims = 0
+
+        with (
+            LeaseHeartbeat(self.db, self.lease_owner, self.config.lease_seconds) as heartbeat,
+            self._preparer() as preparer,
+        ):
+            while docs := self._claim():
+                claims += 1
+                claimed += len(docs)
+                document_ids = [d.id for d in docs]
+                heartbeat.hold(document_ids)
+                print(f"Claim {claims}: {len(docs)} documents")
+
+                prepared: list[PreparedDocument] = []
+                empty_docs: list[RawDocument] = []
+                with self.metrics.span("prepare", documents=len(docs)):
+                    claimed_prepared = preparer.prepare(docs)
+                for doc, p in zip(docs, claimed_prepared):
+                    if p is None:
+                        empty_docs.append(doc)
+                    else:
+                        prepared.append(p)
+                self._embed_and_save(prepared, empty_docs, result)
+                heartbeat.drop(document_ids)
+
+        print(f"Worker {self.lease_owner}: claimed {claimed} documents ({claims} claims)")
+        return result
+
+    def _claim(self) -> list[RawDocument]:
+        assert self.lease_owner is not None
+        with self.metrics.span("fetch"):
+            return self.db.claim_documents(
+                self.lease_owner, self.config.claim_size, self.config.lease_seconds
+            )
+
+    def _preparer(self) -> DocumentPreparer:
+        """チャンキング処理（chunk_workers > 1 ならプロセスプールで並列）"""
+        return DocumentPreparer(self.config.max_tokens, self.config.chunk_workers)
+
+    def _embed_and_save(
+        self,
+        prepared: list[PreparedDocument],
+        empty_docs: list[RawDocument],
+        result: ProcessingResult,
+    ) -> None:
+        """
+        チャンキング済みドキュメント群をembeddingしてDB保存
+        保存済みチャンクがあるドキュメントは差分を取り、新規・変更チャンクだけembeddingする
+        """
+        # 空ドキュメントの処理（既存チャンクの削除とhash記録）
+        empty_writes = [(doc, DocumentWrite(doc.id, doc.content_hash)) for doc in empty_docs]
+        saved_empty: list[tuple[RawDocument, DocumentWrite]] = []
+        if empty_writes:
+            with self.metrics.span("save", documents=len(empty_writes)):
+                saved_empty = self._save(empty_writes, result)
+        for doc, _ in saved_empty:
             print(f"  Empty: {doc.file_path}")
+            if self.lexical is not None:
+                self.lexical.remove_document(doc.id)
 
         if not prepared:
-            return result
+            return
 
-        # Phase 2: 全テキストを集約してバッチembedding
-        print(f"Embedding {sum(len(p.texts) for p in prepared)} chunks from {len(prepared)} documents...")
+        # 保存済みチャンクとの差分
+        with self.metrics.span("diff", documents=len(prepared)):
+            existing = (
+                self.db.get_existing_chunks([p.doc.id for p in prepared])
+                if self.config.incremental
+                else {}
+            )
+        hashes = [[text_hash(t) for t in p.texts] for p in prepared]
+        diffs: list[ChunkDiff | None] = []
+        for p, doc_hashes in zip(prepared, hashes):
+            rows = existing.get(p.doc.id)
+            if rows:
+                diffs.append(diff_chunks(
+                    rows, [(c.chunk_index, h) for c, h in zip(p.chunks, doc_hashes)]
+                ))
+            else:
+                diffs.append(None)
 
+        # Phase 2: embeddingが必要なテキストを集約してバッチembedding
         all_texts: list[str] = []
+        all_hashes: list[str] = []
+        all_token_counts: list[int] = []
+        all_contents: list[str] = []
         text_to_doc_idx: list[int] = []  # 各テキストがどのドキュメントに属するか
 
-        for idx, p in enumerate(prepared):
-            for text in p.texts:
-                all_texts.append(text)
-                text_to_doc_idx.append(idx)
+        for idx, (p, doc_hashes, diff) in enumerate(zip(prepared, hashes, diffs)):
+            needed = diff.needs_embedding if diff is not None else None
+            for chunk, text, h, tokens in zip(p.chunks, p.texts, doc_hashes, p.token_counts):
+                if needed is None or chunk.chunk_index in needed:
+                    all_texts.append(text)
+                    all_hashes.append(h)
+                    all_token_counts.append(tokens)
+                    all_contents.append(chunk.content)
+                    text_to_doc_idx.append(idx)
 
-        # 一括でembedding生成
+        reused = sum(d.reused for d in diffs if d is not None)
+        print(
+            f"Embedding {len(all_texts)} chunks from {len(prepared)} documents "
+            f"({reused} unchanged chunks kept)..."
+        )
+
+        # キャッシュにないテキストだけembedding生成
         try:
-            all_embeddings = self.embedder.embed_texts(all_texts)
+            with self.metrics.span("embed", chunks=len(all_texts)):
+                embeddings, failures = self._embed_with_cache(
+                    all_texts, all_hashes, all_token_counts, result, all_contents
+                )
         except Exception as e:
             # embedding失敗時は全ドキュメントをエラーとして記録
             for p in prepared:
                 result.errors.append(f"{p.doc.file_path}: {e}")
             print(f"Embedding failed: {e}")
-            return result
+            return
+
+        # 失敗したバッチのチャンクを含むドキュメントは保存しない（次回の実行で再処理される）
+        failed_docs: dict[int, str] = {}
+        for doc_idx, h in zip(text_to_doc_idx, all_hashes):
+            if h in failures:
+                failed_docs.setdefault(doc_idx, failures[h])
+        for doc_idx, error in failed_docs.items():
+            result.errors.append(f"{prepared[doc_idx].doc.file_path}: {error}")
+        if failed_docs:
+            print(f"Embedding failed for {len(failed_docs)} documents, saving the rest")
 
         # Phase 3: embeddingを各ドキュメントに振り分けてDB保存
         print("Saving to database...")
-        embedding_idx = 0
+        writes: list[tuple[RawDocument, DocumentWrite]] = []
+        for idx, (p, doc_hashes, diff) in enumerate(zip(prepared, hashes, diffs)):
+            if idx in failed_docs:
+                continue
+            chunks_with_embedding = {
+                chunk.chunk_index: ChunkWithEmbedding(
+                    chunk_index=chunk.chunk_index,
+                    parent_heading=chunk.parent_heading,
+                    heading=chunk.heading,
+                    content=chunk.content,
+                    embedding=embeddings[h],
+                    text_hash=h,
+                )
+                for chunk, h in zip(p.chunks, doc_hashes)
+                if h in embeddings
+            }
 
-        for idx, p in enumerate(prepared):
-            try:
-                doc_embeddings = all_embeddings[embedding_idx : embedding_idx + len(p.chunks)]
-                embedding_idx += len(p.chunks)
-
-                chunks_with_embedding = [
-                    ChunkWithEmbedding(
-                        chunk_index=chunk.chunk_index,
-                        parent_heading=chunk.parent_heading,
-                        heading=chunk.heading,
-                        content=chunk.content,
-                        embedding=embedding,
-                    )
-                    for chunk, embedding in zip(p.chunks, doc_embeddings)
-                ]
-
-                self.db.delete_chunks(p.doc.id)
-                self.db.insert_chunks(p.doc.id, chunks_with_embedding)
-                self.db.record_embedding_hash(p.doc.id, p.doc.content_hash)
-
-                result.processed += 1
-                print(f"  Saved: {p.doc.file_path} ({len(chunks_with_embedding)} chunks)")
+            if diff is None:
+                writes.append((p.doc, DocumentWrite(
+                    p.doc.id, p.doc.content_hash, inserted=list(chunks_with_embedding.values())
+                )))
+            else:
+                writes.append((p.doc, DocumentWrite(
+                    p.doc.id,
+                    p.doc.content_hash,
+                    inserted=[chunks_with_embedding[idx] for idx in diff.inserted],
+                    replace=False,
+                    deleted_ids=diff.deleted,
+                    shifted=diff.shifted,
+                    updated=[(chunk_id, chunks_with_embedding[idx]) for chunk_id, idx in diff.changed],
+                )))
 
+        reused_by_doc = {p.doc.id: d.reused if d else 0 for p, d in zip(prepared, diffs)}
+        chunks_by_doc = {p.doc.id: p.chunks for p in prepared}
+        with self.metrics.span("save", documents=len(writes)):
+            saved = self._save(writes, result)
+        for doc, write in saved:
+            written = len(write.inserted) + len(write.updated)
+            result.chunks_reused += reused_by_doc[doc.id]
+            print(f"  Saved: {doc.file_path} ({written} written, {reused_by_doc[doc.id]} kept)")
+            # 保存に成功したドキュメントだけBM25インデックスを差し替える
+            if self.lexical is not None:
+                self.lexical.replace_document(doc.id, chunks_by_doc[doc.id])
+
+    def _embed_with_cache(
+        self,
+        texts: list[str],
+        hashes: list[str],
+        token_counts: list[int],
+        result: ProcessingResult,
+        contents: list[str] | None = None,
+    ) -> tuple[dict[str, Embedding], dict[str, str]]:
+        """
+        (model, テキストhash)でキャッシュを引き、ミスしたテキストだけをAPIに送る
+        ミスしたテキストは重複排除し、同じ（近似重複設定時は本文がほぼ同じ）テキストは1回だけ送る
+        キャッシュ自体の障害ではパイプラインを止めず、全件ミスとして扱う
+        戻り値は (hash → embedding, 失敗したバッチのhash → エラー内容)
+        """
+        model = self.embedder.model
+        cached: dict[str, Embedding] = {}
+        if self.cache is not None:
+            try:
+                with self.metrics.span("cache.get", keys=len(hashes)):
+                    cached = self.cache.get_many(model, hashes)
             except Exception as e:
-                result.errors.append(f"{p.doc.file_path}: {e}")
-                print(f"  Error: {p.doc.file_path}: {e}")
+                print(f"  [WARN] Embedding cache lookup failed: {e}")
 
-        return result
+        miss_indices = [i for i, h in enumerate(hashes) if h not in cached]
+        if self.cache is not None:
+            result.cache_hits += len(texts) - len(miss_indices)
+            result.cache_misses += len(miss_indices)
+            print(f"  Cache: {len(texts) - len(miss_indices)} hits, {len(miss_indices)} misses")
+
+        # 前回中断した実行で取得済みのembedding
+        if self.checkpoint is not None and miss_indices:
+            with self.metrics.span("checkpoint.get", keys=len(miss_indices)):
+                resumed = self.checkpoint.get_many(model, [hashes[i] for i in miss_indices])
+            if resumed:
+                cached.update(resumed)
+                miss_indices = [i for i in miss_indices if hashes[i] not in resumed]
+                print(f"  Checkpoint: {len(resumed)} embeddings resumed")
+
+        failures: dict[str, str] = {}
+
+        if miss_indices:
+            plan = plan_dedup(
+                [hashes[i] for i in miss_indices],
+                [token_counts[i] for i in miss_indices],
+                [contents[i] for i in miss_indices] if contents is not None else None,
+                self.config.near_dup_threshold,
+            )
+            reps = [miss_indices[r] for r in plan.representatives]
+            self.metrics.add("chunks_embedded", len(reps))
+            if plan.collapsed:
+                result.duplicates_collapsed += plan.collapsed
+                result.tokens_saved += plan.tokens_saved
+                print(
+                    f"  Dedup: {plan.exact_duplicates} exact + {plan.near_duplicates} near "
+                    f"duplicates collapsed, {plan.tokens_saved} tokens saved"
+                )
+
+            partial = self.embedder.embed_texts_partial(
+                [texts[i] for i in reps],
+                [token_counts[i] for i in reps],
+                on_batch=lambda batch, block: self._checkpoint_batch(
+                    model, [hashes[i] for i in reps[batch.start : batch.end]], block
+                ),
+            )
+            embeddings = partial.embeddings
+            succeeded = partial.succeeded()
+            for failure in partial.failures:
+                for j in range(failure.batch.start, failure.batch.end):
+                    failures[hashes[reps[j]]] = f"embedding batch failed: {failure.error}"
+
+            # 近似重複のベクトルは代表テキストのものなので、キャッシュには代表だけを書く
+            if self.cache is not None:
+                try:
+                    with self.metrics.span("cache.put", keys=len(reps)):
+                        self.cache.put_many(
+                            model,
+                            {hashes[i]: embeddings[j] for j, i in enumerate(reps) if succeeded[j]},
+                        )
+                except Exception as e:
+                    print(f"  [WARN] Embedding cache write failed: {e}")
+            for i, rep in zip(miss_indices, plan.owner_to_rep):
+                if succeeded[rep]:
+                    cached[hashes[i]] = embeddings[rep]
+                else:
+                    failures[hashes[i]] = failures[hashes[reps[rep]]]
+
+        return cached, failures
+
+    def _checkpoint_batch(self, model: str, hashes: list[str], block: EmbeddingMatrix) -> None:
+        """完了したバッチをチェックポイントに書く（失敗しても実行は止めない）"""
+        if self.checkpoint is None:
+            return
+        try:
+            with self.metrics.span("checkpoint.put", keys=len(hashes)):
+                self.checkpoint.put_many(model, dict(zip(hashes, block)))
+        except Exception as e:
+            print(f"  [WARN] Checkpoint write failed: {e}")
+
+    def _save(
+        self,
+        writes: list[tuple[RawDocument, DocumentWrite]],
+        result: ProcessingResult,
+    ) -> list[tuple[RawDocument, DocumentWrite]]:
+        """
+        ドキュメント群を1トランザクションで一括保存
+        失敗時はドキュメント単位で保存し直してエラーを切り分ける
+        """
+        if not writes:
+            return []
+
+        try:
+            with self.metrics.span("db.save_documents", documents=len(writes)):
+                written = self.db.save_documents(
+                    [write for _, write in writes],
+                    lease_owner=self.lease_owner,
+                    model=self.active_model.model if self.active_model else None,
+                )
+            result.processed += len(writes)
+            self.metrics.add("bytes_written", written)
+            self.metrics.add(
+                "chunks_written", sum(len(w.inserted) + len(w.updated) for _, w in writes)
+            )
+            return writes
+        except Exception as e:
+            if len(writes) == 1:
+                doc = writes[0][0]
+                result.errors.append(f"{doc.file_path}: {e}")
+                print(f"  Error: {doc.file_path}: {e}")
+                return []
+            print(f"  Bulk save failed, retrying per document: {e}")
+
+        saved: list[tuple[RawDocument, DocumentWrite]] = []
+        for item in writes:
+            saved.extend(self._save([item], result))
+        return saved
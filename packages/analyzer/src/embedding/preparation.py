@@ -0,0 +1,71 @@
+"""Document preparation (chunking + embedding text) with optional process-pool parallelism."""
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from types import TracebackType
+
+from .chunker import (
+    build_embedding_text,
+    chunk_document,
+    estimate_embedding_tokens,
+    filter_empty_chunks,
+    get_encoder,
+)
+from .types import PreparedDocument, RawDocument
+
+
+def prepare_document(doc: RawDocument, max_tokens: int) -> PreparedDocument | None:
+    """ドキュメントをチャンキングしてembedding用テキストを生成（空ならNone）"""
+    chunks = chunk_document(doc, max_tokens)
+    chunks = filter_empty_chunks(chunks)
+
+    if not chunks:
+        return None
+
+    texts = [build_embedding_text(c, doc.frontmatter) for c in chunks]
+    token_counts = [estimate_embedding_tokens(c, t) for c, t in zip(chunks, texts)]
+    return PreparedDocument(doc=doc, chunks=chunks, texts=texts, token_counts=token_counts)
+
+
+def _init_worker() -> None:
+    """ワーカープロセスの初期化（トークナイザはプロセスごとに1回だけロード）"""
+    get_encoder()
+
+
+class DocumentPreparer:
+    """
+    prepare_documentをまとめて実行する
+    workers > 1 ならプロセスプールで並列化する。結果は常に入力順
+    プールはwithブロックの間使い回すので、トークナイザのロードはワーカーごとに1回で済む
+    """
+
+    def __init__(self, max_tokens: int, workers: int = 1):
+        self.max_tokens = max_tokens
+        self.workers = workers
+        self._executor: Executor | None = None
+
+    def __enter__(self) -> "DocumentPreparer":
+        if self.workers > 1:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker
+            )
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=exc is not None)
+            self._executor = None
+
+    def prepare(self, docs: list[RawDocument]) -> list[PreparedDocument | None]:
+        """docsと同じ順序で結果を返す"""
+        prepare = partial(prepare_document, max_tokens=self.max_tokens)
+        if self._executor is None or len(docs) < 2:
+            return [prepare(doc) for doc in docs]
+
+        chunksize = max(1, len(docs) // (self.workers * 4))
+        return list(self._executor.map(prepare, docs, chunksize=chunksize))
@@ -0,0 +1,250 @@
+"""Query-side embedding: normalized-text LRU/TTL cache and micro-batching."""
+
+import asyncio
+import queue
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from .types import Embedding
+
+# クエリ文字列のリスト → (件数 × 次元数) のfloat32行列
+EmbedBatch = Callable[[Sequence[str]], npt.NDArray[np.float32]]
+
+
+def normalize_query(text: str) -> str:
+    """キャッシュキー用の正規化（NFKC、前後空白除去、連続空白を1つに）"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+@dataclass(slots=True)
+class QueryStats:
+    """クエリembeddingの統計（レイテンシは直近latency_window件）"""
+    hits: int
+    misses: int
+    api_calls: int
+    batched_queries: int
+    p50_ms: float
+    p99_ms: float
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.batched_queries / self.api_calls if self.api_calls else 0.0
+
+
+class QueryCache:
+    """
+    件数上限付きLRUキャッシュ（ttl_seconds経過したエントリは期限切れ）
+    スレッドセーフ
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, Embedding]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Embedding | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Embedding) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class MicroBatcher:
+    """
+    最初のクエリからmax_wait秒以内に届いたクエリ（最大max_batch件）を
+    1回のembed_batch呼び出しにまとめるバックグラウンドスレッド
+    API呼び出しは最大max_concurrency本を並行させ、応答待ちの間も次のバッチを集める
+    """
+
+    def __init__(
+        self,
+        embed_batch: EmbedBatch,
+        max_wait: float = 0.005,
+        max_batch: int = 128,
+        max_concurrency: int = 4,
+    ):
+        self.embed_batch = embed_batch
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.api_calls = 0
+        self.batched_queries = 0
+        self._queue: queue.Queue[tuple[str, Future[Embedding]] | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="query-embed")
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future[Embedding]:
+        future: Future[Embedding] = Future()
+        self._queue.put((text, future))
+        return future
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            pending = [item]
+            deadline = time.monotonic() + self.max_wait
+            closing = False
+            while len(pending) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    closing = True
+                    break
+                pending.append(nxt)
+
+            self._executor.submit(self._flush, pending)
+            if closing:
+                return
+
+    def _flush(self, pending: list[tuple[str, Future[Embedding]]]) -> None:
+        # 同じテキストは1回だけ送る
+        texts = list(dict.fromkeys(text for text, _ in pending))
+        try:
+            matrix = self.embed_batch(texts)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.api_calls += 1
+            self.batched_queries += len(texts)
+        rows = {text: matrix[i].copy() for i, text in enumerate(texts)}
+        for text, future in pending:
+            future.set_result(rows[text])
+
+
+class QueryEmbedder:
+    """
+    検索クエリのembedding
+    正規化したクエリ文字列でキャッシュを引き、ミスしたクエリはMicroBatcherでまとめて送る
+    """
+
+    def __init__(
+        self,
+        embed_batch: EmbedBatch,
+        cache_size: int = 1024,
+        ttl_seconds: float = 3600.0,
+        max_wait_ms: float = 5.0,
+        max_batch: int = 128,
+        latency_window: int = 1000,
+    ):
+        self.cache = QueryCache(cache_size, ttl_seconds)
+        self.batcher = MicroBatcher(embed_batch, max_wait_ms / 1000, max_batch)
+        self._hits = 0
+        self._misses = 0
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self._inflight: dict[str, Future[Embedding]] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> Embedding:
+        """クエリ1件のembedding（ブロッキング）"""
+        start = time.perf_counter()
+        key = normalize_query(text)
+        embedding = self.cache.get(key)
+        hit = embedding is not None
+        if embedding is None:
+            embedding = self._submit(key).result()
+        self._record(hit, start)
+        return embedding
+
+    async def embed_async(self, text: str) -> Embedding:
+        """embedのasyncio版（API呼び出しはバッチスレッドで行う）"""
+        start = time.perf_counter()
+        key = normalize_query(text)
+        embedding = self.cache.get(key)
+        hit = embedding is not None
+        if embedding is None:
+            embedding = await asyncio.wrap_future(self._submit(key))
+        self._record(hit, start)
+        return embedding
+
+    def stats(self) -> QueryStats:
+        with self._lock:
+            latencies = np.asarray(self._latencies) * 1000
+            hits, misses = self._hits, self._misses
+        return QueryStats(
+            hits=hits,
+            misses=misses,
+            api_calls=self.batcher.api_calls,
+            batched_queries=self.batcher.batched_queries,
+            p50_ms=float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            p99_ms=float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        )
+
+    def close(self) -> None:
+        self.batcher.close()
+
+    def _submit(self, key: str) -> Future[Embedding]:
+        """ミスしたクエリを送信（同じクエリが送信中ならその結果を待つ）"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self.batcher.submit(key)
+            self._inflight[key] = future
+        # 完了済みならその場でコールバックが走るので、ロックの外で登録する
+        future.add_done_callback(lambda f: self._complete(key, f))
+        return future
+
+    def _record(self, hit: bool, start: float) -> None:
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    def _complete(self, key: str, future: Future[Embedding]) -> None:
+        if future.exception() is None:
+            self.cache.put(key, future.result())
+        with self._lock:
+            self._inflight.pop(key, None)
@@ -0,0 +1,70 @@
+"""Token-bucket rate limiting for the Voyage AI API."""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    トークンバケット
+    capacityまで貯まり、毎秒rate_per_minute/60ずつ補充される
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be > 0")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """経過時間分を補充"""
+        elapsed = max(0.0, now - self.updated_at)
+        self.available = min(self.capacity, self.available + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount取り出せるまでの待機秒数（refill後に呼ぶこと）"""
+        deficit = amount - self.available
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self.available -= amount
+
+
+class RateLimiter:
+    """
+    requests/minとtokens/minの2つのバケットによるレート制限
+    両方に余裕がある場合のみリクエストを通す
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """取得できれば0、できなければ必要な待機秒数を返す"""
+        # 1リクエストがバケット容量を超える場合は満杯まで待てば通す
+        amount = min(float(tokens), self.tokens.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(amount))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(amount)
+            return wait
+
+    def acquire(self, tokens: int) -> None:
+        """1リクエスト分（tokensトークン）の枠を取得するまでブロック"""
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int) -> None:
+        """acquireのasyncio版"""
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,117 @@
+"""Retry-After aware backoff and a circuit breaker for the Voyage AI API."""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable
+
+# Retry-Afterが極端に長い場合でもこれ以上は待たない
+MAX_RETRY_DELAY = 120.0
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているためAPIを呼ばなかった"""
+
+
+def _http_status(error: BaseException) -> int | None:
+    status = getattr(error, "http_status", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(error: BaseException) -> bool:
+    """リトライで回復しうるエラーか（429・5xx・接続エラー/タイムアウト）"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = _http_status(error)
+    return status is None or status == 429 or status >= 500
+
+
+def retry_after_seconds(error: BaseException, now: Callable[[], float] = time.time) -> float | None:
+    """エラーのレスポンスヘッダのRetry-After（秒数またはHTTP-date）を秒で返す"""
+    headers: Any = getattr(error, "headers", None) or {}
+    value = next((v for k, v in headers.items() if str(k).lower() == "retry-after"), None)
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - now())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float, error: BaseException) -> float:
+    """
+    次のリトライまでの待機秒数
+    Retry-Afterがあればそれに従い、なければ指数バックオフ（full jitter）
+    """
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY)
+    return random.uniform(0, min(base_delay * (2 ** attempt), MAX_RETRY_DELAY))
+
+
+class CircuitBreaker:
+    """
+    連続failure_threshold回の一時的エラーで開き、reset_timeout秒はAPIを呼ばせない
+    経過後は1回だけ試行を通し（half-open）、成功すれば閉じる・失敗すれば再び開く
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be >= 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trips = 0
+        self._clock = clock
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_call(self) -> None:
+        """API呼び出し前に呼ぶ。開いている間はCircuitOpenErrorを送出"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - self._clock()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(
+                    f"circuit open after {self.failures} consecutive failures "
+                    f"(retry in {max(remaining, 0):.0f}s)"
+                )
+            self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self, error: BaseException) -> None:
+        """一時的エラーだけを数える（入力不正などはAPIが応答しているので成功扱い）"""
+        if isinstance(error, CircuitOpenError):
+            return
+        if not is_transient(error):
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    self.trips += 1
+                self.opened_at = self._clock()
+                self._probing = False
@@ -1,8 +1,15 @@
 """Type definitions for embedding module."""
 
 from dataclasses import dataclass, field
+from datetime import datetime
 from typing import TypedDict
 
+import numpy as np
+import numpy.typing as npt
+
+# embeddingベクトル（float32の1次元配列。バッチ単位の行列の行ビューであることが多い）
+Embedding = npt.NDArray[np.float32]
+
 
 class FrontmatterDict(TypedDict, total=False):
     """frontmatter JSONBの型"""
@@ -12,7 +19,7 @@ class FrontmatterDict(TypedDict, total=False):
     previous: list[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class RawDocument:
     """raw.github_contents__documentsから取得したドキュメント"""
     id: str
@@ -22,7 +29,7 @@ class RawDocument:
     content_hash: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Chunk:
     """チャンキング済みセグメント"""
     chunk_index: int
@@ -30,21 +37,101 @@ class Chunk:
     heading: str
     content: str
     context_previous: str | None = None
+    token_count: int = 0  # contentの推定トークン数
+
+
+@dataclass(slots=True)
+class PreparedDocument:
+    """チャンキング済みドキュメント"""
+    doc: RawDocument
+    chunks: list[Chunk]
+    texts: list[str]
+    token_counts: list[int]
 
 
-@dataclass
+@dataclass(slots=True)
 class ChunkWithEmbedding:
     """embedding付きチャンク"""
     chunk_index: int
     parent_heading: str
     heading: str
     content: str
-    embedding: list[float]
+    embedding: Embedding
+    text_hash: str | None = None  # embedding用テキストのSHA256
+
+
+@dataclass(slots=True)
+class ExistingChunk:
+    """rag.chunksに保存済みのチャンク（差分判定用）"""
+    id: str
+    chunk_index: int
+    text_hash: str | None
+
+
+@dataclass(slots=True)
+class ShadowChunk:
+    """モデル移行中のチャンク（shadow_hashはembedding_nextを作ったテキストのhash）"""
+    id: str
+    chunk_index: int
+    text_hash: str | None
+    shadow_hash: str | None
+
+
+@dataclass(slots=True)
+class EmbeddingModel:
+    """rag.embedding_modelsの1行（移行中のモデルはチェックポイントを持つ）"""
+    model: str
+    dimensions: int
+    status: str  # active | migrating | retired
+    output_dimension: int | None = None  # APIに渡すoutput_dimension（Noneならモデルのデフォルト）
+    last_document_id: str | None = None
+    chunks_embedded: int = 0
+    tokens_used: int = 0
+
+
+@dataclass(slots=True)
+class IndexedChunk:
+    """ローカルインデックスへエクスポートするチャンク（検索結果の表示に必要な列を含む）"""
+    id: str
+    document_id: str
+    chunk_index: int
+    title: str | None
+    heading: str
+    content: str
+    file_path: str
+    tags: list[str]
+    embedding: Embedding
+    embedded_at: datetime
+
+
+@dataclass(slots=True)
+class DocumentWrite:
+    """
+    1ドキュメント分のrag.chunks書き込み内容
+    replace=Trueなら既存チャンクを全削除してからinsertedを挿入する
+    """
+    document_id: str
+    content_hash: str
+    inserted: list[ChunkWithEmbedding] = field(default_factory=list)
+    replace: bool = True
+    deleted_ids: list[str] = field(default_factory=list)
+    shifted: list[tuple[str, int]] = field(default_factory=list)  # (chunk id, 新chunk_index)
+    updated: list[tuple[str, ChunkWithEmbedding]] = field(default_factory=list)  # 同じ位置を上書き
 
 
-@dataclass
+@dataclass(slots=True)
 class ProcessingResult:
     """処理結果"""
     processed: int = 0
     skipped: int = 0
     errors: list[str] = field(default_factory=list)
+    cache_hits: int = 0
+    cache_misses: int = 0
+    chunks_reused: int = 0  # 差分判定で再embeddingせずに残したチャンク数
+    duplicates_collapsed: int = 0  # 重複排除でAPIに送らなかったテキスト数
+    tokens_saved: int = 0  # 重複排除で節約した推定APIトークン数
+
+    @property
+    def cache_hit_rate(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
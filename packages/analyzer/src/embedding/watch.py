@@ -0,0 +1,190 @@
+"""Watch mode: embed changed documents within seconds via LISTEN/NOTIFY.
+
+The notify trigger on raw.github_contents__documents sends each changed
+document id on NOTIFY_CHANNEL. The watcher debounces bursts (a sync
+writes many files in a row) and embeds just those documents. A periodic
+full run over get_documents_needing_embedding() catches anything whose
+notification was missed, e.g. while the daemon was down or reconnecting.
+"""
+
+import select
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+from .pipeline import EmbeddingPipeline
+from .types import ProcessingResult
+
+NOTIFY_CHANNEL = "rag_documents_changed"
+
+# 停止要求や接続断に気づくまでの最大待ち時間
+_SELECT_TIMEOUT = 1.0
+_MAX_RECONNECT_DELAY = 60.0
+
+
+@dataclass(slots=True)
+class WatchStats:
+    """watchモードの統計（lagsは直近1000件の鮮度遅延＝取得からembeddingまでの秒数）"""
+    notifications: int = 0
+    batches: int = 0
+    polls: int = 0
+    processed: int = 0
+    errors: int = 0
+    reconnects: int = 0
+    lags: deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    @property
+    def lag_p50(self) -> float:
+        return float(np.percentile(self.lags, 50)) if self.lags else 0.0
+
+    @property
+    def lag_p99(self) -> float:
+        return float(np.percentile(self.lags, 99)) if self.lags else 0.0
+
+
+class DocumentWatcher:
+    """
+    通知されたドキュメントをdebounce秒まとめてからembeddingするデーモン
+    通知が途切れなくてもmax_delay秒で処理し、poll_interval秒ごとに全件の差分も確認する
+    """
+
+    def __init__(
+        self,
+        pipeline: EmbeddingPipeline,
+        debounce: float = 2.0,
+        max_delay: float = 30.0,
+        poll_interval: float = 300.0,
+    ):
+        self.pipeline = pipeline
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.stats = WatchStats()
+
+    def run(self, stop: threading.Event | None = None) -> WatchStats:
+        """stopがセットされるまで監視する（起動時にまず全件の差分を処理）"""
+        stop = stop or threading.Event()
+        delay = 1.0
+        while not stop.is_set():
+            try:
+                conn = self._listen()
+            except psycopg2.OperationalError as e:
+                print(f"[WARN] LISTEN failed, retrying in {delay:.0f}s: {e}")
+                self.stats.reconnects += 1
+                stop.wait(delay)
+                delay = min(delay * 2, _MAX_RECONNECT_DELAY)
+                continue
+
+            delay = 1.0
+            try:
+                # LISTENを始める前の変更と、接続断の間に取りこぼした通知を拾う
+                self._poll()
+                self._loop(conn, stop)
+            except psycopg2.OperationalError as e:
+                print(f"[WARN] Notification connection lost: {e}")
+                self.stats.reconnects += 1
+            finally:
+                conn.close()
+        return self.stats
+
+    def _listen(self) -> psycopg2.extensions.connection:
+        # TCP keepaliveで無通信の間の接続断も検出する
+        conn = psycopg2.connect(
+            self.pipeline.config.database_url,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+        )
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        print(f"Listening on {NOTIFY_CHANNEL}")
+        return conn
+
+    def _loop(self, conn: psycopg2.extensions.connection, stop: threading.Event) -> None:
+        pending: dict[str, None] = {}  # 通知順を保った重複なしのドキュメントID
+        first_at = last_at = 0.0
+        next_poll = time.monotonic() + self.poll_interval
+
+        while not stop.is_set():
+            deadline = next_poll
+            if pending:
+                deadline = min(deadline, last_at + self.debounce, first_at + self.max_delay)
+            timeout = min(max(deadline - time.monotonic(), 0.0), _SELECT_TIMEOUT)
+
+            if select.select([conn], [], [], timeout)[0]:
+                conn.poll()
+                now = time.monotonic()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    if not pending:
+                        first_at = now
+                    pending[notify.payload] = None
+                    last_at = now
+                    self.stats.notifications += 1
+
+            now = time.monotonic()
+            if pending and (now - last_at >= self.debounce or now - first_at >= self.max_delay):
+                document_ids = list(pending)
+                pending.clear()
+                self._flush(document_ids)
+            if now >= next_poll:
+                self._poll()
+                next_poll = time.monotonic() + self.poll_interval
+
+    def _flush(self, document_ids: list[str]) -> None:
+        """通知されたドキュメントをembedding"""
+        print(f"Notified: {len(document_ids)} documents")
+        self.stats.batches += 1
+        self._measure(lambda: self.pipeline.process_documents(document_ids))
+
+    def _poll(self) -> None:
+        """通知に頼らない全件の差分処理（取りこぼしの回収）"""
+        self.stats.polls += 1
+        self._measure(self.pipeline.run)
+
+    def _measure(self, process: Callable[[], ProcessingResult]) -> None:
+        """処理を実行し、その間にembeddingされたドキュメントの鮮度遅延を記録する"""
+        db = self.pipeline.db
+        since = db.now()
+        try:
+            result = process()
+        except Exception as e:
+            # 1回の失敗でデーモンは止めない（次の通知かポーリングで再処理される）
+            print(f"[WARN] Embedding failed: {e}")
+            self.stats.errors += 1
+            return
+
+        self.stats.processed += result.processed
+        self.stats.errors += len(result.errors)
+        for error in result.errors:
+            print(f"  - {error}")
+        lags = db.get_freshness_lags(since)
+        self.stats.lags.extend(lags)
+        if lags:
+            print(
+                f"Freshness lag: {len(lags)} documents, max {max(lags):.1f}s "
+                f"(p50 {self.stats.lag_p50:.1f}s, p99 {self.stats.lag_p99:.1f}s over "
+                f"last {len(self.stats.lags)})"
+            )
+            self._record_lags()
+
+    def _record_lags(self) -> None:
+        """
+        鮮度遅延のp50/p99をfreshness_lag_secondsゲージに記録して書き出す
+        パイプラインは処理の終わりに一度書き出しているが、遅延はその後に測るのでもう一度書き出す
+        """
+        metrics = self.pipeline.metrics
+        metrics.gauge("freshness_lag_seconds", self.stats.lag_p50, quantile="0.5")
+        metrics.gauge("freshness_lag_seconds", self.stats.lag_p99, quantile="0.99")
+        try:
+            metrics.flush()
+        except OSError as e:
+            print(f"[WARN] Metrics write failed: {e}")
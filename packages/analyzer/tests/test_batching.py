@@ -0,0 +1,59 @@
+"""Tests for embedding.batching."""
+
+import random
+from itertools import pairwise
+
+import pytest
+
+from embedding.batching import plan_batches, summarize_batches
+
+
+def test_batches_split_on_item_limit() -> None:
+    batches = plan_batches([1] * 7, max_items=3, max_tokens=100)
+
+    assert [(b.start, b.end) for b in batches] == [(0, 3), (3, 6), (6, 7)]
+
+
+def test_batches_split_on_token_limit() -> None:
+    batches = plan_batches([40, 50, 20, 30, 60], max_items=10, max_tokens=100)
+
+    assert [(b.start, b.end, b.tokens) for b in batches] == [(0, 2, 90), (2, 4, 50), (4, 5, 60)]
+
+
+def test_oversized_text_gets_its_own_batch() -> None:
+    """Test that a text over max_tokens is sent alone rather than dropped or merged."""
+    batches = plan_batches([10, 250, 10], max_items=10, max_tokens=100)
+
+    assert [(b.start, b.end) for b in batches] == [(0, 1), (1, 2), (2, 3)]
+    assert batches[1].token_fill == pytest.approx(2.5)
+
+
+def test_empty_input_has_no_batches() -> None:
+    assert plan_batches([], max_items=10, max_tokens=100) == []
+    assert summarize_batches([]) == "0 batches"
+
+
+@pytest.mark.parametrize("max_items, max_tokens", [(0, 100), (10, 0)])
+def test_invalid_limits_are_rejected(max_items: int, max_tokens: int) -> None:
+    with pytest.raises(ValueError):
+        plan_batches([1], max_items=max_items, max_tokens=max_tokens)
+
+
+def test_random_plans_cover_input_in_order_within_limits() -> None:
+    """Test that batches tile the input in order and respect both limits (except lone oversized texts)."""
+    rng = random.Random(0)
+    for _ in range(200):
+        counts = [rng.randint(1, 120) for _ in range(rng.randint(1, 60))]
+        max_items = rng.randint(1, 8)
+        max_tokens = rng.randint(50, 300)
+
+        batches = plan_batches(counts, max_items, max_tokens)
+
+        assert batches[0].start == 0
+        assert batches[-1].end == len(counts)
+        for prev, batch in pairwise(batches):
+            assert prev.end == batch.start
+        for batch in batches:
+            assert batch.tokens == sum(counts[batch.start:batch.end])
+            assert 1 <= batch.size <= max_items
+            assert batch.tokens <= max_tokens or batch.size == 1
@@ -0,0 +1,177 @@
+"""Tests for embedding.chunker.
+
+The size tests run against a small byte-level BPE trained on the same kind
+of text they chunk, so they need no network access. Like cl100k_base, it
+has merged tokens that end in the middle of a CJK character or an emoji.
+Token offsets taken from the whole document therefore do not add up to the
+token counts of the cut pieces. When cl100k_base can be loaded, the tests
+run against it as well.
+"""
+
+import random
+import re
+from collections import Counter
+from functools import cache
+from itertools import pairwise
+
+import pytest
+import tiktoken
+
+from embedding import chunker
+from embedding.chunker import RECOUNT_SLACK, chunk_document
+from embedding.types import RawDocument
+
+# cl100k_base's pre-tokenizer
+PAT_STR = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+"""
+    r"""| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+)
+
+FRAGMENTS = [
+    "時間", "管理", "データ", "分析", "埋め込み", "検索", "の", "を", "は", "、", "。",
+    "😀", "🎉", "🚀", "👨‍👩‍👧", "🇯🇵", "１２３", "café",
+    "embedding", " chunk", " token", "window", " the", "ing",
+]
+
+
+def _random_document(rng: random.Random) -> str:
+    lines = ["# Title"]
+    for section in range(rng.randint(1, 4)):
+        lines.append(f"## Section {section}")
+        for _ in range(rng.randint(1, 8)):
+            kind = rng.random()
+            if kind < 0.15:
+                lines.append(f"### Sub {rng.randint(0, 99)}")
+            elif kind < 0.3:
+                lines.append("")
+            else:
+                lines.append("".join(
+                    rng.choice(FRAGMENTS) + (" " if rng.random() < 0.2 else "")
+                    for _ in range(rng.randint(1, 120))
+                ))
+    return "\n".join(lines)
+
+
+def _train_bpe(corpus: str, merges: int) -> dict[bytes, int]:
+    """Byte-level BPE ranks from the most frequent adjacent pairs."""
+    ranks = {bytes([b]): b for b in range(256)}
+    words: Counter[tuple[bytes, ...]] = Counter(
+        tuple(bytes([b]) for b in word.encode()) for word in re.findall(r"\s*\S+", corpus)
+    )
+    for _ in range(merges):
+        pairs: Counter[tuple[bytes, bytes]] = Counter()
+        for word, freq in words.items():
+            for pair in pairwise(word):
+                pairs[pair] += freq
+        if not pairs:
+            break
+        (a, b), _ = pairs.most_common(1)[0]
+        ranks.setdefault(a + b, len(ranks))
+        merged: Counter[tuple[bytes, ...]] = Counter()
+        for word, freq in words.items():
+            out: list[bytes] = []
+            i = 0
+            while i < len(word):
+                if i + 1 < len(word) and word[i] == a and word[i + 1] == b:
+                    out.append(a + b)
+                    i += 2
+                else:
+                    out.append(word[i])
+                    i += 1
+            merged[tuple(out)] += freq
+        words = merged
+    return ranks
+
+
+@cache
+def _toy_encoding() -> tiktoken.Encoding:
+    rng = random.Random(0)
+    corpus = "\n".join(_random_document(rng) for _ in range(20))
+    return tiktoken.Encoding(
+        "toy_bpe", pat_str=PAT_STR, mergeable_ranks=_train_bpe(corpus, 400), special_tokens={}
+    )
+
+
+@pytest.fixture(params=["toy_bpe", "cl100k_base"])
+def encoder(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> tiktoken.Encoding:
+    if request.param == "toy_bpe":
+        enc = _toy_encoding()
+    else:
+        try:
+            enc = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:  # the encoding is downloaded on first use
+            pytest.skip(f"cl100k_base unavailable: {e}")
+    monkeypatch.setattr(chunker, "get_encoder", lambda: enc)
+    return enc
+
+
+def _document(content: str) -> RawDocument:
+    return RawDocument(
+        id="doc", file_path="docs/20260101_test.md", frontmatter={}, content=content, content_hash=""
+    )
+
+
+def _body(text: str) -> str:
+    """Non-heading text with whitespace removed."""
+    lines = [line for line in text.split("\n") if not line.startswith("#")]
+    return re.sub(r"\s", "", "".join(lines))
+
+
+@pytest.mark.parametrize("max_tokens", [8, 16, 40, 200])
+def test_chunks_fit_max_tokens(encoder: tiktoken.Encoding, max_tokens: int) -> None:
+    """Test that every chunk re-encodes to at most max_tokens and close to its stored token_count."""
+    rng = random.Random(max_tokens)
+    for _ in range(30):
+        content = _random_document(rng)
+        chunks = chunk_document(_document(content), max_tokens=max_tokens)
+
+        for chunk in chunks:
+            fresh = len(encoder.encode_ordinary(chunk.content))
+            assert fresh <= max_tokens
+            assert abs(chunk.token_count - fresh) < RECOUNT_SLACK
+        assert "".join(_body(c.content) for c in chunks) == _body(content)
+
+
+def test_small_section_is_one_chunk(encoder: tiktoken.Encoding) -> None:
+    """Test that a section under the limit stays whole."""
+    content = "# Title\n## 概要\n時間管理のデータ分析 😀\n\nsecond paragraph\n## Next\nbody"
+    chunks = chunk_document(_document(content))
+
+    assert [(c.parent_heading, c.heading, c.content) for c in chunks] == [
+        ("Title", "概要", "時間管理のデータ分析 😀\n\nsecond paragraph"),
+        ("Title", "Next", "body"),
+    ]
+
+
+class CountingEncoding:
+    """Counts encode calls on a wrapped encoding."""
+
+    def __init__(self, encoding: tiktoken.Encoding):
+        self.encoding = encoding
+        self.calls = 0
+
+    def encode_ordinary(self, text: str) -> list[int]:
+        self.calls += 1
+        return self.encoding.encode_ordinary(text)
+
+    def decode_with_offsets(self, tokens: list[int]) -> tuple[str, list[int]]:
+        return self.encoding.decode_with_offsets(tokens)
+
+
+def test_chunks_below_the_limit_are_not_re_encoded(
+    encoder: tiktoken.Encoding, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a document whose pieces are all well under max_tokens is encoded once."""
+    counting = CountingEncoding(encoder)
+    monkeypatch.setattr(chunker, "get_encoder", lambda: counting)
+    paragraph = "時間管理のデータ分析 😀 embedding chunk の window" * 3
+    per_paragraph = len(encoder.encode_ordinary(paragraph + "\n\n"))
+    assert per_paragraph > RECOUNT_SLACK + 1
+    content = "# Title\n## A\n" + "\n\n".join([paragraph] * 40) + "\n## B\nbody"
+
+    # three paragraphs per chunk, leaving more than RECOUNT_SLACK tokens unused
+    max_tokens = 3 * per_paragraph + RECOUNT_SLACK + 1
+    chunks = chunk_document(_document(content), max_tokens=max_tokens)
+
+    assert len(chunks) > 10
+    assert counting.calls == 1
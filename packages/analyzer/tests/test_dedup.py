@@ -0,0 +1,76 @@
+"""Tests for embedding.dedup."""
+
+import random
+
+import numpy as np
+import pytest
+
+from embedding.dedup import MIN_NEAR_DUP_CHARS, NUM_PERM, _shingles, minhash, plan_dedup
+
+WORDS = ["時間", "管理", "データ", "分析", "設計", "検索", "embedding", "chunk", "の", "を"]
+
+
+def _text(seed: int, length: int = 300) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def _edit(text: str, changes: int, seed: int = 0) -> str:
+    """Replace `changes` characters at random positions."""
+    rng = random.Random(seed)
+    chars = list(text)
+    for _ in range(changes):
+        chars[rng.randrange(len(chars))] = "※"
+    return "".join(chars)
+
+
+def test_exact_duplicates_share_the_first_representative() -> None:
+    plan = plan_dedup(["a", "b", "a", "c", "b"], [10, 20, 30, 40, 50])
+
+    assert plan.representatives == [0, 1, 3]
+    assert plan.owner_to_rep == [0, 1, 0, 2, 1]
+    assert plan.exact_duplicates == 2
+    assert plan.tokens_saved == 80
+    assert plan.collapsed == 2
+
+
+def test_minhash_is_deterministic_and_ignores_whitespace_and_width() -> None:
+    text = _text(1)
+
+    assert minhash(text).shape == (NUM_PERM,)
+    np.testing.assert_array_equal(minhash(text), minhash(text))
+    np.testing.assert_array_equal(minhash("ＡＢＣ def  ghi"), minhash("ABCdef\nghi"))
+
+
+@pytest.mark.parametrize("changes", [0, 5, 20, 60])
+def test_minhash_estimates_shingle_jaccard(changes: int) -> None:
+    """Test that the signature agreement rate tracks the true Jaccard similarity of the shingles."""
+    a = _text(2, 600)
+    b = _edit(a, changes)
+    sa, sb = set(_shingles(a).tolist()), set(_shingles(b).tolist())
+    jaccard = len(sa & sb) / len(sa | sb)
+
+    estimate = float(np.mean(minhash(a) == minhash(b)))
+
+    # 64 permutations: standard error at most 0.0625
+    assert estimate == pytest.approx(jaccard, abs=0.2)
+
+
+def test_near_duplicates_collapse_above_threshold() -> None:
+    base = _text(3)
+    contents = [base, _edit(base, 3), _text(4)]
+
+    plan = plan_dedup(["h0", "h1", "h2"], [100, 100, 100], contents, near_threshold=0.8)
+
+    assert plan.owner_to_rep == [0, 0, 1]
+    assert plan.representatives == [0, 2]
+    assert plan.near_duplicates == 1
+    assert plan.tokens_saved == 100
+
+
+def test_near_dedup_is_off_without_threshold_or_for_short_texts() -> None:
+    base = _text(5)
+    assert plan_dedup(["h0", "h1"], [1, 1], [base, base], near_threshold=0).collapsed == 0
+
+    short = "x" * (MIN_NEAR_DUP_CHARS - 1)
+    assert plan_dedup(["h0", "h1"], [1, 1], [short, short], near_threshold=0.5).collapsed == 0
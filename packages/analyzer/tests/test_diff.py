@@ -0,0 +1,74 @@
+"""Tests for embedding.diff."""
+
+from embedding.diff import diff_chunks
+from embedding.types import ExistingChunk
+
+
+def _existing(*hashes: str | None) -> list[ExistingChunk]:
+    return [ExistingChunk(id=f"row{i}", chunk_index=i, text_hash=h) for i, h in enumerate(hashes)]
+
+
+def test_identical_chunks_are_all_unchanged() -> None:
+    diff = diff_chunks(_existing("a", "b", "c"), [(0, "a"), (1, "b"), (2, "c")])
+
+    assert diff.unchanged == [0, 1, 2]
+    assert diff.reused == 3
+    assert diff.needs_embedding == set()
+    assert (diff.shifted, diff.changed, diff.inserted, diff.deleted) == ([], [], [], [])
+
+
+def test_insertion_at_front_shifts_the_rest() -> None:
+    """Test that chunks moved by an inserted section keep their rows and embeddings."""
+    diff = diff_chunks(_existing("a", "b"), [(0, "new"), (1, "a"), (2, "b")])
+
+    assert diff.shifted == [("row0", 1), ("row1", 2)]
+    assert diff.inserted == [0]
+    assert diff.needs_embedding == {0}
+    assert diff.deleted == []
+
+
+def test_edited_chunk_overwrites_its_row() -> None:
+    diff = diff_chunks(_existing("a", "b", "c"), [(0, "a"), (1, "b2"), (2, "c")])
+
+    assert diff.unchanged == [0, 2]
+    assert diff.changed == [("row1", 1)]
+    assert diff.needs_embedding == {1}
+
+
+def test_removed_chunks_are_deleted() -> None:
+    diff = diff_chunks(_existing("a", "b", "c"), [(0, "a"), (1, "c")])
+
+    assert diff.unchanged == [0]
+    assert diff.shifted == [("row2", 1)]
+    assert diff.deleted == ["row1"]
+
+
+def test_duplicate_texts_match_rows_once_each() -> None:
+    """Test that two new chunks with the same hash never reuse the same row."""
+    diff = diff_chunks(_existing("x", "y"), [(0, "y"), (1, "x"), (2, "x")])
+
+    assert sorted(diff.shifted) == [("row0", 1), ("row1", 0)]
+    assert diff.inserted == [2]
+    assert diff.deleted == []
+
+
+def test_rows_without_hash_are_overwritten_not_reused() -> None:
+    """Test that rows written before text_hash existed are re-embedded in place."""
+    diff = diff_chunks(_existing(None, None), [(0, "a"), (1, "b"), (2, "c")])
+
+    assert diff.changed == [("row0", 0), ("row1", 1)]
+    assert diff.inserted == [2]
+    assert diff.reused == 0
+
+
+def test_every_row_and_chunk_is_accounted_for_once() -> None:
+    existing = _existing("a", "b", "c", "d", None)
+    new = [(0, "d"), (1, "a"), (2, "e"), (3, "e"), (4, "b")]
+
+    diff = diff_chunks(existing, new)
+
+    rows = [r for r, _ in diff.shifted] + [r for r, _ in diff.changed] + diff.deleted
+    rows += [f"row{i}" for i in diff.unchanged]
+    assert sorted(rows) == sorted(c.id for c in existing)
+    indexes = diff.unchanged + [i for _, i in diff.shifted] + [i for _, i in diff.changed]
+    assert sorted(indexes + diff.inserted) == [i for i, _ in new]
@@ -0,0 +1,43 @@
+"""Tests for embedding.config."""
+
+import pytest
+
+from embedding.config import load_config
+
+
+@pytest.fixture
+def env(monkeypatch: pytest.MonkeyPatch) -> pytest.MonkeyPatch:
+    monkeypatch.setenv("DIRECT_DATABASE_URL", "postgresql://localhost/unused")
+    monkeypatch.setenv("VOYAGE_API_KEY", "test-key")
+    for name in ("EMBED_WATCH", "EMBED_WORK_QUEUE", "LEXICAL_INDEX_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_watch_and_work_queue_are_rejected_together(env: pytest.MonkeyPatch) -> None:
+    """Test that watch mode cannot run as a work-queue worker (it never claims leases)."""
+    env.setenv("EMBED_WATCH", "1")
+    env.setenv("EMBED_WORK_QUEUE", "1")
+
+    with pytest.raises(ValueError, match="EMBED_WATCH and EMBED_WORK_QUEUE"):
+        load_config()
+
+
+def test_lexical_index_and_work_queue_are_rejected_together(env: pytest.MonkeyPatch) -> None:
+    """Test that workers cannot share one BM25 index file (the last save would drop the others)."""
+    env.setenv("EMBED_WORK_QUEUE", "1")
+    env.setenv("LEXICAL_INDEX_PATH", "lexical.npz")
+
+    with pytest.raises(ValueError, match="LEXICAL_INDEX_PATH and EMBED_WORK_QUEUE"):
+        load_config()
+
+
+@pytest.mark.parametrize("name", ["EMBED_WATCH", "EMBED_WORK_QUEUE"])
+def test_watch_or_work_queue_alone_is_accepted(env: pytest.MonkeyPatch, name: str) -> None:
+    """Test that each mode is still accepted on its own."""
+    env.setenv(name, "1")
+
+    config = load_config()
+
+    assert config.watch == (name == "EMBED_WATCH")
+    assert config.work_queue == (name == "EMBED_WORK_QUEUE")
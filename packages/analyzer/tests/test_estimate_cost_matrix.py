@@ -0,0 +1,185 @@
+"""Tests for analyzer.estimate_cost_matrix."""
+
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from analyzer import estimate_cost_matrix
+from analyzer.data import Category, PairedSamples
+from analyzer.estimate_cost_matrix import (
+    build_initial_cost_matrix,
+    fit_cost_matrix,
+    normalize_cost_matrix,
+    save_cost_matrix_csv,
+)
+from analyzer.fit_state import load_fit_state, save_fit_state
+
+CATEGORIES = [
+    Category(f"Category{i}", group)
+    for i, group in enumerate(["Essentials"] * 2 + ["Obligation"] * 2 + ["Leisure"] * 2)
+]
+
+
+def _samples(count: int = 40, seed: int = 0) -> PairedSamples:
+    rng = np.random.default_rng(seed)
+    k = len(CATEGORIES)
+    return PairedSamples(
+        dates=np.arange(count).astype("datetime64[D]"),
+        targets=rng.dirichlet(np.full(k, 2.0), count) * 16,
+        actuals=rng.dirichlet(np.full(k, 0.7), count) * 16,
+    )
+
+
+@pytest.mark.parametrize("reg", [0.0, 0.1])
+def test_fit_keeps_the_off_diagonal_sum(reg: float) -> None:
+    """Test that the fit cannot shrink C toward zero, even without regularization."""
+    C_init = build_initial_cost_matrix(CATEGORIES)
+    off_diagonal = ~np.eye(len(C_init), dtype=bool)
+
+    fit = fit_cost_matrix(_samples(), C_init, reg=reg, verbose=False, max_iter=30)
+
+    assert fit.C[off_diagonal].sum() == pytest.approx(C_init[off_diagonal].sum())
+    assert (np.diag(fit.C) == 0).all()
+    assert (fit.C >= 0).all()
+    assert fit.C.max() > 0
+
+
+def test_fit_rejects_a_zero_initial_matrix() -> None:
+    with pytest.raises(ValueError):
+        fit_cost_matrix(_samples(), np.zeros((6, 6)), verbose=False)
+
+
+def test_normalize_scales_to_unit_max() -> None:
+    C = np.array([[5.0, 2.0], [4.0, 7.0]])
+
+    np.testing.assert_allclose(normalize_cost_matrix(C), [[0.0, 0.5], [1.0, 0.0]])
+
+
+@pytest.mark.parametrize("C", [np.zeros((3, 3)), np.eye(3), np.full((2, 2), np.nan)])
+def test_normalize_rejects_a_collapsed_matrix(C: np.ndarray) -> None:
+    with pytest.raises(ValueError):
+        normalize_cost_matrix(C)
+
+
+class IncrementalRun:
+    """Runs main() against tmp_path with the database and the plot replaced."""
+
+    def __init__(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        self.monkeypatch = monkeypatch
+        self.samples = _samples()
+        self.state_path = tmp_path / ".cache" / "cost_matrix_state.json"
+        self.seed_path = (
+            tmp_path / "packages" / "transform" / "seeds" / "cost_matrix_time_categories.csv"
+        )
+        self.seed_path.parent.mkdir(parents=True)
+        self.fits: list[np.ndarray] = []  # C_init of every fit
+        self.seed_writes = 0
+
+        def fit(samples: PairedSamples, C_init: np.ndarray, **kwargs):
+            self.fits.append(C_init.copy())
+            return fit_cost_matrix(samples, C_init, **{**kwargs, "max_iter": 20})
+
+        def save_csv(C: np.ndarray, names: list[str], path: Path) -> None:
+            self.seed_writes += 1
+            save_cost_matrix_csv(C, names, path)
+
+        module = estimate_cost_matrix
+        monkeypatch.setattr(module, "PROJECT_ROOT", tmp_path)
+        monkeypatch.setattr(module, "connect", nullcontext)
+        monkeypatch.setattr(module, "load_categories", lambda conn: CATEGORIES)
+        monkeypatch.setattr(module, "load_paired_samples", lambda conn, cats: self.samples)
+        monkeypatch.setattr(module, "load_fit_state", lambda: load_fit_state(self.state_path))
+        monkeypatch.setattr(
+            module, "save_fit_state", lambda state: save_fit_state(state, self.state_path)
+        )
+        monkeypatch.setattr(module, "fit_cost_matrix", fit)
+        monkeypatch.setattr(module, "save_cost_matrix_csv", save_csv)
+        monkeypatch.setattr(module, "plot_cost_matrix", lambda C, names, path: None)
+
+    def __call__(self, *args: str) -> None:
+        self.monkeypatch.setattr(sys, "argv", ["estimate_cost_matrix", *args])
+        estimate_cost_matrix.main()
+
+    def seed(self) -> bytes:
+        return self.seed_path.read_bytes()
+
+
+@pytest.fixture
+def run(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> IncrementalRun:
+    return IncrementalRun(tmp_path, monkeypatch)
+
+
+def test_first_run_fits_from_the_prior_and_writes_the_seed(run: IncrementalRun) -> None:
+    run()
+
+    assert len(run.fits) == 1
+    np.testing.assert_array_equal(run.fits[0], build_initial_cost_matrix(CATEGORIES))
+    assert run.seed_writes == 1
+    state = load_fit_state(run.state_path)
+    assert state is not None and state.samples == 40
+
+
+def test_unchanged_input_skips_the_fit_and_keeps_the_seed(run: IncrementalRun) -> None:
+    run()
+    seed, stat = run.seed(), run.seed_path.stat()
+    state = run.state_path.read_bytes()
+
+    run()
+
+    assert len(run.fits) == 1
+    assert run.seed_writes == 1
+    assert run.seed() == seed
+    assert run.seed_path.stat().st_mtime_ns == stat.st_mtime_ns
+    assert run.state_path.read_bytes() == state
+
+
+def test_full_refits_unchanged_input_from_the_prior(run: IncrementalRun) -> None:
+    run()
+
+    run("--full")
+
+    assert len(run.fits) == 2
+    np.testing.assert_array_equal(run.fits[1], build_initial_cost_matrix(CATEGORIES))
+
+
+def test_new_day_warm_starts_from_the_saved_solution(run: IncrementalRun) -> None:
+    run()
+    state = load_fit_state(run.state_path)
+    assert state is not None
+    run.samples = _samples(41)
+
+    run("--tolerance", "0")
+
+    assert len(run.fits) == 2
+    np.testing.assert_array_equal(run.fits[1], np.array(state.C))
+    assert not np.allclose(run.fits[1], build_initial_cost_matrix(CATEGORIES))
+    assert run.seed_writes == 2
+    refit = load_fit_state(run.state_path)
+    assert refit is not None and refit.samples == 41 and refit.last_date == "1970-02-10"
+
+
+def test_changed_method_does_not_warm_start(run: IncrementalRun) -> None:
+    run()
+
+    run("--method", "sinkhorn")
+
+    assert len(run.fits) == 2
+    np.testing.assert_array_equal(run.fits[1], build_initial_cost_matrix(CATEGORIES))
+
+
+def test_movement_below_tolerance_keeps_the_seed(run: IncrementalRun) -> None:
+    run()
+    seed = run.seed()
+    run.samples = _samples(41)
+
+    run("--tolerance", "1")
+
+    assert len(run.fits) == 2
+    assert run.seed_writes == 1
+    assert run.seed() == seed
+    # The state still moves on, so the next run warm-starts from this fit
+    state = load_fit_state(run.state_path)
+    assert state is not None and state.samples == 41
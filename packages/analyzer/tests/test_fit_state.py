@@ -0,0 +1,87 @@
+"""Tests for analyzer.fit_state."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from analyzer.data import Category, PairedSamples
+from analyzer.fit_state import build_state, fingerprint, load_fit_state, save_fit_state
+
+CATEGORIES = [Category("Sleep", "Essentials"), Category("Work", "Obligation")]
+PARAMS = {"reg": 0.1, "max_iter": 100, "method": "exact", "epsilon": 0.01}
+
+
+def _samples(count: int = 5) -> PairedSamples:
+    rng = np.random.default_rng(0)
+    return PairedSamples(
+        dates=np.arange(count).astype("datetime64[D]"),
+        targets=rng.random((count, 2)),
+        actuals=rng.random((count, 2)),
+    )
+
+
+def _state(samples: PairedSamples | None = None):
+    samples = samples or _samples()
+    return build_state(
+        fingerprint(samples, CATEGORIES, PARAMS), CATEGORIES, PARAMS, samples,
+        np.array([[0.0, 1.5], [2.5, 0.0]]), loss=0.25, iterations=7, evaluations=9,
+    )
+
+
+def test_can_warm_start_with_the_same_categories_and_params() -> None:
+    assert _state().can_warm_start(CATEGORIES, dict(PARAMS))
+
+
+@pytest.mark.parametrize("change", [{"reg": 0.2}, {"method": "sinkhorn"}, {"scale": "x"}])
+def test_params_change_turns_off_warm_start(change: dict) -> None:
+    assert not _state().can_warm_start(CATEGORIES, {**PARAMS, **change})
+
+
+@pytest.mark.parametrize(
+    "categories",
+    [
+        CATEGORIES[::-1],
+        CATEGORIES[:1],
+        [*CATEGORIES, Category("Hobby", "Leisure")],
+        [CATEGORIES[0], Category("Job", "Obligation")],
+    ],
+)
+def test_categories_change_turns_off_warm_start(categories: list[Category]) -> None:
+    assert not _state().can_warm_start(categories, PARAMS)
+
+
+def test_fingerprint_changes_with_every_input() -> None:
+    samples = _samples()
+    base = fingerprint(samples, CATEGORIES, PARAMS)
+
+    assert fingerprint(_samples(), CATEGORIES, dict(PARAMS)) == base
+    assert fingerprint(_samples(6), CATEGORIES, PARAMS) != base
+    assert fingerprint(samples, CATEGORIES, {**PARAMS, "reg": 0.2}) != base
+    assert fingerprint(samples, [CATEGORIES[0], Category("Work", "Leisure")], PARAMS) != base
+    edited = PairedSamples(samples.dates, samples.targets.copy(), samples.actuals)
+    edited.targets[2, 1] += 0.5
+    assert fingerprint(edited, CATEGORIES, PARAMS) != base
+
+
+def test_state_round_trip(tmp_path: Path) -> None:
+    state = _state()
+    path = tmp_path / "state" / "cost_matrix_state.json"
+
+    save_fit_state(state, path)
+
+    assert load_fit_state(path) == state
+    assert state.samples == 5
+    assert state.last_date == "1970-01-05"
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_unreadable_state_is_ignored(tmp_path: Path) -> None:
+    path = tmp_path / "cost_matrix_state.json"
+    assert load_fit_state(path) is None
+
+    path.write_text('{"fingerprint": "abc"}', encoding="utf-8")
+    assert load_fit_state(path) is None
+
+    path.write_text("{", encoding="utf-8")
+    assert load_fit_state(path) is None
@@ -0,0 +1,189 @@
+"""Tests for embedding.lexical."""
+
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from embedding.lexical import (
+    LexicalIndex,
+    _encode_varint,
+    decode_varints,
+    load_or_build,
+    tokenize,
+)
+from embedding.types import Chunk, IndexedChunk
+
+T0 = datetime(2026, 1, 1, tzinfo=UTC)
+
+
+@pytest.mark.parametrize(
+    "value, encoded",
+    [(0, b"\x00"), (1, b"\x01"), (127, b"\x7f"), (128, b"\x80\x01"), (300, b"\xac\x02")],
+)
+def test_varint_is_leb128(value: int, encoded: bytes) -> None:
+    out = bytearray()
+    _encode_varint(value, out)
+
+    assert bytes(out) == encoded
+
+
+def test_varints_round_trip() -> None:
+    values = [0, 1, 127, 128, 16383, 16384, 2**31 - 1, 2**40, 5]
+    out = bytearray()
+    for value in values:
+        _encode_varint(value, out)
+
+    assert decode_varints(out).tolist() == values
+    assert decode_varints(b"").tolist() == []
+
+
+def test_random_varints_round_trip() -> None:
+    rng = np.random.default_rng(0)
+    values = (rng.integers(0, 2**20, 5000) >> rng.integers(0, 20, 5000)).tolist()
+    out = bytearray()
+    for value in values:
+        _encode_varint(value, out)
+
+    assert decode_varints(out).tolist() == values
+
+
+def test_tokenize_japanese_bigrams_and_identifiers() -> None:
+    assert tokenize("時間管理") == ["時間", "間管", "管理"]
+    assert tokenize("を") == ["を"]
+    assert tokenize("fct_time.split") == ["fct_time.split", "fct", "time", "split"]
+    # NFKC and case folding
+    assert tokenize("ＡＢＣ") == ["abc"]
+
+
+def _chunk(index: int, content: str) -> Chunk:
+    return Chunk(chunk_index=index, parent_heading="", heading="", content=content)
+
+
+def test_postings_decode_to_entries_and_term_frequencies() -> None:
+    """Test that postings store entry gaps and term frequencies as varint pairs."""
+    index = LexicalIndex.build([
+        ("d1", _chunk(0, "alpha beta")),
+        ("d1", _chunk(1, "beta beta")),
+        ("d2", _chunk(0, "beta")),
+    ])
+
+    entries, tfs = LexicalIndex._decode(index._postings["beta"])
+
+    assert entries.tolist() == [0, 1, 2]
+    assert tfs.tolist() == [1, 2, 1]
+    assert index.posting_count() == 4
+
+
+def test_search_ranks_by_bm25() -> None:
+    index = LexicalIndex.build([
+        ("d1", _chunk(0, "時間管理 の 設計")),
+        ("d2", _chunk(0, "embedding の 設計")),
+        ("d3", _chunk(0, "時間管理 時間管理 レポート")),
+    ])
+
+    hits = index.search("時間管理")
+
+    assert [hit.document_id for hit in hits] == ["d3", "d1"]
+    assert hits[0].score > hits[1].score > 0
+
+
+def test_replace_tombstones_then_compacts() -> None:
+    """Test that replaced chunks stop matching and compaction keeps the live postings intact."""
+    index = LexicalIndex.build([
+        ("d1", _chunk(0, "alpha")),
+        ("d2", _chunk(0, "alpha beta")),
+        ("d3", _chunk(0, "delta")),
+        ("d4", _chunk(0, "epsilon")),
+    ])
+
+    # 1 tombstone in 5 entries stays under COMPACT_RATIO
+    index.replace_document("d1", [_chunk(0, "gamma")])
+
+    assert index.tombstones == 1
+    assert [hit.document_id for hit in index.search("alpha")] == ["d2"]
+    assert [hit.document_id for hit in index.search("gamma")] == ["d1"]
+    assert index.size == 4
+
+    index.compact()
+
+    assert index.tombstones == 0
+    assert [hit.document_id for hit in index.search("alpha")] == ["d2"]
+    assert [hit.document_id for hit in index.search("gamma")] == ["d1"]
+
+
+def test_save_and_load_round_trip(tmp_path: Path) -> None:
+    index = LexicalIndex.build([("d1", _chunk(0, "時間管理 alpha")), ("d2", _chunk(3, "alpha"))])
+    path = tmp_path / "lexical.npz"
+
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+
+    assert loaded.size == index.size
+    assert loaded._postings == index._postings
+    assert loaded.search("alpha") == index.search("alpha")
+
+
+class FakeRepository:
+    """iter_indexed_chunks / get_chunked_document_ids over an in-memory rag.chunks."""
+
+    def __init__(self) -> None:
+        self.documents: dict[str, tuple[datetime, list[str]]] = {}
+
+    def save(self, document_id: str, embedded_at: datetime, *contents: str) -> None:
+        self.documents[document_id] = (embedded_at, list(contents))
+
+    def iter_indexed_chunks(self, since: datetime | None = None) -> list[IndexedChunk]:
+        return [
+            IndexedChunk(
+                id=f"{document_id}#{i}", document_id=document_id, chunk_index=i, title=None,
+                heading="", content=content, file_path=f"{document_id}.md", tags=[],
+                embedding=np.zeros(2, dtype=np.float32), embedded_at=embedded_at,
+            )
+            for document_id, (embedded_at, contents) in sorted(self.documents.items())
+            if since is None or embedded_at > since
+            for i, content in enumerate(contents)
+        ]
+
+    def get_chunked_document_ids(self) -> set[str]:
+        return {d for d, (_, contents) in self.documents.items() if contents}
+
+
+def _ids(index: LexicalIndex, query: str) -> list[str]:
+    return sorted(hit.document_id for hit in index.search(query))
+
+
+def test_load_catches_up_after_a_run_that_never_saved(tmp_path: Path) -> None:
+    """Test that windows committed by a run that raised before saving reach the index on the next load."""
+    path = tmp_path / "lexical.npz"
+    repo = FakeRepository()
+    repo.save("d1", T0, "alpha")
+    repo.save("d2", T0, "beta")
+    load_or_build(repo, path).save()  # type: ignore[arg-type]
+
+    # A later run commits these windows, then raises before the index is saved
+    repo.save("d1", T0 + timedelta(hours=1), "gamma")
+    repo.save("d2", T0 + timedelta(hours=1))
+    repo.save("d3", T0 + timedelta(hours=2), "alpha delta")
+    # embedded_at is the transaction start, so a slow commit can land behind the watermark
+    repo.save("d4", T0 - timedelta(minutes=1), "epsilon")
+
+    index = load_or_build(repo, path)  # type: ignore[arg-type]
+
+    assert _ids(index, "alpha") == ["d3"]
+    assert _ids(index, "gamma") == ["d1"]
+    assert _ids(index, "beta") == []
+    assert _ids(index, "epsilon") == ["d4"]
+    assert index.size == 3
+    assert index.watermark == T0 + timedelta(hours=2)
+
+
+def test_watermark_round_trips(tmp_path: Path) -> None:
+    path = tmp_path / "lexical.npz"
+    repo = FakeRepository()
+    repo.save("d1", T0, "alpha")
+
+    load_or_build(repo, path).save()  # type: ignore[arg-type]
+
+    assert LexicalIndex.load(path).watermark == T0
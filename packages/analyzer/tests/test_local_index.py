@@ -0,0 +1,185 @@
+"""Tests for embedding.local_index."""
+
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from embedding import local_index
+from embedding.local_index import LocalIndex, export_index, normalize, refresh_index
+from embedding.types import IndexedChunk
+
+T0 = datetime(2026, 1, 1, tzinfo=UTC)
+DIM = 16
+TAGS = ["a", "b", "c", "d"]
+
+
+class FakeRepository:
+    """iter_indexed_chunks / get_chunked_document_ids over an in-memory rag.chunks."""
+
+    def __init__(self) -> None:
+        self.chunks: dict[str, list[IndexedChunk]] = {}
+
+    def save(
+        self,
+        document_id: str,
+        embedded_at: datetime,
+        vectors: np.ndarray,
+        tags: list[str] | None = None,
+        content: str = "",
+    ) -> None:
+        self.chunks[document_id] = [
+            IndexedChunk(
+                id=f"{document_id}#{i}", document_id=document_id, chunk_index=i, title=None,
+                heading="", content=content or f"{document_id} {i}", file_path=f"{document_id}.md",
+                tags=tags or [], embedding=vector, embedded_at=embedded_at,
+            )
+            for i, vector in enumerate(vectors)
+        ]
+
+    def iter_indexed_chunks(self, since: datetime | None = None) -> list[IndexedChunk]:
+        return [
+            chunk
+            for document_id in sorted(self.chunks)
+            for chunk in self.chunks[document_id]
+            if since is None or chunk.embedded_at > since
+        ]
+
+    def get_chunked_document_ids(self) -> set[str]:
+        return {d for d, chunks in self.chunks.items() if chunks}
+
+
+@pytest.fixture
+def repo() -> FakeRepository:
+    """60 documents x 5 chunks of random vectors, each document tagged with one or two tags."""
+    rng = np.random.default_rng(0)
+    repo = FakeRepository()
+    for d in range(60):
+        tags = [TAGS[d % 4]] + ([TAGS[(d + 1) % 4]] if d % 3 == 0 else [])
+        repo.save(f"doc{d:02d}", T0, rng.standard_normal((5, DIM)).astype(np.float32), tags)
+    return repo
+
+
+def _brute_force(
+    index: LocalIndex, queries: np.ndarray, k: int, tags: list[str] | None = None
+) -> list[list[int]]:
+    vectors = np.asarray(index.vectors)
+    allowed = np.arange(index.size)
+    if tags is not None:
+        allowed = np.asarray(
+            [row for row, c in enumerate(index.chunks) if set(c.tags) & set(tags)], dtype=np.int64
+        )
+    scores = normalize(queries) @ vectors[allowed].T
+    return [allowed[np.argsort(-s, kind="stable")[:k]].tolist() for s in scores]
+
+
+def _queries(count: int = 8, seed: int = 1) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+@pytest.mark.parametrize("block_rows", [local_index.SEARCH_BLOCK_ROWS, 7, 64])
+def test_exact_search_matches_brute_force(
+    repo: FakeRepository, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, block_rows: int
+) -> None:
+    """Test that the blocked top-k merge returns the same rows as scoring every row at once."""
+    monkeypatch.setattr(local_index, "SEARCH_BLOCK_ROWS", block_rows)
+    index = export_index(repo, tmp_path)  # type: ignore[arg-type]
+    queries = _queries()
+
+    results = index.search_rows(queries, match_count=10, similarity_threshold=-1.0)
+
+    assert [[row for row, _ in ranked] for ranked in results] == _brute_force(index, queries, 10)
+    for ranked in results:
+        scores = [score for _, score in ranked]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_similarity_threshold_and_hits(repo: FakeRepository, tmp_path: Path) -> None:
+    index = export_index(repo, tmp_path)  # type: ignore[arg-type]
+    query = np.asarray(repo.chunks["doc07"][2].embedding)
+
+    hits = index.search(query, match_count=3, similarity_threshold=0.99)
+
+    assert [hit.id for hit in hits] == ["doc07#2"]
+    assert hits[0].similarity == pytest.approx(1.0)
+    assert hits[0].file_path == "doc07.md"
+
+
+def test_ivf_with_every_list_probed_matches_exact(repo: FakeRepository, tmp_path: Path) -> None:
+    index = export_index(repo, tmp_path, nlist=8)  # type: ignore[arg-type]
+    assert index.ivf is not None and index.ivf.nlist == 8
+    queries = _queries()
+
+    exact = index.search_rows(queries, match_count=10, similarity_threshold=-1.0)
+    ivf = index.search_rows(queries, match_count=10, similarity_threshold=-1.0, nprobe=8)
+
+    assert [[row for row, _ in r] for r in ivf] == [[row for row, _ in r] for r in exact]
+    for a, b in zip(ivf, exact, strict=True):
+        np.testing.assert_allclose([s for _, s in a], [s for _, s in b], rtol=1e-6)
+
+
+def test_ivf_lists_partition_the_rows(repo: FakeRepository, tmp_path: Path) -> None:
+    index = export_index(repo, tmp_path, nlist=8)  # type: ignore[arg-type]
+    assert index.ivf is not None
+
+    rows = index.ivf.candidates(_queries(1)[0], nprobe=index.ivf.nlist)
+
+    assert sorted(rows.tolist()) == list(range(index.size))
+
+
+@pytest.mark.parametrize("nprobe", [None, 8])
+@pytest.mark.parametrize("tags", [["a"], ["b", "d"], ["missing"], []])
+def test_filter_tags_match_any_tag(
+    repo: FakeRepository, tmp_path: Path, tags: list[str], nprobe: int | None
+) -> None:
+    """Test that filter_tags keeps rows having any of the tags, like jsonb ?| in search_chunks."""
+    index = export_index(repo, tmp_path, nlist=8)  # type: ignore[arg-type]
+    queries = _queries()
+
+    results = index.search_rows(
+        queries, filter_tags=tags, match_count=10, similarity_threshold=-1.0, nprobe=nprobe
+    )
+
+    assert [[row for row, _ in r] for r in results] == _brute_force(index, queries, 10, tags)
+    for ranked in results:
+        assert all(set(index.chunks[row].tags) & set(tags) for row, _ in ranked)
+
+
+def test_refresh_applies_changes_and_drops_documents_without_chunks(
+    repo: FakeRepository, tmp_path: Path
+) -> None:
+    index = export_index(repo, tmp_path, nlist=4)  # type: ignore[arg-type]
+    assert index.watermark == T0
+    rng = np.random.default_rng(2)
+    later = T0 + timedelta(hours=1)
+
+    repo.chunks["doc03"] = []  # every chunk deleted (the document became empty)
+    del repo.chunks["doc04"]  # the document itself was removed
+    repo.save("doc05", later, rng.standard_normal((2, DIM)).astype(np.float32), ["a"], "edited")
+    repo.save("doc99", later, rng.standard_normal((3, DIM)).astype(np.float32), ["c"])
+
+    refreshed = refresh_index(repo, tmp_path)  # type: ignore[arg-type]
+
+    by_doc: dict[str, list[str]] = {}
+    for chunk in refreshed.chunks:
+        by_doc.setdefault(chunk.document_id, []).append(chunk.content)
+    assert set(by_doc) == repo.get_chunked_document_ids()
+    assert by_doc["doc05"] == ["edited", "edited"]
+    assert len(by_doc["doc99"]) == 3
+    assert refreshed.size == 300 - 5 - 5 - 3 + 3
+    assert refreshed.watermark == later
+    assert refreshed.ivf is not None and refreshed.ivf.nlist == 4
+
+    # The new rows are searchable
+    hits = refreshed.search(repo.chunks["doc99"][1].embedding, match_count=1)
+    assert [hit.id for hit in hits] == ["doc99#1"]
+
+
+def test_refresh_without_changes_keeps_the_version(repo: FakeRepository, tmp_path: Path) -> None:
+    index = export_index(repo, tmp_path)  # type: ignore[arg-type]
+
+    refreshed = refresh_index(repo, tmp_path)  # type: ignore[arg-type]
+
+    assert refreshed.directory == index.directory
+    assert LocalIndex.open(tmp_path).size == index.size
@@ -0,0 +1,41 @@
+"""Tests for embedding.metrics."""
+
+import json
+from pathlib import Path
+
+from embedding.metrics import Metrics, format_prometheus
+
+
+def test_gauge_keeps_the_latest_value_per_label_set(tmp_path: Path) -> None:
+    metrics = Metrics(tmp_path / "events.jsonl", tmp_path / "embedding.prom")
+    metrics.gauge("freshness_lag_seconds", 3.0, quantile="0.5")
+    metrics.gauge("freshness_lag_seconds", 9.0, quantile="0.99")
+    metrics.gauge("freshness_lag_seconds", 2.5, quantile="0.5")
+
+    summary = metrics.flush()
+    metrics.close()
+
+    assert summary["gauges"] == {
+        "freshness_lag_seconds": {'quantile="0.5"': 2.5, 'quantile="0.99"': 9.0}
+    }
+    events = [json.loads(line) for line in (tmp_path / "events.jsonl").read_text().splitlines()]
+    assert [(e["gauge"], e["quantile"], e["value"]) for e in events[:3]] == [
+        ("freshness_lag_seconds", "0.5", 3.0),
+        ("freshness_lag_seconds", "0.99", 9.0),
+        ("freshness_lag_seconds", "0.5", 2.5),
+    ]
+    assert events[3]["span"] == "summary"
+    assert events[3]["gauges"] == summary["gauges"]
+    text = (tmp_path / "embedding.prom").read_text()
+    assert "# TYPE embedding_freshness_lag_seconds gauge\n" in text
+    assert 'embedding_freshness_lag_seconds{quantile="0.5"} 2.5\n' in text
+    assert 'embedding_freshness_lag_seconds{quantile="0.99"} 9.0\n' in text
+
+
+def test_gauge_without_labels() -> None:
+    metrics = Metrics()
+    metrics.gauge("queue_depth", 4)
+
+    text = format_prometheus(metrics.summary())
+
+    assert "embedding_queue_depth 4.0\n" in text
@@ -0,0 +1,98 @@
+"""Tests for embedding.pgcopy.
+
+The rows are decoded again with a small reader written from the PostgreSQL
+binary COPY format documentation, so the tests need no database.
+"""
+
+import struct
+import uuid
+
+import numpy as np
+import pytest
+
+from embedding.pgcopy import encode_copy_binary
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def _read_fields(data: bytes) -> list[list[bytes | None]]:
+    """Split a binary COPY stream into rows of raw field values."""
+    assert data[:11] == SIGNATURE
+    flags, extension = struct.unpack_from(">ii", data, 11)
+    assert (flags, extension) == (0, 0)
+    pos = 19
+    rows: list[list[bytes | None]] = []
+    while True:
+        (count,) = struct.unpack_from(">h", data, pos)
+        pos += 2
+        if count == -1:
+            assert pos == len(data)
+            return rows
+        row: list[bytes | None] = []
+        for _ in range(count):
+            (length,) = struct.unpack_from(">i", data, pos)
+            pos += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(data[pos:pos + length])
+                pos += length
+        rows.append(row)
+
+
+def test_empty_stream_has_header_and_trailer_only() -> None:
+    data = encode_copy_binary([], ["int4"])
+
+    assert data == SIGNATURE + struct.pack(">iih", 0, 0, -1)
+    assert _read_fields(data) == []
+
+
+def test_scalar_columns_round_trip() -> None:
+    row_id = uuid.uuid4()
+    data = encode_copy_binary(
+        [(str(row_id), 7, "見出し 😀"), (row_id, -1, "")],
+        ["uuid", "int4", "text"],
+    )
+
+    rows = _read_fields(data)
+
+    assert rows[0] == [row_id.bytes, struct.pack(">i", 7), "見出し 😀".encode()]
+    assert rows[1] == [row_id.bytes, struct.pack(">i", -1), b""]
+
+
+def test_none_is_encoded_as_null() -> None:
+    rows = _read_fields(encode_copy_binary([(None, 3, None)], ["text", "int4", "vector"]))
+
+    assert rows == [[None, struct.pack(">i", 3), None]]
+
+
+def test_vector_uses_pgvector_wire_format() -> None:
+    """Test the vector_recv layout: int16 dim, int16 unused, big-endian float4 values."""
+    vector = np.array([0.5, -1.25, 3.0e-8], dtype=np.float32)
+
+    (field,) = _read_fields(encode_copy_binary([(vector,)], ["vector"]))[0]
+
+    assert field is not None
+    dim, unused = struct.unpack_from(">HH", field)
+    assert (dim, unused) == (3, 0)
+    np.testing.assert_array_equal(np.frombuffer(field[4:], dtype=">f4"), vector)
+
+
+def test_vector_accepts_float64_lists() -> None:
+    (field,) = _read_fields(encode_copy_binary([([1.0, 2.0],)], ["vector"]))[0]
+
+    assert field == struct.pack(">HHff", 2, 0, 1.0, 2.0)
+
+
+def test_unknown_kind_is_rejected() -> None:
+    with pytest.raises(KeyError):
+        encode_copy_binary([(1,)], ["jsonb"])
+
+
+def test_varbit_packs_first_bit_most_significant() -> None:
+    """Test the varbit_recv layout: int32 bit count, then the bits packed MSB first."""
+    bits = np.array([1, 0, 1, 1, 0, 0, 0, 0, 1, 1], dtype=bool)
+
+    (field,) = _read_fields(encode_copy_binary([(bits,)], ["varbit"]))[0]
+
+    assert field == struct.pack(">i", 10) + bytes([0b10110000, 0b11000000])
@@ -0,0 +1,181 @@
+"""Tests for embedding.query."""
+
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from embedding import embedder as embedder_module
+from embedding.embedder import EmbeddingClient
+from embedding.query import QueryCache, QueryEmbedder, normalize_query
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeEmbedBatch:
+    """Records each call; embeds a text as [len(text), calls so far]."""
+
+    def __init__(self, error: Exception | None = None):
+        self.calls: list[list[str]] = []
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return np.asarray([[len(t), len(self.calls)] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def embed_batch() -> FakeEmbedBatch:
+    return FakeEmbedBatch()
+
+
+@pytest.fixture
+def queries(embed_batch: FakeEmbedBatch) -> Iterator[QueryEmbedder]:
+    # A long window, so that queries from threads started together land in one batch
+    embedder = QueryEmbedder(embed_batch, max_wait_ms=200)
+    yield embedder
+    embedder.close()
+
+
+def _together(fn, args: Sequence[str]) -> list:
+    """Call fn(arg) for every arg from separate threads released at the same time."""
+    barrier = threading.Barrier(len(args))
+
+    def call(arg: str):
+        barrier.wait()
+        return fn(arg)
+
+    with ThreadPoolExecutor(len(args)) as pool:
+        futures = [pool.submit(call, arg) for arg in args]
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_normalize_query() -> None:
+    assert normalize_query("  時間　管理\n\tＡＢＣ  ") == "時間 管理 ABC"
+
+
+def test_cache_entries_expire_after_ttl() -> None:
+    clock = FakeClock()
+    cache = QueryCache(max_size=4, ttl_seconds=10, clock=clock)
+    cache.put("q", np.ones(2, dtype=np.float32))
+
+    clock.now = 9.9
+    assert cache.get("q") is not None
+
+    clock.now = 10.0
+    assert cache.get("q") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache = QueryCache(max_size=2, clock=FakeClock())
+    cache.put("a", np.zeros(1, dtype=np.float32))
+    cache.put("b", np.zeros(1, dtype=np.float32))
+    cache.get("a")
+
+    cache.put("c", np.zeros(1, dtype=np.float32))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_concurrent_misses_are_sent_in_one_call(
+    queries: QueryEmbedder, embed_batch: FakeEmbedBatch
+) -> None:
+    texts = [f"query {i}" * (i + 1) for i in range(8)]
+
+    results = _together(queries.embed, texts)
+
+    assert len(embed_batch.calls) == 1
+    assert sorted(embed_batch.calls[0]) == sorted(texts)
+    assert [int(r[0]) for r in results] == [len(t) for t in texts]
+    assert queries.stats().api_calls == 1
+    assert queries.stats().avg_batch_size == 8
+
+
+def test_repeated_query_hits_the_normalized_cache(
+    queries: QueryEmbedder, embed_batch: FakeEmbedBatch
+) -> None:
+    first = queries.embed("時間管理")
+    again = queries.embed("  時間管理 ")
+
+    np.testing.assert_array_equal(first, again)
+    assert len(embed_batch.calls) == 1
+    stats = queries.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+    assert stats.hit_rate == 0.5
+
+
+def test_identical_in_flight_queries_share_one_future(embed_batch: FakeEmbedBatch) -> None:
+    """Test that a query arriving while the same query is at the API waits for that call."""
+    embed_batch.release.clear()
+    queries = QueryEmbedder(embed_batch, max_wait_ms=1)
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            first = pool.submit(queries.embed, "q")
+            assert embed_batch.started.wait(5)
+            # The batch has left the batcher; a second batch would mean a second call
+            second = pool.submit(queries.embed, " q ")
+            assert queries._submit("q") is queries._inflight["q"]
+            time.sleep(0.05)
+            embed_batch.release.set()
+
+            np.testing.assert_array_equal(first.result(5), second.result(5))
+        assert embed_batch.calls == [["q"]]
+        assert queries._inflight == {}
+    finally:
+        queries.close()
+
+
+def test_errors_reach_every_waiter_and_are_not_cached() -> None:
+    embed_batch = FakeEmbedBatch(error=RuntimeError("API down"))
+    queries = QueryEmbedder(embed_batch, max_wait_ms=200)
+    try:
+        results = _together(queries.embed, ["a", "b", "a", "c"])
+
+        assert len(embed_batch.calls) == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert len(queries.cache) == 0
+        assert queries._inflight == {}
+
+        # The next attempt goes to the API again and succeeds
+        assert queries.embed("a")[0] == 1
+        assert len(embed_batch.calls) == 2
+    finally:
+        queries.close()
+
+
+def test_client_starts_one_query_embedder_across_threads(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that concurrent first calls to query_embedder share a single batcher."""
+    created: list[object] = []
+
+    class SlowQueryEmbedder:
+        def __init__(self, *args: object, **kwargs: object):
+            time.sleep(0.05)  # widen the window in which a second thread could start another
+            created.append(self)
+
+    monkeypatch.setattr(embedder_module, "QueryEmbedder", SlowQueryEmbedder)
+    client = EmbeddingClient("test-key")
+
+    results = _together(lambda _: client.query_embedder(), ["x"] * 8)
+
+    assert len(created) == 1
+    assert all(r is created[0] for r in results)
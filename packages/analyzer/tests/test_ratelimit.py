@@ -0,0 +1,73 @@
+"""Tests for embedding.ratelimit."""
+
+import pytest
+
+from embedding import ratelimit
+from embedding.ratelimit import RateLimiter, TokenBucket
+
+
+def test_bucket_starts_full_and_refills_at_rate() -> None:
+    """Test that a bucket starts at capacity and refills rate_per_minute / 60 per second."""
+    bucket = TokenBucket(rate_per_minute=120)
+    start = bucket.updated_at
+    assert bucket.available == 120
+
+    bucket.take(100)
+    bucket.refill(start + 5)
+
+    assert bucket.available == pytest.approx(30)
+
+
+def test_bucket_refill_is_capped_at_capacity() -> None:
+    """Test that idle time never fills the bucket past its capacity."""
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    bucket.take(10)
+
+    bucket.refill(bucket.updated_at + 3600)
+
+    assert bucket.available == 10
+
+
+def test_bucket_wait_time_covers_the_deficit() -> None:
+    """Test that wait_time is the time to refill the missing amount."""
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.take(60)
+
+    assert bucket.wait_time(0) == 0
+    assert bucket.wait_time(3) == pytest.approx(3.0)
+
+
+def test_bucket_rejects_non_positive_rate() -> None:
+    with pytest.raises(ValueError):
+        TokenBucket(rate_per_minute=0)
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Frozen time.monotonic for the limiter (advance by editing clock[0])."""
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_limiter_waits_for_the_scarcer_bucket(clock: list[float]) -> None:
+    """Test that a request passes only when both the request and the token bucket allow it."""
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+
+    assert limiter._try_acquire(500) == 0
+    # 100 tokens left: 200 more need 100 / (600 / 60) = 10 seconds
+    assert limiter._try_acquire(200) == pytest.approx(10.0)
+    # A refused request takes nothing
+    assert limiter.tokens.available == pytest.approx(100)
+
+    clock[0] += 10
+    assert limiter._try_acquire(200) == 0
+
+
+def test_limiter_caps_oversized_requests_at_capacity(clock: list[float]) -> None:
+    """Test that a request larger than the token bucket waits for a full bucket instead of forever."""
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+
+    assert limiter._try_acquire(10_000) == 0
+    assert limiter.tokens.available == 0
+    assert limiter._try_acquire(10_000) == pytest.approx(60.0)
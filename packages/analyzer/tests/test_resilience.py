@@ -0,0 +1,136 @@
+"""Tests for embedding.resilience."""
+
+from datetime import UTC, datetime
+from email.utils import format_datetime
+
+import pytest
+
+from embedding.resilience import (
+    MAX_RETRY_DELAY,
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_delay,
+    is_transient,
+    retry_after_seconds,
+)
+
+
+class ApiError(Exception):
+    def __init__(self, http_status: int | None = None, headers: dict[str, str] | None = None):
+        super().__init__(f"status {http_status}")
+        self.http_status = http_status
+        self.headers = headers
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (ApiError(429), True),
+        (ApiError(500), True),
+        (ApiError(503), True),
+        (ConnectionError("reset"), True),
+        (ApiError(400), False),
+        (ApiError(401), False),
+        (CircuitOpenError("open"), False),
+    ],
+)
+def test_is_transient(error: BaseException, expected: bool) -> None:
+    assert is_transient(error) is expected
+
+
+def test_retry_after_seconds_and_http_date() -> None:
+    now = datetime(2026, 1, 1, tzinfo=UTC).timestamp()
+    date = format_datetime(datetime(2026, 1, 1, 0, 0, 30, tzinfo=UTC), usegmt=True)
+
+    assert retry_after_seconds(ApiError(429, {"Retry-After": "7"})) == 7.0
+    assert retry_after_seconds(ApiError(429, {"retry-after": date}), now=lambda: now) == 30.0
+    assert retry_after_seconds(ApiError(429, {"Retry-After": "-3"})) == 0.0
+    assert retry_after_seconds(ApiError(429, {"Retry-After": "soon"})) is None
+    assert retry_after_seconds(ApiError(429)) is None
+
+
+def test_backoff_honours_retry_after_up_to_the_cap() -> None:
+    assert backoff_delay(0, 1.0, ApiError(429, {"Retry-After": "12"})) == 12.0
+    assert backoff_delay(0, 1.0, ApiError(429, {"Retry-After": "9999"})) == MAX_RETRY_DELAY
+
+
+def test_backoff_without_retry_after_is_full_jitter() -> None:
+    error = ApiError(503)
+    for attempt in range(10):
+        delays = [backoff_delay(attempt, 0.5, error) for _ in range(50)]
+        assert all(0 <= d <= min(0.5 * 2 ** attempt, MAX_RETRY_DELAY) for d in delays)
+
+
+def test_breaker_opens_after_consecutive_transient_failures() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(ApiError(503))
+    assert not breaker.is_open
+
+    breaker.record_failure(ApiError(503))
+
+    assert breaker.is_open
+    assert breaker.trips == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_non_transient_errors_reset_the_count() -> None:
+    """Test that a 4xx means the API is answering, so it counts as a success."""
+    breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+
+    breaker.record_failure(ApiError(503))
+    breaker.record_failure(ApiError(400))
+    breaker.record_failure(ApiError(503))
+
+    assert not breaker.is_open
+    assert breaker.failures == 1
+
+
+def test_half_open_lets_one_probe_through() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure(ApiError(503))
+
+    clock.now = 10
+    breaker.before_call()
+    # a second caller is held back while the probe is in flight
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+
+    assert not breaker.is_open
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_and_counts_a_trip() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure(ApiError(503))
+
+    clock.now = 10
+    breaker.before_call()
+    breaker.record_failure(ApiError(503))
+
+    assert breaker.is_open
+    assert breaker.trips == 2
+    assert breaker.opened_at == 10
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_invalid_threshold_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_threshold=0)
@@ -0,0 +1,109 @@
+"""Tests for analyzer.transport."""
+
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from analyzer.transport import _MAX_KERNEL_EXPONENT, SUB_BATCH, ExactTransport, sinkhorn, transport
+
+
+def _reference_cost(p: np.ndarray, q: np.ndarray, C: np.ndarray) -> float:
+    """The transport LP with every supply and demand row, one call per pair."""
+    n, m = C.shape
+    A_eq = np.zeros((n + m, n * m))
+    for i in range(n):
+        A_eq[i, i * m:(i + 1) * m] = 1
+    for j in range(m):
+        A_eq[n + j, j::m] = 1
+    result = linprog(C.ravel(), A_eq=A_eq, b_eq=np.concatenate([p, q]), bounds=(0, None))
+    assert result.success
+    return float(result.fun)
+
+
+def _problem(batch: int, n: int = 6, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    P = rng.dirichlet(np.ones(n), batch)
+    Q = rng.dirichlet(np.full(n, 0.5), batch)
+    C = rng.random((n, n))
+    np.fill_diagonal(C, 0.0)
+    return P, Q, C
+
+
+@pytest.mark.parametrize("batch", [1, 5, SUB_BATCH, SUB_BATCH + 1, 2 * SUB_BATCH + 6])
+def test_exact_batch_matches_reference_lp(batch: int) -> None:
+    """Test that sub-batching and padding of the last sub-batch leave every pair's cost unchanged."""
+    P, Q, C = _problem(batch)
+
+    result = ExactTransport(*C.shape).solve_batch(P, Q, C)
+
+    expected = [_reference_cost(p, q, C) for p, q in zip(P, Q, strict=True)]
+    np.testing.assert_allclose(result.cost, expected, atol=1e-9)
+    np.testing.assert_allclose(result.plan.sum(axis=2), P, atol=1e-9)
+    np.testing.assert_allclose(result.plan.sum(axis=1), Q, atol=1e-9)
+    assert (result.plan >= -1e-12).all()
+
+
+def test_infeasible_pair_fails_alone() -> None:
+    """Test that one infeasible pair gets inf without failing the rest of its sub-batch."""
+    P, Q, C = _problem(10)
+    P[3] = -P[3]
+
+    result = ExactTransport(*C.shape).solve_batch(P, Q, C)
+
+    assert result.cost[3] == np.inf
+    assert not result.plan[3].any()
+    others = np.delete(np.arange(10), 3)
+    expected = [_reference_cost(P[i], Q[i], C) for i in others]
+    np.testing.assert_allclose(result.cost[others], expected, atol=1e-9)
+
+
+def test_exact_single_solve() -> None:
+    P, Q, C = _problem(1)
+
+    cost, plan = ExactTransport(*C.shape).solve(P[0], Q[0], C)
+
+    assert cost == pytest.approx(_reference_cost(P[0], Q[0], C), abs=1e-9)
+    assert float((plan * C).sum()) == pytest.approx(cost)
+
+
+def test_sinkhorn_approaches_exact_cost() -> None:
+    P, Q, C = _problem(20)
+    exact = transport(P, Q, C, method="exact").cost
+
+    errors = [
+        np.abs(sinkhorn(P, Q, C, epsilon=epsilon).cost - exact).max()
+        for epsilon in (0.1, 0.03, 0.01)
+    ]
+
+    assert errors[0] > errors[1] > errors[2]
+    assert errors[2] < 0.05
+
+
+def test_sinkhorn_plans_have_the_given_marginals() -> None:
+    P, Q, C = _problem(20)
+
+    plan = sinkhorn(P, Q, C, epsilon=0.05, tol=1e-9).plan
+
+    np.testing.assert_allclose(plan.sum(axis=2), P, atol=1e-8)
+    np.testing.assert_allclose(plan.sum(axis=1), Q, atol=1e-8)
+
+
+def test_small_epsilon_uses_log_domain_without_underflow() -> None:
+    """Test that an epsilon where exp(-C / epsilon) underflows still gives finite, near-exact costs."""
+    P, Q, C = _problem(8)
+    C = C * 10.0
+    epsilon = 0.015
+    assert C.max() / epsilon > _MAX_KERNEL_EXPONENT
+
+    result = sinkhorn(P, Q, C, epsilon=epsilon)
+
+    assert np.isfinite(result.cost).all()
+    np.testing.assert_allclose(result.plan.sum(axis=2), P, atol=1e-6)
+    np.testing.assert_allclose(result.cost, transport(P, Q, C).cost, atol=1e-3)
+
+
+def test_unknown_method_is_rejected() -> None:
+    P, Q, C = _problem(1)
+
+    with pytest.raises(ValueError):
+        transport(P, Q, C, method="emd")  # type: ignore[arg-type]
@@ -0,0 +1,52 @@
+"""Tests for embedding.watch."""
+
+from datetime import UTC, datetime
+from pathlib import Path
+
+from embedding.metrics import Metrics
+from embedding.types import ProcessingResult
+from embedding.watch import DocumentWatcher
+
+
+class FakeRepository:
+    def __init__(self, lags: list[float]):
+        self.lags = lags
+
+    def now(self) -> datetime:
+        return datetime(2026, 1, 1, tzinfo=UTC)
+
+    def get_freshness_lags(self, since: datetime) -> list[float]:
+        return self.lags
+
+
+class FakePipeline:
+    def __init__(self, lags: list[float], metrics: Metrics):
+        self.db = FakeRepository(lags)
+        self.metrics = metrics
+
+    def run(self) -> ProcessingResult:
+        return ProcessingResult(processed=len(self.db.lags))
+
+
+def test_freshness_lag_is_recorded_as_a_gauge(tmp_path: Path) -> None:
+    """Test that the lag percentiles reach the Prometheus textfile, not just stdout."""
+    textfile = tmp_path / "embedding.prom"
+    metrics = Metrics(textfile_path=textfile)
+    pipeline = FakePipeline([float(s) for s in range(1, 101)], metrics)
+    watcher = DocumentWatcher(pipeline)  # type: ignore[arg-type]
+
+    watcher._poll()
+
+    gauges = metrics.summary()["gauges"]["freshness_lag_seconds"]
+    assert gauges['quantile="0.5"'] == watcher.stats.lag_p50 == 50.5
+    assert gauges['quantile="0.99"'] == watcher.stats.lag_p99
+    assert 'embedding_freshness_lag_seconds{quantile="0.99"}' in textfile.read_text()
+
+
+def test_no_gauge_without_embedded_documents() -> None:
+    metrics = Metrics()
+    watcher = DocumentWatcher(FakePipeline([], metrics))  # type: ignore[arg-type]
+
+    watcher._poll()
+
+    assert metrics.summary()["gauges"] == {}
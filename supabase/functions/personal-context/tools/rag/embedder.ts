@@ -1,7 +1,7 @@
 import { createClient } from "@supabase/supabase-js";
 
 const VOYAGE_API_URL = "https://api.voyageai.com/v1/embeddings";
-const MODEL = "voyage-3-lite";
+const DEFAULT_MODEL = "voyage-3-lite";
 
 function getSupabaseClient() {
   const supabaseUrl = Deno.env.get("SUPABASE_URL")!;
@@ -23,8 +23,28 @@ async function getVoyageApiKey(): Promise<string> {
   return data.api_key;
 }
 
+interface EmbeddingModel {
+  model: string;
+  output_dimension: number | null;
+}
+
+// Query embeddings must come from the model rag.chunks.embedding holds,
+// which changes when the analyzer swaps in a migrated model
+async function getActiveModel(): Promise<EmbeddingModel> {
+  const supabase = getSupabaseClient();
+
+  const { data, error } = await supabase.rpc("get_active_embedding_model");
+  const row = data?.[0];
+
+  if (error || !row) {
+    return { model: DEFAULT_MODEL, output_dimension: null };
+  }
+
+  return { model: row.model, output_dimension: row.output_dimension };
+}
+
 export async function embedQuery(text: string): Promise<number[]> {
-  const apiKey = await getVoyageApiKey();
+  const [apiKey, model] = await Promise.all([getVoyageApiKey(), getActiveModel()]);
 
   const response = await fetch(VOYAGE_API_URL, {
     method: "POST",
@@ -34,8 +54,9 @@ export async function embedQuery(text: string): Promise<number[]> {
     },
     body: JSON.stringify({
       input: [text],
-      model: MODEL,
+      model: model.model,
       input_type: "query",
+      ...(model.output_dimension ? { output_dimension: model.output_dimension } : {}),
     }),
   });
 
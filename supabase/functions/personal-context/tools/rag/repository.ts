@@ -69,7 +69,12 @@ export async function searchChunks(
 ): Promise<SearchResult[]> {
   const supabase = getSupabaseClient();
 
-  const { data, error } = await supabase.rpc("search_chunks", {
+  // Opt-in two-stage search: HNSW Hamming pass over rag.chunks.embedding_bits, exact rerank
+  const rpc = Deno.env.get("RAG_QUANTIZED_SEARCH") === "1"
+    ? "search_chunks_quantized"
+    : "search_chunks";
+
+  const { data, error } = await supabase.rpc(rpc, {
     query_embedding: `[${queryEmbedding.join(",")}]`,
     filter_tags: tags,
     match_count: limit,
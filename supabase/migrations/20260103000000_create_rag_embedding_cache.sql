@@ -0,0 +1,32 @@
+-- RAG Embedding Cache
+-- Content-addressed cache of embeddings keyed by (model, SHA256 of embedding text)
+-- so that unchanged chunks are not sent to Voyage AI again
+
+-- =============================================================================
+-- rag.embedding_cache
+-- =============================================================================
+
+CREATE TABLE rag.embedding_cache (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    embedding vector(512) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (model, text_hash)
+);
+
+COMMENT ON TABLE rag.embedding_cache IS 'Embedding cache keyed by model and embedding text hash';
+COMMENT ON COLUMN rag.embedding_cache.model IS 'Embedding model name (e.g. voyage-3-lite)';
+COMMENT ON COLUMN rag.embedding_cache.text_hash IS 'SHA256 of the text passed to the embedding API';
+
+-- =============================================================================
+-- RLS Policies
+-- =============================================================================
+
+ALTER TABLE rag.embedding_cache ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on embedding_cache"
+    ON rag.embedding_cache
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
@@ -0,0 +1,7 @@
+-- Add text_hash to rag.chunks for chunk-level incremental re-embedding
+-- The analyzer compares freshly chunked output with stored rows by this hash
+-- and only re-embeds chunks whose embedding text actually changed
+
+ALTER TABLE rag.chunks ADD COLUMN text_hash TEXT;
+
+COMMENT ON COLUMN rag.chunks.text_hash IS 'SHA256 of the text passed to the embedding API (NULL for rows written before incremental mode)';
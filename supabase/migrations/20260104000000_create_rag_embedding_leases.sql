@@ -0,0 +1,39 @@
+-- RAG Embedding Work Queue Leases
+-- Lets several embedding workers drain the backlog in parallel.
+-- A worker claims documents with FOR NO KEY UPDATE SKIP LOCKED and records a lease.
+-- It extends the lease with heartbeats and deletes it in the transaction that saves the chunks.
+-- A lease that expires (crashed worker) makes the document claimable again.
+
+-- =============================================================================
+-- rag.embedding_leases
+-- =============================================================================
+
+CREATE TABLE rag.embedding_leases (
+    document_id UUID PRIMARY KEY REFERENCES raw.github_contents__documents(id) ON DELETE CASCADE,
+    content_hash TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    leased_until TIMESTAMPTZ NOT NULL,
+    attempts INT NOT NULL DEFAULT 1,
+    claimed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE rag.embedding_leases IS 'Documents currently claimed by an embedding worker';
+COMMENT ON COLUMN rag.embedding_leases.content_hash IS 'Content hash of the document when it was claimed';
+COMMENT ON COLUMN rag.embedding_leases.worker_id IS 'Worker holding the lease (host-pid or EMBED_WORKER_ID)';
+COMMENT ON COLUMN rag.embedding_leases.leased_until IS 'Lease expiry; extended by worker heartbeats';
+COMMENT ON COLUMN rag.embedding_leases.attempts IS 'Number of times the document was claimed for the same content hash';
+
+CREATE INDEX embedding_leases_worker_id_idx ON rag.embedding_leases (worker_id);
+
+-- =============================================================================
+-- RLS Policies
+-- =============================================================================
+
+ALTER TABLE rag.embedding_leases ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on embedding_leases"
+    ON rag.embedding_leases
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
@@ -0,0 +1,33 @@
+-- Notify the embedding watcher when documents change
+-- The analyzer in watch mode LISTENs on rag_documents_changed and embeds the
+-- notified documents within seconds instead of waiting for the scheduled run.
+-- Payload is the document id. Postgres collapses identical notifications
+-- within one transaction, and the watcher debounces bursts across transactions.
+
+-- =============================================================================
+-- raw.notify_document_changed
+-- =============================================================================
+
+CREATE OR REPLACE FUNCTION raw.notify_document_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('rag_documents_changed', NEW.id::text);
+    RETURN NULL;
+END;
+$$;
+
+COMMENT ON FUNCTION raw.notify_document_changed IS 'Sends the changed document id on the rag_documents_changed channel';
+
+CREATE TRIGGER github_contents__documents_notify_insert
+    AFTER INSERT ON raw.github_contents__documents
+    FOR EACH ROW
+    EXECUTE FUNCTION raw.notify_document_changed();
+
+-- The connector upserts every fetched file; only notify when the content actually changed
+CREATE TRIGGER github_contents__documents_notify_update
+    AFTER UPDATE OF content_hash ON raw.github_contents__documents
+    FOR EACH ROW
+    WHEN (OLD.content_hash IS DISTINCT FROM NEW.content_hash)
+    EXECUTE FUNCTION raw.notify_document_changed();
@@ -0,0 +1,125 @@
+-- RAG Embedding Models
+-- Tracks which embedding model rag.chunks.embedding holds, and checkpoints
+-- model migrations. A migration (python -m src.embedding.migrate) re-embeds
+-- the corpus into the shadow columns rag.chunks.embedding_next /
+-- embedding_next_hash. It builds the new ANN index concurrently, then swaps
+-- columns and the active model in one transaction. search_chunks keeps
+-- serving the current column until the swap.
+
+-- =============================================================================
+-- rag.embedding_models
+-- =============================================================================
+
+CREATE TABLE rag.embedding_models (
+    model TEXT PRIMARY KEY,
+    dimensions INT NOT NULL,
+    output_dimension INT,
+    status TEXT NOT NULL CHECK (status IN ('active', 'migrating', 'retired')),
+    last_document_id UUID,
+    chunks_embedded BIGINT NOT NULL DEFAULT 0,
+    tokens_used BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    activated_at TIMESTAMPTZ
+);
+
+COMMENT ON TABLE rag.embedding_models IS 'Embedding model held by rag.chunks.embedding (active) and model migration checkpoints';
+COMMENT ON COLUMN rag.embedding_models.output_dimension IS 'output_dimension passed to the API (NULL = model default)';
+COMMENT ON COLUMN rag.embedding_models.status IS 'active: serves search, migrating: backfilling rag.chunks.embedding_next, retired: replaced';
+COMMENT ON COLUMN rag.embedding_models.last_document_id IS 'Migration checkpoint: documents are backfilled in id order up to this id';
+COMMENT ON COLUMN rag.embedding_models.tokens_used IS 'Estimated tokens sent to the embedding API by the migration';
+
+-- At most one active model and one migration in progress
+CREATE UNIQUE INDEX embedding_models_one_active_idx
+    ON rag.embedding_models (status) WHERE status IN ('active', 'migrating');
+
+INSERT INTO rag.embedding_models (model, dimensions, status, activated_at)
+VALUES ('voyage-3-lite', 512, 'active', NOW());
+
+-- The cache holds vectors of every model, so it cannot be fixed to one dimension
+ALTER TABLE rag.embedding_cache ALTER COLUMN embedding TYPE vector;
+
+-- =============================================================================
+-- RPC Functions
+-- =============================================================================
+
+-- Model that query embeddings must use to search rag.chunks
+CREATE OR REPLACE FUNCTION get_active_embedding_model()
+RETURNS TABLE (model text, dimensions int, output_dimension int)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT m.model, m.dimensions, m.output_dimension
+    FROM rag.embedding_models m
+    WHERE m.status = 'active';
+$$;
+
+COMMENT ON FUNCTION get_active_embedding_model IS 'Returns the embedding model currently held by rag.chunks.embedding';
+
+GRANT EXECUTE ON FUNCTION get_active_embedding_model() TO anon, authenticated;
+
+-- Accept query embeddings of any dimension so search keeps working after a
+-- swap to a model with a different output size (the column type decides)
+DROP FUNCTION IF EXISTS search_chunks(vector(512), text[], int, float);
+
+CREATE OR REPLACE FUNCTION search_chunks(
+    query_embedding vector,
+    filter_tags text[] DEFAULT NULL,
+    match_count int DEFAULT 5,
+    similarity_threshold float DEFAULT 0.7
+)
+RETURNS TABLE (
+    id uuid,
+    title text,
+    heading text,
+    content text,
+    file_path text,
+    similarity float
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        c.id,
+        d.frontmatter->>'title' AS title,
+        c.heading,
+        c.content,
+        d.file_path,
+        1 - (c.embedding <=> query_embedding) AS similarity
+    FROM rag.chunks c
+    JOIN raw.github_contents__documents d ON c.document_id = d.id
+    WHERE
+        (filter_tags IS NULL OR d.frontmatter->'tags' ?| filter_tags)
+        AND 1 - (c.embedding <=> query_embedding) >= similarity_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+COMMENT ON FUNCTION search_chunks IS 'Vector similarity search with optional tag filtering';
+
+GRANT EXECUTE ON FUNCTION search_chunks(vector, text[], int, float) TO anon;
+
+-- =============================================================================
+-- RLS Policies
+-- =============================================================================
+
+ALTER TABLE rag.embedding_models ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on embedding_models"
+    ON rag.embedding_models
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+-- Query-side clients (MCP server, console) read the active model via get_active_embedding_model
+CREATE POLICY "Anon and authenticated can read embedding_models"
+    ON rag.embedding_models
+    FOR SELECT
+    TO anon, authenticated
+    USING (true);
+
+GRANT SELECT ON rag.embedding_models TO anon, authenticated;
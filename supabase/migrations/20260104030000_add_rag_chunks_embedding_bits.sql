@@ -0,0 +1,76 @@
+-- Binary-quantized embeddings for a two-stage vector search
+-- With EMBED_QUANTIZE=1 the analyzer also writes rag.chunks.embedding_bits
+-- (1 bit per dimension, same as binary_quantize(embedding)): 64 bytes per
+-- 512-dimension chunk instead of 2 KB. search_chunks_quantized ranks all
+-- chunks by Hamming distance on these codes, then reranks the top candidates
+-- exactly with the full vectors. Chunks without codes fall back to
+-- binary_quantize(embedding) on the fly, so results never depend on whether
+-- the analyzer option was on when a chunk was written.
+
+-- =============================================================================
+-- rag.chunks.embedding_bits
+-- =============================================================================
+
+-- bit varying so the column survives model migrations to another dimension
+ALTER TABLE rag.chunks ADD COLUMN embedding_bits bit varying;
+
+COMMENT ON COLUMN rag.chunks.embedding_bits IS 'binary_quantize(embedding) written by the analyzer (NULL when EMBED_QUANTIZE is off)';
+
+UPDATE rag.chunks SET embedding_bits = binary_quantize(embedding)
+WHERE embedding IS NOT NULL;
+
+-- =============================================================================
+-- RPC Functions
+-- =============================================================================
+
+-- Hamming-distance candidate pass over embedding_bits, exact cosine rerank
+CREATE OR REPLACE FUNCTION search_chunks_quantized(
+    query_embedding vector,
+    filter_tags text[] DEFAULT NULL,
+    match_count int DEFAULT 5,
+    similarity_threshold float DEFAULT 0.7,
+    candidate_count int DEFAULT 200
+)
+RETURNS TABLE (
+    id uuid,
+    title text,
+    heading text,
+    content text,
+    file_path text,
+    similarity float
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT c.id, c.document_id, c.heading, c.content, c.embedding
+        FROM rag.chunks c
+        JOIN raw.github_contents__documents d ON c.document_id = d.id
+        WHERE
+            c.embedding IS NOT NULL
+            AND (filter_tags IS NULL OR d.frontmatter->'tags' ?| filter_tags)
+        ORDER BY
+            COALESCE(c.embedding_bits, binary_quantize(c.embedding)::bit varying)
+                <~> binary_quantize(query_embedding)
+        LIMIT GREATEST(candidate_count, match_count)
+    )
+    SELECT
+        c.id,
+        d.frontmatter->>'title' AS title,
+        c.heading,
+        c.content,
+        d.file_path,
+        1 - (c.embedding <=> query_embedding) AS similarity
+    FROM candidates c
+    JOIN raw.github_contents__documents d ON c.document_id = d.id
+    WHERE 1 - (c.embedding <=> query_embedding) >= similarity_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+COMMENT ON FUNCTION search_chunks_quantized IS 'Vector search over binary codes with exact rerank of the top candidate_count chunks';
+
+GRANT EXECUTE ON FUNCTION search_chunks_quantized(vector, text[], int, float, int) TO anon;
@@ -0,0 +1,91 @@
+-- Index the binary codes so search_chunks_quantized no longer scans rag.chunks
+-- The candidate pass ordered by COALESCE(embedding_bits, binary_quantize(embedding)),
+-- which no index can serve, so every query computed the Hamming distance of
+-- every chunk. The analyzer now always writes embedding_bits (every chunk is
+-- written with its embedding), so the column is backfilled and made NOT NULL.
+-- An HNSW index is built on a fixed-length bit(n) cast (HNSW needs a typed
+-- dimension; the column stays bit varying so a model migration can change
+-- it). search_chunks_quantized orders by exactly the indexed expression, with
+-- n taken from the active embedding model.
+
+-- =============================================================================
+-- rag.chunks.embedding_bits
+-- =============================================================================
+
+UPDATE rag.chunks SET embedding_bits = binary_quantize(embedding)
+WHERE embedding_bits IS NULL;
+
+ALTER TABLE rag.chunks ALTER COLUMN embedding_bits SET NOT NULL;
+
+COMMENT ON COLUMN rag.chunks.embedding_bits IS 'binary_quantize(embedding) written by the analyzer (candidate pass of search_chunks_quantized)';
+
+-- The cast length must match rag.embedding_models.dimensions of the active
+-- model; the analyzer builds the index for the next model before a swap
+CREATE INDEX chunks_embedding_bits_idx ON rag.chunks
+    USING hnsw ((embedding_bits::bit(512)) bit_hamming_ops);
+
+-- =============================================================================
+-- RPC Functions
+-- =============================================================================
+
+-- Hamming-distance candidate pass over the HNSW index, exact cosine rerank
+CREATE OR REPLACE FUNCTION search_chunks_quantized(
+    query_embedding vector,
+    filter_tags text[] DEFAULT NULL,
+    match_count int DEFAULT 5,
+    similarity_threshold float DEFAULT 0.7,
+    candidate_count int DEFAULT 200
+)
+RETURNS TABLE (
+    id uuid,
+    title text,
+    heading text,
+    content text,
+    file_path text,
+    similarity float
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    dims int;
+BEGIN
+    SELECT m.dimensions INTO dims FROM rag.embedding_models m WHERE m.status = 'active';
+
+    -- An HNSW scan returns at most ef_search rows (default 40)
+    PERFORM set_config(
+        'hnsw.ef_search', GREATEST(candidate_count, match_count, 40)::text, true
+    );
+
+    -- The bit(n) length is spliced in as a literal so the ORDER BY matches the
+    -- index expression. Tags are filtered after the index scan, so a
+    -- selective filter can leave fewer than candidate_count candidates.
+    RETURN QUERY EXECUTE format($query$
+        WITH candidates AS (
+            SELECT c.id, c.document_id, c.heading, c.content, c.embedding
+            FROM rag.chunks c
+            JOIN raw.github_contents__documents d ON c.document_id = d.id
+            WHERE $2 IS NULL OR d.frontmatter->'tags' ?| $2
+            ORDER BY c.embedding_bits::bit(%1$s) <~> binary_quantize($1)::bit(%1$s)
+            LIMIT GREATEST($5, $3)
+        )
+        SELECT
+            c.id,
+            d.frontmatter->>'title' AS title,
+            c.heading,
+            c.content,
+            d.file_path,
+            1 - (c.embedding <=> $1) AS similarity
+        FROM candidates c
+        JOIN raw.github_contents__documents d ON c.document_id = d.id
+        WHERE 1 - (c.embedding <=> $1) >= $4
+        ORDER BY c.embedding <=> $1
+        LIMIT $3
+    $query$, dims)
+    USING query_embedding, filter_tags, match_count, similarity_threshold, candidate_count;
+END;
+$$;
+
+COMMENT ON FUNCTION search_chunks_quantized IS 'Vector search over the HNSW index of binary codes with exact rerank of the top candidate_count chunks';
+
+GRANT EXECUTE ON FUNCTION search_chunks_quantized(vector, text[], int, float, int) TO anon;
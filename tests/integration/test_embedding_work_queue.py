@@ -0,0 +1,222 @@
+"""Integration tests for the embedding work queue (lease claiming with SKIP LOCKED).
+
+Each test runs against a throwaway database created on the server behind
+DIRECT_DATABASE_URL. The database holds only the tables the queue touches,
+so a plain local Postgres works; no Supabase or pgvector is needed.
+"""
+
+import multiprocessing
+import time
+import uuid
+from typing import Generator
+
+import pytest
+
+WORKERS = 4
+DOCUMENTS = 200
+
+SCHEMA = """
+CREATE SCHEMA raw;
+CREATE SCHEMA rag;
+
+CREATE TABLE raw.github_contents__documents (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    file_path TEXT NOT NULL UNIQUE,
+    frontmatter JSONB NOT NULL DEFAULT '{}',
+    content TEXT NOT NULL,
+    content_hash TEXT NOT NULL
+);
+
+CREATE TABLE rag.chunks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    document_id UUID NOT NULL REFERENCES raw.github_contents__documents(id) ON DELETE CASCADE,
+    chunk_index INT NOT NULL
+);
+
+CREATE TABLE rag.embedding_state (
+    document_id UUID PRIMARY KEY REFERENCES raw.github_contents__documents(id) ON DELETE CASCADE,
+    content_hash TEXT NOT NULL,
+    embedded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE rag.embedding_leases (
+    document_id UUID PRIMARY KEY REFERENCES raw.github_contents__documents(id) ON DELETE CASCADE,
+    content_hash TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    leased_until TIMESTAMPTZ NOT NULL,
+    attempts INT NOT NULL DEFAULT 1,
+    claimed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE FUNCTION get_superseded_document_ids()
+RETURNS TABLE (id uuid)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT DISTINCT d2.id
+    FROM raw.github_contents__documents d1
+    CROSS JOIN LATERAL jsonb_array_elements_text(d1.frontmatter->'previous') AS prev_file
+    JOIN raw.github_contents__documents d2 ON d2.file_path ~ (prev_file || '\\.md$')
+    WHERE d1.frontmatter ? 'previous';
+$$;
+"""
+
+
+def _drain(
+    database_url: str,
+    worker_id: str,
+    results: "multiprocessing.Queue[tuple[str, list[str]]]",
+) -> None:
+    """1ワーカー分: リースが取れなくなるまでclaim → 保存を繰り返す"""
+    from embedding.db import DocsRepository, get_pool
+    from embedding.types import DocumentWrite
+
+    db = DocsRepository(database_url, get_pool(database_url, 2))
+    processed: list[str] = []
+    while docs := db.claim_documents(worker_id, 7, 30):
+        time.sleep(0.01)  # embedding中に他のワーカーがclaimする隙間を作る
+        db.save_documents(
+            [DocumentWrite(d.id, d.content_hash) for d in docs], lease_owner=worker_id
+        )
+        processed.extend(d.id for d in docs)
+    results.put((worker_id, processed))
+
+
+@pytest.fixture
+def queue_database(db_connection_string: str) -> Generator[str, None, None]:
+    """キュー用のテーブルだけを持つ使い捨てデータベース"""
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+
+    try:
+        admin = psycopg2.connect(db_connection_string)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres not available: {e}")
+    admin.autocommit = True
+    name = f"embedding_queue_{uuid.uuid4().hex[:12]}"
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE DATABASE {name}")
+
+    database_url = make_dsn(db_connection_string, dbname=name)
+    try:
+        conn = psycopg2.connect(database_url)
+        with conn, conn.cursor() as cur:
+            cur.execute(SCHEMA)
+        conn.close()
+        yield database_url
+    finally:
+        from embedding.db import get_pool
+
+        get_pool(database_url).close()
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+        admin.close()
+
+
+def _insert_documents(database_url: str, count: int) -> list[str]:
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO raw.github_contents__documents (file_path, content, content_hash)
+            SELECT 'doc-' || i || '.md', 'content ' || i, md5(i::text)
+            FROM generate_series(1, %s) AS i
+            RETURNING id
+            """,
+            (count,)
+        )
+        ids = [str(row[0]) for row in cur.fetchall()]
+    conn.close()
+    return ids
+
+
+def _scalar(database_url: str, sql: str) -> int:
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    with conn, conn.cursor() as cur:
+        cur.execute(sql)
+        value = cur.fetchone()[0]
+    conn.close()
+    return value
+
+
+@pytest.mark.integration
+class TestEmbeddingWorkQueue:
+    """Test that concurrent embedding workers split the backlog without overlap."""
+
+    def test_workers_drain_backlog_exactly_once(self, queue_database: str) -> None:
+        """Test that every document is processed by exactly one of several worker processes."""
+        ids = _insert_documents(queue_database, DOCUMENTS)
+
+        ctx = multiprocessing.get_context("spawn")
+        results: multiprocessing.Queue[tuple[str, list[str]]] = ctx.Queue()
+        workers = [
+            ctx.Process(target=_drain, args=(queue_database, f"worker-{i}", results))
+            for i in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        processed = dict(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join(timeout=10)
+            assert worker.exitcode == 0
+
+        all_processed = [doc_id for doc_ids in processed.values() for doc_id in doc_ids]
+        assert sorted(all_processed) == sorted(ids), "documents processed twice or missed"
+        assert sum(1 for doc_ids in processed.values() if doc_ids) > 1, "work was not shared"
+        assert _scalar(queue_database, "SELECT COUNT(*) FROM rag.embedding_state") == DOCUMENTS
+        assert _scalar(queue_database, "SELECT COUNT(*) FROM rag.embedding_leases") == 0
+
+    def test_expired_lease_is_reclaimed_and_fenced(self, queue_database: str) -> None:
+        """Test that an expired lease moves to another worker and the old owner cannot save."""
+        from embedding.db import DocsRepository, LeaseLostError, get_pool
+        from embedding.types import DocumentWrite
+
+        _insert_documents(queue_database, 3)
+        db = DocsRepository(queue_database, get_pool(queue_database, 2))
+
+        crashed = db.claim_documents("crashed", 10, 0.5)
+        assert len(crashed) == 3
+        assert db.claim_documents("other", 10, 30) == []
+
+        time.sleep(1.0)
+        reclaimed = db.claim_documents("other", 10, 30)
+        assert sorted(d.id for d in reclaimed) == sorted(d.id for d in crashed)
+        assert _scalar(queue_database, "SELECT MIN(attempts) FROM rag.embedding_leases") == 2
+        assert db.extend_leases("crashed", [d.id for d in crashed], 30) == set()
+
+        with pytest.raises(LeaseLostError):
+            db.save_documents(
+                [DocumentWrite(crashed[0].id, crashed[0].content_hash)], lease_owner="crashed"
+            )
+        db.save_documents(
+            [DocumentWrite(d.id, d.content_hash) for d in reclaimed], lease_owner="other"
+        )
+        assert _scalar(queue_database, "SELECT COUNT(*) FROM rag.embedding_leases") == 0
+        assert db.claim_documents("other", 10, 30) == []
+
+    def test_superseded_documents_are_not_claimed(self, queue_database: str) -> None:
+        """Test that documents replaced by a newer version never enter the queue."""
+        import psycopg2
+
+        from embedding.db import DocsRepository, get_pool
+
+        conn = psycopg2.connect(queue_database)
+        with conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO raw.github_contents__documents
+                    (file_path, frontmatter, content, content_hash)
+                VALUES
+                    ('notes/old.md', '{}', 'old', 'h1'),
+                    ('notes/new.md', '{"previous": ["notes/old"]}', 'new', 'h2')
+                """
+            )
+        conn.close()
+
+        db = DocsRepository(queue_database, get_pool(queue_database, 2))
+        claimed = db.claim_documents("worker", 10, 30)
+        assert [d.file_path for d in claimed] == ["notes/new.md"]